@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""Benchmark the raw-bytes key prefilter of sample_by_vendor.py against a full `json.loads` per line.
+
+Measures the per-line cost of reading `id`/`vendor`/`__parentId` with `peek_keys` vs decoding the
+whole row, split by row class (child rows, flat product rows, product rows with nested objects that
+fall back to `json.loads`), and the time of a full scan of the file both ways.
+
+Before timing, checks that `peek_keys` agrees with `json.loads` on the sampled lines and rejects every
+truncated prefix of them (the last line of an interrupted download) instead of misreading it.
+
+Uses the given bulk JSONL, or a synthetic Shopify-shaped one (products followed by their variants).
+
+Example:
+  python3 Research Produse/Scripts/bench_bulk_prefilter.py --products 50000 --variants 4
+  python3 Research Produse/Scripts/bench_bulk_prefilter.py Research Produse/bulk-products.jsonl
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from sample_by_vendor import iter_jsonl, iter_jsonl_keys, peek_keys
+
+
+def write_synthetic(path: str, products: int, variants: int, nested_every: int, seed: int) -> None:
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        for p in range(1, products + 1):
+            pid = f"gid://shopify/Product/{p}"
+            product = {
+                "id": pid,
+                "title": f"Produs {p}",
+                "handle": f"produs-{p}",
+                "vendor": f"Vendor {rng.randrange(500):03d}",
+                "productType": "Accesorii",
+                "status": "ACTIVE",
+                "tags": ["nou", "stoc", f"t{p % 17}"],
+                "createdAt": "2025-01-01T00:00:00Z",
+                "updatedAt": "2025-06-01T00:00:00Z",
+                "descriptionHtml": "<p>" + "Descriere <b>produs</b>. " * rng.randrange(30, 300) + "</p>",
+            }
+            if nested_every and p % nested_every == 0:
+                product["seo"] = {"title": product["title"], "description": None}
+            f.write(json.dumps(product, ensure_ascii=False) + "\n")
+            for v in range(variants):
+                f.write(json.dumps({
+                    "id": f"gid://shopify/ProductVariant/{p * 100 + v}",
+                    "sku": f"SKU-{p}-{v}",
+                    "price": f"{rng.randrange(100, 99999) / 100:.2f}",
+                    "inventoryQuantity": rng.randrange(100),
+                    "selectedOptions": [{"name": "Mărime", "value": str(v)}],
+                    "__parentId": pid,
+                }, ensure_ascii=False) + "\n")
+
+
+def classify(line: bytes) -> str:
+    if b'"__parentId"' in line:
+        return "child"
+    return "product" if line.count(b"{") == 1 else "product (nested)"
+
+
+def check_prefilter(lines: List[bytes], max_lines: int = 200) -> List[str]:
+    """Mismatches between `peek_keys` and `json.loads`, on whole lines and on their truncated prefixes."""
+    problems: List[str] = []
+    for line in lines[:max_lines]:
+        row = json.loads(line.decode("utf-8", errors="replace"))
+        # Child rows are only read for their parent; other rows for `id` and `vendor`.
+        wanted = ("__parentId",) if "__parentId" in row else ("id", "vendor")
+        expected = {k: row.get(k) for k in wanted}
+        keys, _ = peek_keys(line)
+        if {k: (keys or {}).get(k) for k in wanted} != expected:
+            problems.append(f"{line[:80]!r}: {keys} != {expected}")
+        # Every cut inside the first 200 bytes (where the keys usually are), then a few further in.
+        cuts = list(range(1, min(len(line), 200))) + list(range(200, len(line), 997))
+        for cut in cuts:
+            try:
+                keys, _ = peek_keys(line[:cut])
+            except ValueError:
+                continue
+            except Exception as e:
+                problems.append(f"truncated {line[:cut][-60:]!r}: {type(e).__name__}: {e}")
+                continue
+            problems.append(f"truncated {line[:cut][-60:]!r}: read as {keys}")
+    return problems
+
+
+def per_line(lines: List[bytes], fn: Callable[[bytes], object], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for line in lines:
+            fn(line)
+        best = min(best, time.perf_counter() - start)
+    return best / max(1, len(lines)) * 1e9
+
+
+def scan_seconds(fn: Callable[[], None], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Benchmark peek_keys (raw-bytes prefilter) vs json.loads per bulk JSONL line.")
+    ap.add_argument("jsonl", nargs="?", default="", help="Bulk JSONL to measure (default: a synthetic file)")
+    ap.add_argument("--products", type=int, default=20000, help="Synthetic: products (default: 20000)")
+    ap.add_argument("--variants", type=int, default=3, help="Synthetic: variants per product (default: 3)")
+    ap.add_argument("--nested-every", type=int, default=10, help="Synthetic: every Nth product has a nested `seo` object (default: 10)")
+    ap.add_argument("--sample-lines", type=int, default=50000, help="Lines per class used for the per-line timing (default: 50000)")
+    ap.add_argument("--repeat", type=int, default=3, help="Best of N runs (default: 3)")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench-prefilter-") as tmp:
+        path = args.jsonl
+        if not path:
+            path = os.path.join(tmp, "bulk.jsonl")
+            write_synthetic(path, args.products, args.variants, args.nested_every, seed=1)
+
+        by_class: Dict[str, List[bytes]] = {}
+        with open(path, "rb") as f:
+            for raw in f:
+                line = raw.strip()
+                if line:
+                    bucket = by_class.setdefault(classify(line), [])
+                    if len(bucket) < args.sample_lines:
+                        bucket.append(line)
+
+        print(f"File: {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+        problems = [p for lines in by_class.values() for p in check_prefilter(lines)]
+        if problems:
+            print("\n".join(["peek_keys check FAILED:"] + problems[:20]))
+            return 1
+        print("peek_keys check: whole and truncated lines OK")
+        print(f"{'rows':>18} {'lines':>8} {'json.loads ns':>14} {'peek_keys ns':>13} {'speedup':>8}")
+        for name in ("child", "product", "product (nested)"):
+            lines = by_class.get(name) or []
+            if not lines:
+                continue
+            full = per_line(lines, lambda line: json.loads(line.decode("utf-8", errors="replace")), args.repeat)
+            peek = per_line(lines, peek_keys, args.repeat)
+            print(f"{name:>18} {len(lines):>8} {full:>14.0f} {peek:>13.0f} {full / peek:>7.1f}x")
+
+        def full_scan() -> None:
+            for _ in iter_jsonl(path):
+                pass
+
+        def key_scan() -> None:
+            for _ in iter_jsonl_keys(path):
+                pass
+
+        full = scan_seconds(full_scan, args.repeat)
+        keys = scan_seconds(key_scan, args.repeat)
+        print(f"Full scan: iter_jsonl {full:.2f}s, iter_jsonl_keys {keys:.2f}s ({full / keys:.1f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        raise SystemExit(main())
+    except BrokenPipeError:
+        raise SystemExit(0)
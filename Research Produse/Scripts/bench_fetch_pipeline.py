@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""Benchmark the fetch pipeline end to end against shopify_mock_server.py.
+
+For every catalog size it starts a mock Admin GraphQL server, writes a synthetic vendor sample report
+(3 sampled products per vendor, the shape sample_by_vendor.py produces) and runs
+fetch_shopify_products.py in a fresh worker process with `--endpoint` pointed at the mock. Reported per run:
+
+- wall time, products/s and requests/s
+- p50/p99 latency of `GraphQLClient.post` (includes throttle waits and retries)
+- bytes sent/received (from the mock's `/__stats`) and the size of the details file
+- peak RSS of the worker process
+
+Example:
+  python3 Research Produse/Scripts/bench_fetch_pipeline.py --sizes 100,10000 --concurrency 8 --batch-size 0
+  python3 Research Produse/Scripts/bench_fetch_pipeline.py --sizes 100 --fetch-args="--everything" --latency-ms 30
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import re
+import resource
+import shlex
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from typing import Any, Dict, List, Tuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def write_sample_report(path: str, products: int) -> int:
+    """One vendor per 3 consecutive products, all sampled; returns the vendor count."""
+    vendors = []
+    for v in range(math.ceil(products / 3)):
+        ids = range(v * 3 + 1, min(products, v * 3 + 3) + 1)
+        vendors.append({
+            "vendor": f"Vendor {v + 1:05d}",
+            "productCountInFile": len(ids),
+            "sampled": [{"productId": f"gid://shopify/Product/{n}", "productLine": n - 1} for n in ids],
+        })
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"vendorCount": len(vendors), "vendors": vendors}, f)
+    return len(vendors)
+
+
+def start_mock(products: int, args: argparse.Namespace) -> Tuple[subprocess.Popen, str]:
+    cmd = [
+        sys.executable, os.path.join(HERE, "shopify_mock_server.py"),
+        "--port", "0",
+        "--products", str(products),
+        "--variants", str(args.variants),
+        "--metafields", str(args.metafields),
+        "--latency-ms", str(args.latency_ms),
+        "--jitter-ms", str(args.jitter_ms),
+        "--bucket-size", str(args.bucket_size),
+        "--restore-rate", str(args.restore_rate),
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    line = proc.stdout.readline() if proc.stdout else ""
+    m = re.search(r"(http://\S+/graphql\.json)", line)
+    if not m:
+        proc.kill()
+        raise RuntimeError(f"mock server did not start: {line!r}")
+    return proc, m.group(1)
+
+
+def mock_stats(endpoint: str) -> Dict[str, Any]:
+    base = endpoint.split("/admin/", 1)[0]
+    with urllib.request.urlopen(f"{base}/__stats", timeout=10) as resp:
+        return json.loads(resp.read())
+
+
+def run_worker(config: Dict[str, Any]) -> Dict[str, Any]:
+    """Runs inside the worker process: time every GraphQL call while fetch main() runs."""
+    import fetch_shopify_products as fsp
+
+    latencies: List[float] = []
+    lock = threading.Lock()
+    original_post = fsp.GraphQLClient.post
+
+    def timed_post(self: Any, *a: Any, **kw: Any) -> Dict[str, Any]:
+        start = time.perf_counter()
+        try:
+            return original_post(self, *a, **kw)
+        finally:
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+
+    fsp.GraphQLClient.post = timed_post
+    sys.argv = ["fetch_shopify_products.py"] + config["argv"]
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        code = fsp.main()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "exitCode": code,
+        "seconds": elapsed,
+        "requests": len(latencies),
+        "p50Ms": percentile(latencies, 50) * 1000,
+        "p99Ms": percentile(latencies, 99) * 1000,
+        # ru_maxrss is KiB on Linux, bytes on macOS.
+        "peakRssMb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024.0 * 1024.0 if sys.platform == "darwin" else 1024.0),
+    }
+
+
+def bench_size(products: int, args: argparse.Namespace, tmp: str) -> Dict[str, Any]:
+    report = os.path.join(tmp, f"report-{products}.json")
+    vendors = write_sample_report(report, products)
+    env = os.path.join(tmp, ".env")
+    with open(env, "w", encoding="utf-8") as f:
+        f.write("SHOPIFY_SHOP_DOMAIN=mock.myshopify.com\nSHOPIFY_ADMIN_API_TOKEN=bench-token\n")
+    details = os.path.join(tmp, f"details-{products}.jsonl.gz" if args.gzip else f"details-{products}.jsonl")
+
+    proc, endpoint = start_mock(products, args)
+    try:
+        argv = [
+            "--env", env,
+            "--report", report,
+            "--endpoint", endpoint,
+            "--vendor-count", str(vendors),
+            "--vendor-pick-mode", "report-order",
+            "--no-introspection-cache",
+            "--out-schema", os.path.join(tmp, "schema.json"),
+            "--out-details", details,
+            "--out-format", "jsonl",
+            "--concurrency", str(args.concurrency),
+            "--batch-size", str(args.batch_size),
+        ]
+        if args.gzip:
+            argv.append("--out-gzip")
+        argv += shlex.split(args.fetch_args)
+        worker = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", json.dumps({"argv": argv})],
+            cwd=HERE,
+            stdout=subprocess.PIPE,
+            text=True,
+            check=True,
+        )
+        result = json.loads(worker.stdout.strip().splitlines()[-1])
+        stats = mock_stats(endpoint)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    seconds = result["seconds"] or 1e-9
+    result.update(
+        products=products,
+        productsPerSec=products / seconds,
+        requestsPerSec=result["requests"] / seconds,
+        bytesIn=stats["bytesOut"],
+        bytesOut=stats["bytesIn"],
+        throttled=stats["throttled"],
+        detailsBytes=os.path.getsize(details),
+    )
+    os.remove(details)
+    return result
+
+
+def main() -> int:
+    if len(sys.argv) == 3 and sys.argv[1] == "--worker":
+        print(json.dumps(run_worker(json.loads(sys.argv[2]))))
+        return 0
+
+    ap = argparse.ArgumentParser(description="Benchmark fetch_shopify_products.py against the local mock Admin GraphQL server.")
+    ap.add_argument("--sizes", default="100,10000,100000", help="Comma-separated catalog sizes (default: 100,10000,100000)")
+    ap.add_argument("--concurrency", type=int, default=8, help="fetch --concurrency (default: 8)")
+    ap.add_argument("--batch-size", type=int, default=0, help="fetch --batch-size (default: 0 = auto)")
+    ap.add_argument("--fetch-args", default="", help="Extra fetch_shopify_products.py arguments; pass as --fetch-args=\"--bulk\"")
+    ap.add_argument("--gzip", action="store_true", help="Write the details as .jsonl.gz")
+    ap.add_argument("--variants", type=int, default=3, help="Mock: variants per product (default: 3)")
+    ap.add_argument("--metafields", type=int, default=5, help="Mock: metafields per product (default: 5)")
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="Mock: latency per request (default: 0)")
+    ap.add_argument("--jitter-ms", type=float, default=0.0, help="Mock: random extra latency (default: 0)")
+    ap.add_argument("--bucket-size", type=float, default=1e9, help="Mock: throttle bucket size (default: effectively unlimited)")
+    ap.add_argument("--restore-rate", type=float, default=1e9, help="Mock: restore rate, points/s (Shopify standard: 100)")
+    ap.add_argument("--json-out", default="", help="Also write the results as JSON")
+    args = ap.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    results: List[Dict[str, Any]] = []
+    with tempfile.TemporaryDirectory(prefix="bench-fetch-") as tmp:
+        for products in sizes:
+            print(f"Running {products} products ...", file=sys.stderr, flush=True)
+            results.append(bench_size(products, args, tmp))
+
+    header = f"{'products':>9} {'seconds':>9} {'prod/s':>9} {'req':>8} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'MB in':>8} {'MB out':>8} {'thr':>5} {'RSS MB':>8}"
+    print(header)
+    for r in results:
+        print(
+            f"{r['products']:>9} {r['seconds']:>9.2f} {r['productsPerSec']:>9.1f} {r['requests']:>8} {r['requestsPerSec']:>8.1f} "
+            f"{r['p50Ms']:>8.2f} {r['p99Ms']:>8.2f} {r['bytesIn'] / 1e6:>8.2f} {r['bytesOut'] / 1e6:>8.2f} {r['throttled']:>5} {r['peakRssMb']:>8.1f}"
+        )
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+    return 0 if all(r["exitCode"] == 0 for r in results) else 1
+
+
+if __name__ == "__main__":
+    try:
+        raise SystemExit(main())
+    except BrokenPipeError:
+        raise SystemExit(0)
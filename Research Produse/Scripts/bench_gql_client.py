@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""Benchmark the pooled GraphQL client against the old per-call `urlopen` path.
+
+Starts a local HTTP(S) stand-in for the Admin GraphQL endpoint (keep-alive, gzip-capable, returns a
+Shopify-shaped product payload) and measures requests/sec for:
+
+- `urlopen`: one `urllib.request.urlopen` per call (new TCP/TLS connection each time, plain body,
+  decode + json.loads) – what `gql_post` used to do.
+- `pooled`: `GraphQLClient` from fetch_shopify_products.py (persistent connections, gzip, bytes body).
+
+Example:
+  python3 Research Produse/Scripts/bench_gql_client.py --requests 2000 --concurrency 4 --tls
+"""
+
+import argparse
+import gzip
+import json
+import os
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fetch_shopify_products import PRODUCT_DETAILS_QUERY, GraphQLClient, ThrottleBucket
+
+
+def _canned_response(variants: int) -> bytes:
+    product = {
+        "id": "gid://shopify/Product/1",
+        "title": "Stand-in product",
+        "descriptionHtml": "<p>" + ("Lorem ipsum dolor sit amet. " * 40) + "</p>",
+        "variants": {
+            "nodes": [
+                {"id": f"gid://shopify/ProductVariant/{i}", "sku": f"SKU-{i}", "price": "10.00", "title": f"Variant {i}"}
+                for i in range(variants)
+            ],
+            "pageInfo": {"hasNextPage": False, "endCursor": None},
+        },
+    }
+    return json.dumps(
+        {
+            "data": {"product": product},
+            "extensions": {
+                "cost": {
+                    "requestedQueryCost": 1,
+                    "actualQueryCost": 1,
+                    "throttleStatus": {"maximumAvailable": 1e9, "currentlyAvailable": 1e9, "restoreRate": 1e9},
+                }
+            },
+        }
+    ).encode("utf-8")
+
+
+def start_stand_in_server(variants: int, tls: Optional[Tuple[str, str]]) -> Tuple[ThreadingHTTPServer, str]:
+    plain = _canned_response(variants)
+    compressed = gzip.compress(plain)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body are separate writes; without this Nagle + delayed ACK adds ~40ms per
+        # keep-alive response and the stand-in would benchmark itself instead of the client.
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args: Any) -> None:
+            return
+
+        def do_POST(self) -> None:
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            use_gzip = "gzip" in (self.headers.get("Accept-Encoding") or "")
+            body = compressed if use_gzip else plain
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            if use_gzip:
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    scheme = "http"
+    if tls:
+        ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ctx.load_cert_chain(tls[0], tls[1])
+        server.socket = ctx.wrap_socket(server.socket, server_side=True)
+        scheme = "https"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"{scheme}://127.0.0.1:{server.server_address[1]}/admin/api/2025-10/graphql.json"
+
+
+def make_self_signed_cert(directory: str) -> Tuple[str, str]:
+    cert = os.path.join(directory, "cert.pem")
+    key = os.path.join(directory, "key.pem")
+    subprocess.run(
+        [
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+            "-subj", "/CN=127.0.0.1", "-keyout", key, "-out", cert,
+        ],
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return cert, key
+
+
+def urlopen_post(endpoint: str, token: str, query: str, variables: Dict[str, Any], ctx: Optional[ssl.SSLContext]) -> Dict[str, Any]:
+    """The pre-pool implementation of gql_post (one connection per call)."""
+    data = json.dumps({"query": query, "variables": variables}).encode("utf-8")
+    req = urllib.request.Request(
+        endpoint,
+        data=data,
+        headers={"Content-Type": "application/json", "X-Shopify-Access-Token": token},
+        method="POST",
+    )
+    with urllib.request.urlopen(req, timeout=60, context=ctx) as resp:
+        body = resp.read().decode("utf-8", errors="replace")
+        return json.loads(body)
+
+
+def run(label: str, call: Callable[[int], Dict[str, Any]], requests: int, concurrency: int) -> float:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as ex:
+        for resp in ex.map(call, range(requests)):
+            if not (resp.get("data") or {}).get("product"):
+                raise RuntimeError(f"{label}: unexpected response {resp!r:.200}")
+    elapsed = time.perf_counter() - start
+    rps = requests / elapsed
+    print(f"{label:>8}: {requests} requests in {elapsed:.2f}s -> {rps:,.0f} req/s")
+    return rps
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Benchmark pooled keep-alive GraphQLClient vs per-call urlopen on a local stand-in server.")
+    ap.add_argument("--requests", type=int, default=1000, help="Requests per client (default: 1000)")
+    ap.add_argument("--concurrency", type=int, default=1, help="Client threads (default: 1)")
+    ap.add_argument("--variants", type=int, default=100, help="Variants in the canned product payload (default: 100)")
+    ap.add_argument("--tls", action="store_true", help="Serve HTTPS with a throwaway self-signed cert (needs openssl)")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tls = make_self_signed_cert(tmp) if args.tls else None
+        server, endpoint = start_stand_in_server(args.variants, tls)
+
+        client_ctx: Optional[ssl.SSLContext] = None
+        if tls:
+            client_ctx = ssl.create_default_context(cafile=tls[0])
+            client_ctx.check_hostname = False
+
+        client = GraphQLClient(
+            endpoint,
+            "bench-token",
+            max_connections=args.concurrency,
+            throttle=ThrottleBucket(maximum_available=1e9, restore_rate=1e9),
+            ssl_context=client_ctx,
+        )
+        variables = {"id": "gid://shopify/Product/1"}
+
+        print(f"Stand-in endpoint: {endpoint} (payload variants={args.variants}, concurrency={args.concurrency})")
+        before = run(
+            "urlopen",
+            lambda _i: urlopen_post(endpoint, "bench-token", PRODUCT_DETAILS_QUERY, variables, client_ctx),
+            args.requests,
+            args.concurrency,
+        )
+        after = run(
+            "pooled",
+            lambda _i: client.post(PRODUCT_DETAILS_QUERY, variables=variables),
+            args.requests,
+            args.concurrency,
+        )
+        print(f"Speedup: {after / before:.2f}x")
+
+        client.close()
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        raise SystemExit(main())
+    except BrokenPipeError:
+        raise SystemExit(0)
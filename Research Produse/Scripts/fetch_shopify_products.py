@@ -1,12 +1,37 @@
 #!/usr/bin/env python3
 import argparse
+import contextlib
+import functools
+import gzip
+import hashlib
+import http.client
+import io
+import itertools
 import json
+import math
 import os
+import queue
 import random
+import re
+import sqlite3
+import ssl
 import sys
+import textwrap
+import threading
 import time
+import urllib.error
+import urllib.parse
 import urllib.request
-from typing import Any, Dict, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sample_by_vendor import decompressed
+
+try:
+  import fcntl
+except ImportError:  # Windows: --shared-throttle is unavailable
+  fcntl = None  # type: ignore[assignment]
 
 
 INTROSPECT_TYPE_QUERY = r'''
@@ -114,6 +139,769 @@ def _pick_object_scalar_fields(type_info: Dict[str, Any], max_fields: int = 40)
   return picked
 
 
+DEFAULT_CACHE_DIR = os.path.join(
+  os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+  "neanelu-shopify-research",
+)
+
+
+class IntrospectionCache:
+  """Persistent introspection cache: one JSON document per (shop, API version).
+
+  Entries live in named sections (`types`, `productFields`, `queries`) and carry their own
+  `savedAt`, so stale entries expire individually after `ttl_seconds`. The schema only changes with
+  the API version (and installed apps), so a day-long TTL plus `invalidate()` is enough.
+  """
+
+  def __init__(self, root: str, shop: str, api_version: str, ttl_seconds: float = 24 * 3600):
+    safe_shop = "".join(ch if ch.isalnum() or ch in ".-_" else "_" for ch in shop)
+    self.path = os.path.join(root, safe_shop, f"{api_version}.json")
+    self.ttl_seconds = float(ttl_seconds)
+    self.hits = 0
+    self.misses = 0
+    self._dirty = False
+    self._doc: Dict[str, Dict[str, Any]] = {}
+    try:
+      with open(self.path, "r", encoding="utf-8") as f:
+        loaded = json.load(f)
+      if isinstance(loaded, dict):
+        self._doc = loaded
+    except (OSError, ValueError):
+      self._doc = {}
+
+  def get(self, section: str, key: str) -> Optional[Any]:
+    entry = (self._doc.get(section) or {}).get(key)
+    if not isinstance(entry, dict) or time.time() - float(entry.get("savedAt") or 0) > self.ttl_seconds:
+      self.misses += 1
+      return None
+    self.hits += 1
+    return entry.get("value")
+
+  def put(self, section: str, key: str, value: Any) -> None:
+    self._doc.setdefault(section, {})[key] = {"savedAt": time.time(), "value": value}
+    self._dirty = True
+
+  def invalidate(self) -> None:
+    self._doc = {}
+    self._dirty = False
+    try:
+      os.remove(self.path)
+    except FileNotFoundError:
+      pass
+
+  def flush(self) -> None:
+    if not self._dirty:
+      return
+    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+    tmp = f"{self.path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+      json.dump(self._doc, f, ensure_ascii=False)
+    # Atomic replace: concurrent runs against the same shop never see a half-written file.
+    os.replace(tmp, self.path)
+    self._dirty = False
+
+
+class ResponseCache:
+  """Content-addressed cache of GraphQL responses, shared by every run on the host.
+
+  The key is a SHA-256 of (endpoint, i.e. shop + API version; query; canonical variables), so the same
+  product fetched by runs with other seeds or vendor picks is a hit. Each response is one gzip file
+  (`<root>/<key[:2]>/<key>.json.gz`) whose first line records when it was saved; entries expire after
+  `ttl_seconds`, and once the directory exceeds `max_bytes` the least recently used files (by mtime,
+  refreshed on every hit) are evicted, both when the cache is opened (a lowered limit, or a run that only
+  hits) and when a store grows it past the limit. Only error-free responses to cacheable queries are stored.
+  """
+
+  # Answers that change while a run is in progress (bulk status polls, the --store change listing).
+  UNCACHEABLE_OPERATIONS = frozenset({"BulkOperationStatus", "ProductUpdates"})
+
+  def __init__(self, root: str, ttl_seconds: float = 24 * 3600, max_bytes: int = 1 << 30):
+    self.root = root
+    self.ttl_seconds = float(ttl_seconds)
+    self.max_bytes = int(max_bytes)
+    self.hits = 0
+    self.misses = 0
+    self.stored = 0
+    self.evicted = 0
+    self._lock = threading.Lock()
+    self._cacheable: Dict[str, bool] = {}
+    # key -> [size, last use]; built once from the directory, then kept current by this process.
+    self._index: Dict[str, List[float]] = {}
+    self._bytes = 0
+    for dirpath, _, filenames in os.walk(root):
+      for name in filenames:
+        if not name.endswith(".json.gz"):
+          continue
+        try:
+          st = os.stat(os.path.join(dirpath, name))
+        except OSError:
+          continue
+        self._index[name[: -len(".json.gz")]] = [st.st_size, st.st_mtime]
+        self._bytes += st.st_size
+    if self._bytes > self.max_bytes:
+      self._evict()
+
+  def cacheable(self, query: str) -> bool:
+    ok = self._cacheable.get(query)
+    if ok is None:
+      m = re.match(r"^\s*(query|mutation|subscription)?\s*([_A-Za-z][_0-9A-Za-z]*)?", query)
+      ok = (m.group(1) or "query") == "query" and (m.group(2) or "") not in self.UNCACHEABLE_OPERATIONS
+      self._cacheable[query] = ok
+    return ok
+
+  @staticmethod
+  def key(endpoint: str, query: str, variables: Optional[Dict[str, Any]]) -> str:
+    h = hashlib.sha256()
+    h.update(endpoint.encode("utf-8") + b"\0")
+    h.update(hashlib.sha256(query.encode("utf-8")).digest())
+    h.update(json.dumps(variables or {}, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+    return h.hexdigest()
+
+  def _path(self, key: str) -> str:
+    return os.path.join(self.root, key[:2], f"{key}.json.gz")
+
+  def get(self, key: str) -> Optional[Dict[str, Any]]:
+    path = self._path(key)
+    try:
+      with gzip.open(path, "rb") as f:
+        header = json.loads(f.readline())
+        if time.time() - float(header.get("savedAt") or 0) > self.ttl_seconds:
+          raise ValueError("expired")
+        resp = json.loads(f.read())
+      os.utime(path)
+    except (OSError, ValueError, EOFError):
+      with self._lock:
+        self.misses += 1
+      return None
+    with self._lock:
+      self.hits += 1
+      if key in self._index:
+        self._index[key][1] = time.time()
+    return resp
+
+  def put(self, key: str, raw: bytes) -> None:
+    path = self._path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with gzip.open(tmp, "wb", compresslevel=6) as f:
+      f.write(json.dumps({"savedAt": time.time()}).encode("utf-8") + b"\n")
+      f.write(raw)
+    os.replace(tmp, path)
+    size = os.path.getsize(path)
+    with self._lock:
+      old = self._index.get(key)
+      self._bytes += size - (int(old[0]) if old else 0)
+      self._index[key] = [size, time.time()]
+      self.stored += 1
+      if self._bytes > self.max_bytes:
+        self._evict()
+
+  def _evict(self) -> None:
+    # Evict down to 90% so a full cache does not evict on every store.
+    target = self.max_bytes * 0.9
+    for key, (size, _) in sorted(self._index.items(), key=lambda kv: kv[1][1]):
+      if self._bytes <= target:
+        break
+      try:
+        os.remove(self._path(key))
+      except FileNotFoundError:
+        pass
+      del self._index[key]
+      self._bytes -= int(size)
+      self.evicted += 1
+
+  def stats(self) -> Dict[str, Any]:
+    with self._lock:
+      return {
+        "root": self.root,
+        "hits": self.hits,
+        "misses": self.misses,
+        "stored": self.stored,
+        "evicted": self.evicted,
+        "entries": len(self._index),
+        "bytes": self._bytes,
+      }
+
+
+_TYPE_REF_FRAGMENT = r'''
+fragment TypeRef on __Type {
+  kind
+  name
+  ofType {
+    kind
+    name
+    ofType {
+      kind
+      name
+      ofType {
+        kind
+        name
+        ofType {
+          kind
+          name
+        }
+      }
+    }
+  }
+}
+
+fragment FullType on __Type {
+  kind
+  name
+  fields {
+    name
+    args {
+      name
+      defaultValue
+      type { ...TypeRef }
+    }
+    type { ...TypeRef }
+  }
+}
+'''
+
+
+SCHEMA_TYPES_INTROSPECTION_QUERY = r'''
+query SchemaTypes {
+  __schema {
+    types { ...FullType }
+  }
+}
+''' + _TYPE_REF_FRAGMENT
+
+
+class SchemaIndex:
+  """In-memory type index (name -> kind/fields/ofType chains) built from one introspection download."""
+
+  def __init__(self, types: Dict[str, Dict[str, Any]], source: str = "schema", requests: int = 0):
+    self.types = types
+    self.source = source
+    self.requests = requests
+
+  @classmethod
+  def from_type_list(cls, type_list: List[Dict[str, Any]], source: str = "schema", requests: int = 0) -> "SchemaIndex":
+    return cls({t["name"]: t for t in type_list if isinstance(t, dict) and t.get("name")}, source, requests)
+
+  def get(self, name: str) -> Dict[str, Any]:
+    return self.types.get(name) or {}
+
+  def __contains__(self, name: str) -> bool:
+    return name in self.types
+
+
+def _batched_type_query(names: List[str]) -> str:
+  parts = [f"  t{i}: __type(name: {json.dumps(n)}) {{ ...FullType }}" for i, n in enumerate(names)]
+  return "query IntrospectTypesBatch {\n" + "\n".join(parts) + "\n}\n" + _TYPE_REF_FRAGMENT
+
+
+def fetch_types_batched(endpoint: str, token: str, names: List[str]) -> Dict[str, Dict[str, Any]]:
+  """Introspect several types in one request via aliased `__type` fields."""
+  if not names:
+    return {}
+  resp = gql_post(endpoint, token, _batched_type_query(names), variables=None, timeout=60)
+  if resp.get("errors"):
+    raise RuntimeError(f"Introspection errors: {resp['errors']}")
+  data = resp.get("data") or {}
+  return {n: (data.get(f"t{i}") or {}) for i, n in enumerate(names)}
+
+
+def _crawl_product_types_batched(endpoint: str, token: str) -> SchemaIndex:
+  """Fallback when `__schema` is unavailable: three batched levels cover everything the builder reads
+  (Product, the object/connection types of its fields, and the node types of those connections)."""
+  types = fetch_types_batched(endpoint, token, ["Product"])
+  requests = 1
+
+  level1 = set()
+  for f in types["Product"].get("fields") or []:
+    kind, base_name, _ = _unwrap_type(f.get("type") or {})
+    if kind == "OBJECT" and base_name:
+      level1.add(base_name)
+  types.update(fetch_types_batched(endpoint, token, sorted(level1 - set(types))))
+  requests += 1 if level1 else 0
+
+  level2 = set()
+  for name in level1:
+    if not _is_connection_type_name(name):
+      continue
+    for cf in types.get(name, {}).get("fields") or []:
+      if cf.get("name") == "nodes":
+        _, nn, _ = _unwrap_type(cf.get("type") or {})
+        if nn:
+          level2.add(nn)
+  missing = sorted(level2 - set(types))
+  types.update(fetch_types_batched(endpoint, token, missing))
+  requests += 1 if missing else 0
+  return SchemaIndex(types, source="batched", requests=requests)
+
+
+def load_schema_index(endpoint: str, token: str, type_cache: Optional[IntrospectionCache] = None) -> SchemaIndex:
+  """Download the whole schema once (or read it from the persistent cache) and index it locally."""
+  if type_cache is not None:
+    cached = type_cache.get("schema", "types")
+    if cached is not None:
+      return SchemaIndex(cached, source="cache", requests=0)
+
+  index: Optional[SchemaIndex] = None
+  try:
+    resp = gql_post(endpoint, token, SCHEMA_TYPES_INTROSPECTION_QUERY, variables=None, timeout=180)
+    type_list = ((resp.get("data") or {}).get("__schema") or {}).get("types")
+    if type_list and not resp.get("errors"):
+      index = SchemaIndex.from_type_list(type_list, source="schema", requests=1)
+  except Exception:
+    index = None
+  if index is None:
+    index = _crawl_product_types_batched(endpoint, token)
+
+  if type_cache is not None:
+    type_cache.put("schema", "types", index.types)
+  return index
+
+
+MAX_SINGLE_QUERY_COST = 1000
+
+_GQL_TOKEN_RE = re.compile(
+  r'(?P<skip>[\s,]+|#[^\n]*)'
+  r'|(?P<spread>\.\.\.)'
+  r'|(?P<block>"""(?:[^"\\]|\\.|"(?!""))*""")'
+  r'|(?P<string>"(?:[^"\\\n]|\\.)*")'
+  r'|(?P<number>-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)'
+  r'|(?P<name>[_A-Za-z][_0-9A-Za-z]*)'
+  r'|(?P<punct>[{}():\[\]!=@$|&])'
+)
+
+
+def _tokenize_graphql(text: str) -> List[Tuple[str, str, int, int]]:
+  tokens: List[Tuple[str, str, int, int]] = []
+  pos = 0
+  while pos < len(text):
+    m = _GQL_TOKEN_RE.match(text, pos)
+    if not m:
+      raise ValueError(f"Unexpected character {text[pos]!r} at offset {pos}")
+    kind = m.lastgroup or ""
+    if kind != "skip":
+      tokens.append((kind, m.group(), m.start(), m.end()))
+    pos = m.end()
+  return tokens
+
+
+class _GraphQLParser:
+  """Minimal executable-document parser: operations, fragments, fields, arguments, inline fragments.
+
+  Nodes are plain dicts; fields and fragments keep their source `span` so callers can slice the original text.
+  """
+
+  def __init__(self, text: str):
+    self.text = text
+    self.tokens = _tokenize_graphql(text)
+    self.i = 0
+
+  def _peek(self, offset: int = 0) -> Tuple[str, str, int, int]:
+    j = self.i + offset
+    return self.tokens[j] if j < len(self.tokens) else ("eof", "", len(self.text), len(self.text))
+
+  def _next(self) -> Tuple[str, str, int, int]:
+    tok = self._peek()
+    self.i += 1
+    return tok
+
+  def _expect(self, value: str) -> Tuple[str, str, int, int]:
+    tok = self._next()
+    if tok[1] != value:
+      raise ValueError(f"Expected {value!r}, got {tok[1]!r} at offset {tok[2]}")
+    return tok
+
+  def _name(self) -> str:
+    tok = self._next()
+    if tok[0] != "name":
+      raise ValueError(f"Expected a name, got {tok[1]!r} at offset {tok[2]}")
+    return tok[1]
+
+  def parse_document(self) -> Dict[str, Any]:
+    doc: Dict[str, Any] = {"operations": [], "fragments": {}}
+    while self._peek()[0] != "eof":
+      tok = self._peek()
+      if tok[1] == "{":
+        doc["operations"].append({"type": "query", "name": None, "variables": {}, "selections": self._selection_set()})
+      elif tok[1] == "fragment":
+        self._next()
+        name = self._name()
+        self._expect("on")
+        type_condition = self._name()
+        self._directives()
+        selections = self._selection_set()
+        doc["fragments"][name] = {
+          "name": name,
+          "typeCondition": type_condition,
+          "selections": selections,
+          "span": (tok[2], self.tokens[self.i - 1][3]),
+        }
+      elif tok[1] in ("query", "mutation", "subscription"):
+        self._next()
+        name = self._name() if self._peek()[0] == "name" else None
+        variables = self._variable_definitions() if self._peek()[1] == "(" else {}
+        self._directives()
+        doc["operations"].append({"type": tok[1], "name": name, "variables": variables, "selections": self._selection_set()})
+      else:
+        raise ValueError(f"Unexpected token {tok[1]!r} at offset {tok[2]}")
+    return doc
+
+  def _variable_definitions(self) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    self._expect("(")
+    while self._peek()[1] != ")":
+      self._expect("$")
+      name = self._name()
+      self._expect(":")
+      self._type_ref()
+      default = None
+      if self._peek()[1] == "=":
+        self._next()
+        default = self._value()
+      out[name] = default
+    self._expect(")")
+    return out
+
+  def _type_ref(self) -> None:
+    if self._peek()[1] == "[":
+      self._next()
+      self._type_ref()
+      self._expect("]")
+    else:
+      self._name()
+    if self._peek()[1] == "!":
+      self._next()
+
+  def _directives(self) -> List[Dict[str, Any]]:
+    out = []
+    while self._peek()[1] == "@":
+      self._next()
+      name = self._name()
+      out.append({"name": name, "args": self._arguments() if self._peek()[1] == "(" else {}})
+    return out
+
+  def _arguments(self) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    self._expect("(")
+    while self._peek()[1] != ")":
+      name = self._name()
+      self._expect(":")
+      out[name] = self._value()
+    self._expect(")")
+    return out
+
+  def _value(self) -> Any:
+    kind, value, _, _ = self._next()
+    if value == "$":
+      return {"$var": self._name()}
+    if kind == "string":
+      return json.loads(value)
+    if kind == "block":
+      return value[3:-3]
+    if kind == "number":
+      return float(value) if any(c in value for c in ".eE") else int(value)
+    if value == "[":
+      items = []
+      while self._peek()[1] != "]":
+        items.append(self._value())
+      self._next()
+      return items
+    if value == "{":
+      obj: Dict[str, Any] = {}
+      while self._peek()[1] != "}":
+        key = self._name()
+        self._expect(":")
+        obj[key] = self._value()
+      self._next()
+      return obj
+    if kind == "name":
+      return {"true": True, "false": False, "null": None}.get(value, value)
+    raise ValueError(f"Unexpected value token {value!r}")
+
+  def _selection_set(self) -> List[Dict[str, Any]]:
+    self._expect("{")
+    selections: List[Dict[str, Any]] = []
+    while self._peek()[1] != "}":
+      selections.append(self._selection())
+    self._next()
+    return selections
+
+  def _selection(self) -> Dict[str, Any]:
+    start = self._peek()[2]
+    if self._peek()[0] == "spread":
+      self._next()
+      if self._peek()[1] == "on":
+        self._next()
+        type_condition = self._name()
+        self._directives()
+        return {"kind": "inline", "typeCondition": type_condition, "selections": self._selection_set()}
+      if self._peek()[1] in ("{", "@"):
+        self._directives()
+        return {"kind": "inline", "typeCondition": None, "selections": self._selection_set()}
+      name = self._name()
+      self._directives()
+      return {"kind": "spread", "name": name}
+
+    name = self._name()
+    alias = None
+    if self._peek()[1] == ":":
+      self._next()
+      alias, name = name, self._name()
+    args = self._arguments() if self._peek()[1] == "(" else {}
+    directives = self._directives()
+    selections = self._selection_set() if self._peek()[1] == "{" else []
+    end = self.tokens[self.i - 1][3]
+    return {
+      "kind": "field",
+      "name": name,
+      "alias": alias,
+      "args": args,
+      "directives": directives,
+      "selections": selections,
+      "span": (start, end),
+    }
+
+
+def parse_graphql(text: str) -> Dict[str, Any]:
+  return _GraphQLParser(text).parse_document()
+
+
+def query_document_hash(query: str) -> str:
+  """sha256 of the query's token stream: stable across whitespace, indentation and comments."""
+  return hashlib.sha256(" ".join(tok[1] for tok in _tokenize_graphql(query)).encode("utf-8")).hexdigest()
+
+
+def _fragments_source(query: str, doc: Dict[str, Any], selections: List[Dict[str, Any]]) -> str:
+  """Source text of the fragments `selections` spreads (directly or through other fragments), in document order.
+
+  GraphQL rejects documents with unused fragments, so a query cut out of a larger one carries only these.
+  """
+  used = set()
+
+  def walk(sels: List[Dict[str, Any]]) -> None:
+    for sel in sels:
+      if sel.get("kind") == "spread":
+        frag = doc["fragments"].get(sel["name"])
+        if frag and sel["name"] not in used:
+          used.add(sel["name"])
+          walk(frag["selections"])
+      else:
+        walk(sel.get("selections") or [])
+
+  walk(selections)
+  return "\n\n".join(query[f["span"][0] : f["span"][1]] for f in doc["fragments"].values() if f["name"] in used)
+
+
+def _resolve_arg(value: Any, variables: Dict[str, Any]) -> Any:
+  if isinstance(value, dict) and "$var" in value:
+    return variables.get(value["$var"])
+  return value
+
+
+def _connection_item_cost(selections: List[Dict[str, Any]], doc: Dict[str, Any], variables: Dict[str, Any]) -> float:
+  """Cost of one connection item: `nodes`/`edges.node` count as an object, `pageInfo`/cursors are free."""
+  total = 0.0
+  for sel in selections:
+    if sel.get("kind") != "field":
+      total += _selection_cost([sel], doc, variables)
+      continue
+    if sel["name"] == "nodes":
+      total += 1 + _selection_cost(sel["selections"], doc, variables)
+    elif sel["name"] == "edges":
+      for sub in sel["selections"]:
+        if sub.get("kind") == "field" and sub["name"] == "node":
+          total += 1 + _selection_cost(sub["selections"], doc, variables)
+  return total
+
+
+def _field_cost(field: Dict[str, Any], doc: Dict[str, Any], variables: Dict[str, Any]) -> float:
+  if not field["selections"]:
+    return 0.0  # scalars and enums are free
+  if field["name"] == "pageInfo" or field["name"].startswith("__"):
+    return 0.0  # introspection is not charged
+  args = field["args"]
+  size = _resolve_arg(args.get("first"), variables)
+  if size is None:
+    size = _resolve_arg(args.get("last"), variables)
+  if isinstance(size, int):
+    # Connections: 2 points plus every requested item (and whatever each item selects).
+    return 2 + size * _connection_item_cost(field["selections"], doc, variables)
+  ids = _resolve_arg(args.get("ids"), variables)
+  if field["name"] == "nodes" and isinstance(ids, list):
+    return len(ids) * (1 + _selection_cost(field["selections"], doc, variables))
+  return 1 + _selection_cost(field["selections"], doc, variables)
+
+
+def _selection_cost(selections: List[Dict[str, Any]], doc: Dict[str, Any], variables: Dict[str, Any]) -> float:
+  total = 0.0
+  branches: List[float] = []
+  for sel in selections:
+    kind = sel.get("kind")
+    if kind == "field":
+      total += _field_cost(sel, doc, variables)
+    elif kind == "spread":
+      frag = (doc.get("fragments") or {}).get(sel["name"])
+      if frag:
+        total += _selection_cost(frag["selections"], doc, variables)
+    elif sel.get("typeCondition"):
+      # Type-conditioned branches are alternatives: only one applies per object.
+      branches.append(_selection_cost(sel["selections"], doc, variables))
+    else:
+      total += _selection_cost(sel["selections"], doc, variables)
+  return total + (max(branches) if branches else 0.0)
+
+
+def estimate_query_cost(query: str, variables: Optional[Dict[str, Any]] = None) -> float:
+  """Estimate Shopify's requestedQueryCost from the query structure, before sending it.
+
+  Mirrors Shopify's rules: scalars/enums 0, objects 1, connections 2 + first/last x item cost (nested
+  connections multiply), `nodes(ids:)` one object per id. Only the first operation is costed.
+  """
+  doc = parse_graphql(query)
+  if not doc["operations"]:
+    return 0.0
+  op = doc["operations"][0]
+  merged_vars = {k: v for k, v in op["variables"].items() if v is not None}
+  merged_vars.update(variables or {})
+  return _selection_cost(op["selections"], doc, merged_vars)
+
+
+def _field_source(query: str, field: Dict[str, Any]) -> str:
+  """Source text of a parsed field, with continuation lines de-indented to the field's own column."""
+  start, end = field["span"]
+  column = start - (query.rfind("\n", 0, start) + 1)
+  lines = query[start:end].split("\n")
+  return "\n".join([lines[0]] + [ln[column:] if ln[:column].strip() == "" else ln.lstrip() for ln in lines[1:]])
+
+
+def split_product_query(product_query: str, target_cost: float, name: str = "ProductEverything") -> List[str]:
+  """Split a `product(id: $id)` query into several queries whose estimated cost stays under target.
+
+  Top-level Product fields are packed greedily in their original order; `id` (and `__typename` if
+  selected) is repeated in every part so the partial products can be merged back. A single field that alone exceeds the target keeps a
+  part of its own (the server will reject it, which is then visible in the output errors).
+  """
+  doc = parse_graphql(product_query)
+  product_field = next(
+    s for s in doc["operations"][0]["selections"] if s.get("kind") == "field" and s["name"] == "product"
+  )
+
+  keys = [s["name"] for s in product_field["selections"] if s.get("kind") == "field" and not s["alias"]]
+  base_fields = [n for n in ("id", "__typename") if n in keys or n == "id"]
+  parts: List[List[Dict[str, Any]]] = []
+  current: List[Dict[str, Any]] = []
+  current_cost = 1.0  # the product object itself
+  for sel in product_field["selections"]:
+    if sel.get("kind") != "field" or (sel["name"] in base_fields and not sel["alias"]):
+      continue
+    cost = _field_cost(sel, doc, {})
+    if current and current_cost + cost > target_cost:
+      parts.append(current)
+      current, current_cost = [], 1.0
+    current.append(sel)
+    current_cost += cost
+  if current:
+    parts.append(current)
+
+  queries = []
+  for k, fields in enumerate(parts, start=1):
+    texts = [_field_source(product_query, sel).replace("\n", "\n    ") for sel in fields]
+    body = "\n    ".join(base_fields + texts)
+    query = f"query {name}Part{k}($id: ID!) {{\n  product(id: $id) {{\n    {body}\n  }}\n}}"
+    fragments_text = _fragments_source(product_query, doc, fields)
+    if fragments_text:
+      query += "\n\n" + fragments_text
+    queries.append(query)
+  return queries
+
+
+def plan_everything_query(
+  build: Callable[[int], Tuple[str, Dict[str, Any]]],
+  connection_first: int,
+  target_cost: float = MAX_SINGLE_QUERY_COST,
+  min_connection_first: int = 5,
+) -> Tuple[List[str], Dict[str, Any], Dict[str, Any]]:
+  """Fit the --everything query under `target_cost` before anything is sent.
+
+  First halves the connection page size (down to `min_connection_first`), then splits the Product
+  selection into several queries. Returns (queries, builder meta, cost plan).
+  """
+  first = max(1, int(connection_first))
+  floor = max(1, min(int(min_connection_first), first))
+  while True:
+    query, meta = build(first)
+    estimate = estimate_query_cost(query)
+    if estimate <= target_cost or first <= floor:
+      break
+    first = max(floor, first // 2)
+
+  queries = [query] if estimate <= target_cost else split_product_query(query, target_cost)
+  plan = {
+    "targetCost": target_cost,
+    "requestedConnectionFirst": int(connection_first),
+    "connectionFirst": first,
+    "estimatedCost": estimate,
+    "parts": [{"estimatedCost": estimate_query_cost(q), "documentHash": query_document_hash(q)} for q in queries],
+  }
+  return queries, meta, plan
+
+
+def fetch_product_parts(endpoint: str, token: str, pid: str, queries: List[str], timeout: int = 120) -> Dict[str, Any]:
+  """Run a split product query and merge the parts back into one `product(id:)`-shaped response.
+
+  Product keys follow the order of the first part's fields, then later parts; `extensions.cost` sums
+  the parts' costs (per-part costs are kept under `parts`).
+  """
+  merged: Dict[str, Any] = {}
+  product_null = False
+  errors: List[Dict[str, Any]] = []
+  part_costs: List[Dict[str, Any]] = []
+  last_extensions: Dict[str, Any] = {}
+  for query in queries:
+    resp = gql_post(endpoint, token, query, variables={"id": pid}, timeout=timeout)
+    errors.extend(resp.get("errors") or [])
+    last_extensions = resp.get("extensions") or {}
+    part_costs.append(last_extensions.get("cost") or {})
+    product = (resp.get("data") or {}).get("product")
+    if isinstance(product, dict):
+      for k, v in product.items():
+        merged.setdefault(k, v)
+    elif "data" in resp:
+      product_null = True
+
+  out: Dict[str, Any] = {"data": {"product": merged if merged or not product_null else None}}
+  if errors:
+    out["errors"] = errors
+  cost = {
+    "requestedQueryCost": sum(float(c.get("requestedQueryCost") or 0) for c in part_costs),
+    "actualQueryCost": sum(float(c.get("actualQueryCost") or 0) for c in part_costs),
+    "throttleStatus": (last_extensions.get("cost") or {}).get("throttleStatus"),
+    "parts": part_costs,
+  }
+  out["extensions"] = {**last_extensions, "cost": cost}
+  return out
+
+
+def summarize_observed_costs(costs: List[Dict[str, Any]], plan: Dict[str, Any]) -> Dict[str, Any]:
+  """Compare the planner's estimate with the requested/actual costs (`extensions.cost`) the server reported."""
+  requested: List[float] = []
+  actual: List[float] = []
+  for cost in costs:
+    if cost.get("requestedQueryCost") is not None:
+      requested.append(float(cost["requestedQueryCost"]))
+    if cost.get("actualQueryCost") is not None:
+      actual.append(float(cost["actualQueryCost"]))
+
+  estimated = sum(p["estimatedCost"] for p in plan.get("parts") or [])
+  summary: Dict[str, Any] = {"estimatedCost": estimated, "products": len(costs)}
+  if requested:
+    summary["requestedQueryCost"] = {"min": min(requested), "max": max(requested), "avg": sum(requested) / len(requested)}
+    summary["estimateMinusRequested"] = estimated - max(requested)
+  if actual:
+    summary["actualQueryCost"] = {"min": min(actual), "max": max(actual), "avg": sum(actual) / len(actual)}
+    summary["actualToEstimateRatio"] = (sum(actual) / len(actual)) / estimated if estimated else None
+  return summary
+
+
 def build_everything_product_query(
   endpoint: str,
   token: str,
@@ -121,13 +909,22 @@ def build_everything_product_query(
   connection_first: int = 50,
   connection_max_fields: int = 25,
   skip_fields: Optional[List[str]] = None,
+  type_cache: Optional[IntrospectionCache] = None,
+  schema_index: Optional[SchemaIndex] = None,
 ) -> Tuple[str, Dict[str, Any]]:
   """Build a best-effort Product selection set using schema introspection.
 
-  Returns (query, meta) where meta includes skipped fields.
+  Returns (query, meta) where meta includes skipped fields. With `schema_index` every type is
+  resolved locally; otherwise types are introspected one by one (through `type_cache` if given).
+  An object type selected in more than one place is emitted once as a `<Type>Fields` fragment and spread
+  wherever it appears (single-use selections stay inline); `meta["documentHash"]` identifies the
+  resulting document (see `query_document_hash`).
   """
   cache: Dict[str, Dict[str, Any]] = {}
+  network_lookups: List[str] = []
   skipped: List[Dict[str, Any]] = []
+  selections: Dict[str, str] = {}  # type name -> selection text, in first-use order
+  uses: Dict[str, int] = {}
 
   # These fields have been observed to error in some shops/apps (e.g., app has no publication),
   # and when they are NON_NULL in the schema they can null the entire `product` object.
@@ -140,11 +937,25 @@ def build_everything_product_query(
   def get_type(name: str) -> Dict[str, Any]:
     if name in cache:
       return cache[name]
-    resp = gql_post(endpoint, token, INTROSPECT_TYPE_QUERY, variables={"name": name}, timeout=60)
-    t = (resp.get("data") or {}).get("__type") or {}
+    if schema_index is not None:
+      cache[name] = schema_index.get(name)
+      return cache[name]
+    t = type_cache.get("types", name) if type_cache is not None else None
+    if t is None:
+      resp = gql_post(endpoint, token, INTROSPECT_TYPE_QUERY, variables={"name": name}, timeout=60)
+      t = (resp.get("data") or {}).get("__type") or {}
+      network_lookups.append(name)
+      if type_cache is not None and not resp.get("errors"):
+        type_cache.put("types", name, t)
     cache[name] = t
     return t
 
+  def type_selection(type_name: str, selection: str) -> str:
+    # Placeholder on a line of its own; resolved to a spread or the inline selection once use counts are known.
+    selections.setdefault(type_name, selection)
+    uses[type_name] = uses.get(type_name, 0) + 1
+    return f"\0{type_name}\0"
+
   def build_selection_for_type(type_name: str, depth: int, visited: List[str]) -> str:
     if depth > max_depth:
       return "id __typename"
@@ -154,14 +965,16 @@ def build_everything_product_query(
     t = get_type(type_name) or {}
     if not t.get("name"):
       return "__typename"
+    if type_name in selections:
+      return type_selection(type_name, selections[type_name])
 
     # Special-cases for common money/image-ish objects to get meaningful data
     if type_name == "MoneyV2":
-      return "amount currencyCode"
+      return type_selection(type_name, "amount currencyCode")
     if type_name == "SEO":
-      return "title description"
+      return type_selection(type_name, "title description")
     if type_name in ("Image", "ImageSource"):
-      return "id url altText width height"
+      return type_selection(type_name, "id url altText width height")
 
     picked = _pick_object_scalar_fields(t, max_fields=connection_max_fields)
     out_parts: List[str] = []
@@ -175,7 +988,7 @@ def build_everything_product_query(
           continue
         out_parts.append(n)
 
-    return "\n".join(out_parts)
+    return type_selection(type_name, "\n".join(out_parts))
 
   product_type = get_type("Product")
   product_fields = product_type.get("fields") or []
@@ -253,7 +1066,19 @@ def build_everything_product_query(
 
     skipped.append({"field": fname, "reason": f"unsupported_kind:{kind}"})
 
-  query = "query ProductEverything($id: ID!) {\n  product(id: $id) {\n    " + "\n    ".join(selection_lines) + "\n  }\n}"
+  fragments = [t for t in selections if uses[t] > 1]
+
+  def resolve(m: "re.Match[str]") -> str:
+    indent, type_name = m.group(1), m.group(2)
+    if type_name in fragments:
+      return f"{indent}...{type_name}Fields"
+    return indent + selections[type_name].replace("\n", "\n" + indent)
+
+  body = "\n    ".join(selection_lines)
+  query = "query ProductEverything($id: ID!) {\n  product(id: $id) {\n    " + body + "\n  }\n}"
+  query = re.sub(r"(?m)^([ \t]*)\0(\w+)\0", resolve, query)
+  for type_name in fragments:
+    query += f"\n\nfragment {type_name}Fields on {type_name} {{\n  {selections[type_name].replace(chr(10), chr(10) + '  ')}\n}}"
 
   meta = {
     "maxDepth": max_depth,
@@ -261,6 +1086,10 @@ def build_everything_product_query(
     "connectionMaxFields": connection_max_fields,
     "skipped": skipped,
     "introspectedTypes": sorted(cache.keys()),
+    "introspectionRequests": schema_index.requests if schema_index is not None else len(network_lookups),
+    "introspectionSource": schema_index.source if schema_index is not None else "per-type",
+    "fragments": [f"{t}Fields" for t in fragments],
+    "documentHash": query_document_hash(query),
   }
   return query, meta
 
@@ -286,113 +1115,818 @@ def load_env_file(path: str) -> Dict[str, str]:
     return env
 
 
-def gql_post(endpoint: str, token: str, query: str, variables: Optional[Dict[str, Any]] = None, timeout: int = 60) -> Dict[str, Any]:
-    payload: Dict[str, Any] = {"query": query}
-    if variables is not None:
-        payload["variables"] = variables
-
-    data = json.dumps(payload).encode("utf-8")
-    req = urllib.request.Request(
-        endpoint,
-        data=data,
-        headers={
-            "Content-Type": "application/json",
-            "X-Shopify-Access-Token": token,
-        },
-        method="POST",
-    )
+class ThrottleBucket:
+  """Client-side mirror of Shopify's cost leaky bucket (`extensions.cost.throttleStatus`).
 
-    with urllib.request.urlopen(req, timeout=timeout) as resp:
-        body = resp.read().decode("utf-8", errors="replace")
-        return json.loads(body)
+  Requests reserve their expected `requestedQueryCost` before being sent and block until the bucket
+  has restored enough points. Every response re-syncs the bucket from the server-reported
+  `currentlyAvailable`/`restoreRate`, so pacing tracks the shop's real limit instead of fixed sleeps.
+  """
 
+  def __init__(self, maximum_available: float = 1000.0, restore_rate: float = 50.0, default_cost: float = 50.0):
+    self.maximum_available = float(maximum_available)
+    self.restore_rate = float(restore_rate)
+    self.default_cost = float(default_cost)
+    self.blocked_seconds = 0.0
+    self._available = float(maximum_available)
+    self._in_flight = 0.0
+    self._updated_at = time.monotonic()
+    self._costs: Dict[str, float] = {}
+    self._lock = threading.Lock()
 
-def pick_test_set(report: Dict[str, Any], vendor_count: int, seed: int, pick_mode: str = "random") -> List[Dict[str, Any]]:
-    rng = random.Random(seed)
-    vendors = report.get("vendors") or []
-    if not vendors:
-        raise RuntimeError("vendor_samples_report.json has no vendors")
+  def _refill(self, now: float) -> None:
+    elapsed = max(0.0, now - self._updated_at)
+    self._available = min(self.maximum_available, self._available + elapsed * self.restore_rate)
+    self._updated_at = now
 
-    # Only vendors that have at least 1 sampled product
-    eligible = [v for v in vendors if (v.get("sampled") or [])]
-    if len(eligible) < vendor_count:
-        vendor_count = len(eligible)
+  def estimate(self, query: str) -> float:
+    """Expected cost of `query`: the last requestedQueryCost seen for it, else a default guess."""
+    with self._lock:
+      return self._costs.get(query, self.default_cost)
 
-    if pick_mode == "report-order":
-        chosen_vendors = eligible[:vendor_count]
-    else:
-        chosen_vendors = rng.sample(eligible, vendor_count)
+  def acquire(self, cost: float) -> float:
+    """Block until `cost` points are available and reserve them. Returns seconds spent waiting."""
+    waited = 0.0
+    while True:
+      with self._lock:
+        need = min(float(cost), self.maximum_available)
+        self._refill(time.monotonic())
+        if self._available >= need:
+          self._available -= need
+          self._in_flight += need
+          self.blocked_seconds += waited
+          return waited
+        delay = (need - self._available) / max(self.restore_rate, 1e-6)
+      time.sleep(delay)
+      waited += delay
 
-    picked: List[Dict[str, Any]] = []
-    for v in chosen_vendors:
-        sampled = v.get("sampled") or []
-        # Ensure deterministic ordering per vendor for stable output
-        sampled = list(sampled)
-        # If a vendor has >3 sampled in report (shouldn't), take first 3
-        sampled = sampled[:3]
-        picked.append({"vendor": v.get("vendor"), "sampled": sampled, "productCountInFile": v.get("productCountInFile")})
+  def release(self, cost: float) -> None:
+    """Return an unused reservation (the request never reached the server)."""
+    with self._lock:
+      need = min(float(cost), self.maximum_available)
+      self._in_flight = max(0.0, self._in_flight - need)
+      self._refill(time.monotonic())
+      self._available = min(self.maximum_available, self._available + need)
 
-    # Sort by vendor name for readability + stable diffing
-    picked.sort(key=lambda x: (x.get("vendor") or ""))
-    return picked
+  def observe(self, query: str, reserved: float, extensions: Optional[Dict[str, Any]]) -> None:
+    """Settle a reservation against the cost block returned by the server."""
+    cost = (extensions or {}).get("cost") or {}
+    status = cost.get("throttleStatus") or {}
+    with self._lock:
+      reserved = min(float(reserved), self.maximum_available)
+      self._in_flight = max(0.0, self._in_flight - reserved)
+      self._refill(time.monotonic())
+      if cost.get("requestedQueryCost") is not None:
+        self._costs[query] = float(cost["requestedQueryCost"])
+      if status.get("maximumAvailable"):
+        self.maximum_available = float(status["maximumAvailable"])
+      if status.get("restoreRate"):
+        self.restore_rate = float(status["restoreRate"])
+      if status.get("currentlyAvailable") is not None:
+        # The server value already includes this request; other in-flight reservations may not be.
+        self._available = max(0.0, float(status["currentlyAvailable"]) - self._in_flight)
+      elif cost.get("actualQueryCost") is not None:
+        self._available += max(0.0, reserved - float(cost["actualQueryCost"]))
+      else:
+        # No cost information (e.g. a proxy or stand-in server): do not pace on a guess.
+        self._available += reserved
+      self._available = min(self.maximum_available, self._available)
 
+  def throttled_delay(self, extensions: Optional[Dict[str, Any]], fallback_cost: float) -> float:
+    """Seconds until the server bucket can afford the query that was just THROTTLED."""
+    cost = (extensions or {}).get("cost") or {}
+    status = cost.get("throttleStatus") or {}
+    requested = float(cost.get("requestedQueryCost") or fallback_cost)
+    available = float(status.get("currentlyAvailable") or 0.0)
+    rate = float(status.get("restoreRate") or self.restore_rate)
+    return max(0.0, requested - available) / max(rate, 1e-6)
 
-PRODUCT_FIELDS_INTROSPECTION = r'''
-query ProductFields {
-  __type(name: "Product") {
-    name
-    fields {
-      name
-      args {
-        name
-        defaultValue
-        type {
-          kind
-          name
-          ofType {
-            kind
-            name
-            ofType {
-              kind
-              name
-              ofType {
-                kind
-                name
-              }
-            }
-          }
+
+def _pid_alive(pid: int) -> bool:
+  try:
+    os.kill(pid, 0)
+  except ProcessLookupError:
+    return False
+  except PermissionError:
+    return True
+  return True
+
+
+class SharedThrottleBucket(ThrottleBucket):
+  """ThrottleBucket whose level lives in an flock-protected state file shared by every process on the host.
+
+  Concurrent fetch_shopify_products.py runs against the same shop reserve from, and re-sync, one bucket:
+  each response's `throttleStatus` is written back minus the reservations still in flight in *all*
+  processes, so their combined pace stays just under the shop's restore rate. Reservations are kept
+  per pid; those of processes that died are dropped on the next access.
+  """
+
+  def __init__(self, path: str, **kwargs: Any):
+    if fcntl is None:
+      raise RuntimeError("A shared throttle bucket needs fcntl (not available on this platform)")
+    super().__init__(**kwargs)
+    self.path = path
+    self._pid = str(os.getpid())
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+  @contextlib.contextmanager
+  def _state(self) -> Iterator[Dict[str, Any]]:
+    with self._lock:
+      fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+      try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        raw = b""
+        while True:
+          chunk = os.read(fd, 65536)
+          if not chunk:
+            break
+          raw += chunk
+        try:
+          state = json.loads(raw) if raw else {}
+        except ValueError:
+          state = {}
+        now = time.time()
+        maximum = float(state.get("maximumAvailable") or self.maximum_available)
+        rate = float(state.get("restoreRate") or self.restore_rate)
+        available = float(state.get("available", maximum))
+        elapsed = max(0.0, now - float(state.get("updatedAt") or now))
+        in_flight = {
+          pid: float(amount)
+          for pid, amount in (state.get("inFlight") or {}).items()
+          if amount > 0 and (pid == self._pid or _pid_alive(int(pid)))
         }
-      }
-      type {
-        kind
-        name
-        ofType {
-          kind
-          name
-          ofType {
-            kind
-            name
-            ofType {
-              kind
-              name
-            }
-          }
+        state = {
+          "maximumAvailable": maximum,
+          "restoreRate": rate,
+          "available": min(maximum, available + elapsed * rate),
+          "updatedAt": now,
+          "inFlight": in_flight,
         }
-      }
-    }
-  }
-}
-'''
+        yield state
+        self.maximum_available = state["maximumAvailable"]
+        self.restore_rate = state["restoreRate"]
+        state["inFlight"] = {pid: amount for pid, amount in state["inFlight"].items() if amount > 1e-9}
+        os.lseek(fd, 0, os.SEEK_SET)
+        os.ftruncate(fd, 0)
+        os.write(fd, json.dumps(state).encode("utf-8"))
+      finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
 
+  def acquire(self, cost: float) -> float:
+    waited = 0.0
+    while True:
+      with self._state() as st:
+        need = min(float(cost), st["maximumAvailable"])
+        if st["available"] >= need:
+          st["available"] -= need
+          st["inFlight"][self._pid] = st["inFlight"].get(self._pid, 0.0) + need
+          self.blocked_seconds += waited
+          return waited
+        delay = (need - st["available"]) / max(st["restoreRate"], 1e-6)
+      time.sleep(delay)
+      waited += delay
 
-PRODUCT_DETAILS_QUERY = r'''
-query ProductDetails($id: ID!) {
-  product(id: $id) {
-    id
-    legacyResourceId
-    title
-    handle
-    status
+  def release(self, cost: float) -> None:
+    with self._state() as st:
+      need = min(float(cost), st["maximumAvailable"])
+      st["inFlight"][self._pid] = max(0.0, st["inFlight"].get(self._pid, 0.0) - need)
+      st["available"] = min(st["maximumAvailable"], st["available"] + need)
+
+  def observe(self, query: str, reserved: float, extensions: Optional[Dict[str, Any]]) -> None:
+    cost = (extensions or {}).get("cost") or {}
+    status = cost.get("throttleStatus") or {}
+    with self._state() as st:
+      if cost.get("requestedQueryCost") is not None:
+        self._costs[query] = float(cost["requestedQueryCost"])
+      reserved = min(float(reserved), st["maximumAvailable"])
+      st["inFlight"][self._pid] = max(0.0, st["inFlight"].get(self._pid, 0.0) - reserved)
+      if status.get("maximumAvailable"):
+        st["maximumAvailable"] = float(status["maximumAvailable"])
+      if status.get("restoreRate"):
+        st["restoreRate"] = float(status["restoreRate"])
+      if status.get("currentlyAvailable") is not None:
+        st["available"] = max(0.0, float(status["currentlyAvailable"]) - sum(st["inFlight"].values()))
+      elif cost.get("actualQueryCost") is not None:
+        st["available"] += max(0.0, reserved - float(cost["actualQueryCost"]))
+      else:
+        st["available"] += reserved
+      st["available"] = min(st["maximumAvailable"], st["available"])
+
+
+_THROTTLE_BUCKETS: Dict[str, ThrottleBucket] = {}
+_THROTTLE_BUCKETS_LOCK = threading.Lock()
+_SHARED_THROTTLE_DIR: Optional[str] = None
+
+
+def enable_shared_throttle(directory: Optional[str]) -> None:
+  """Make get_throttle_bucket() hand out SharedThrottleBucket state files in `directory` (None: off)."""
+  global _SHARED_THROTTLE_DIR
+  _SHARED_THROTTLE_DIR = directory
+
+
+def reset_throttle_buckets() -> None:
+  """Forget the per-endpoint buckets; the next get_throttle_bucket() call starts from a fresh one."""
+  with _THROTTLE_BUCKETS_LOCK:
+    _THROTTLE_BUCKETS.clear()
+
+
+RETRYABLE_HTTP_STATUSES = {429, 500, 502, 503, 504}
+
+
+def get_throttle_bucket(endpoint: str) -> ThrottleBucket:
+  """One shared bucket per endpoint (i.e. per shop + API version) for the whole process.
+
+  With enable_shared_throttle() the bucket is also shared with other processes on the host, keyed by
+  the shop host (Shopify's bucket is per shop and app, not per API version).
+  """
+  with _THROTTLE_BUCKETS_LOCK:
+    bucket = _THROTTLE_BUCKETS.get(endpoint)
+    if bucket is None:
+      if _SHARED_THROTTLE_DIR:
+        host = urllib.parse.urlsplit(endpoint).netloc or endpoint
+        path = os.path.join(_SHARED_THROTTLE_DIR, re.sub(r"[^A-Za-z0-9_.-]", "_", host) + ".json")
+        bucket = SharedThrottleBucket(path)
+      else:
+        bucket = ThrottleBucket()
+      _THROTTLE_BUCKETS[endpoint] = bucket
+    return bucket
+
+
+def _is_throttled(resp: Dict[str, Any]) -> bool:
+  for err in resp.get("errors") or []:
+    if isinstance(err, dict) and ((err.get("extensions") or {}).get("code") == "THROTTLED"):
+      return True
+  return False
+
+
+def _backoff_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+  if retry_after:
+    try:
+      return max(0.0, float(retry_after))
+    except ValueError:
+      pass
+  # Exponential backoff with jitter, capped so a flaky run does not stall for minutes.
+  return min(30.0, 0.5 * (2 ** attempt)) * (0.5 + random.random() / 2)
+
+
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_OPERATION_NAME_RE = re.compile(r"^\s*(?:query|mutation)\s+([_A-Za-z][_0-9A-Za-z]*)")
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+  if not sorted_values:
+    return 0.0
+  k = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+  return sorted_values[k]
+
+
+class RequestMetrics:
+  """Per-request instrumentation of `GraphQLClient.post`, aggregated per GraphQL operation name.
+
+  Each call (including its retries) is one sample: wall latency, bytes on the wire, requested/actual
+  query cost, the bucket level the server reported, retries, time blocked on throttling or backoff and
+  an error class. `report()` builds the run's JSON metrics block, `prometheus()` the same in text format.
+  """
+
+  def __init__(self, log_path: Optional[str] = None):
+    self.started_at = time.monotonic()
+    self._ops: Dict[str, Dict[str, Any]] = {}
+    self._names: Dict[str, str] = {}
+    self._throttle: Dict[str, Optional[float]] = {"minAvailable": None, "lastAvailable": None, "maximumAvailable": None}
+    self._lock = threading.Lock()
+    self._log = open(log_path, "w", encoding="utf-8") if log_path else None
+
+  def operation_name(self, query: str) -> str:
+    name = self._names.get(query)
+    if name is None:
+      m = _OPERATION_NAME_RE.match(query)
+      name = m.group(1) if m else ("Introspection" if "__type" in query or "__schema" in query else "anonymous")
+      self._names[query] = name
+    return name
+
+  def record(self, query: str, seconds: float, call: Dict[str, Any]) -> None:
+    name = self.operation_name(query)
+    cost = call.get("cost") or {}
+    available = (cost.get("throttleStatus") or {}).get("currentlyAvailable")
+    with self._lock:
+      op = self._ops.get(name)
+      if op is None:
+        op = {
+          "count": 0,
+          "cacheHits": 0,
+          "errors": {},
+          "retries": 0,
+          "latencies": [],
+          "bytesIn": 0,
+          "bytesOut": 0,
+          "requestedCost": 0.0,
+          "actualCost": 0.0,
+          "throttledSeconds": 0.0,
+          "backoffSeconds": 0.0,
+        }
+        self._ops[name] = op
+      op["count"] += 1
+      op["cacheHits"] += 1 if call.get("cached") else 0
+      op["retries"] += call["retries"]
+      op["latencies"].append(seconds)
+      op["bytesIn"] += call["bytesIn"]
+      op["bytesOut"] += call["bytesOut"]
+      if not call.get("cached"):
+        op["requestedCost"] += float(cost.get("requestedQueryCost") or 0.0)
+        op["actualCost"] += float(cost.get("actualQueryCost") or 0.0)
+      op["throttledSeconds"] += call["throttledSeconds"]
+      op["backoffSeconds"] += call["backoffSeconds"]
+      if call["error"]:
+        op["errors"][call["error"]] = op["errors"].get(call["error"], 0) + 1
+      if available is not None and not call.get("cached"):
+        level = float(available)
+        low = self._throttle["minAvailable"]
+        self._throttle["minAvailable"] = level if low is None else min(low, level)
+        self._throttle["lastAvailable"] = level
+        self._throttle["maximumAvailable"] = (cost.get("throttleStatus") or {}).get("maximumAvailable")
+      if self._log is not None:
+        self._log.write(
+          json.dumps(
+            {
+              "operation": name,
+              "cached": bool(call.get("cached")),
+              "seconds": round(seconds, 6),
+              "bytesIn": call["bytesIn"],
+              "bytesOut": call["bytesOut"],
+              "requestedCost": cost.get("requestedQueryCost"),
+              "actualCost": cost.get("actualQueryCost"),
+              "available": available,
+              "retries": call["retries"],
+              "throttledSeconds": round(call["throttledSeconds"], 6),
+              "backoffSeconds": round(call["backoffSeconds"], 6),
+              "error": call["error"],
+            },
+            separators=(",", ":"),
+          )
+          + "\n"
+        )
+
+  def _operation_report(self, op: Dict[str, Any]) -> Dict[str, Any]:
+    latencies = sorted(op["latencies"])
+    buckets: Dict[str, int] = {}
+    i = 0
+    for bound in LATENCY_BUCKETS:
+      while i < len(latencies) and latencies[i] <= bound:
+        i += 1
+      buckets[str(bound)] = i
+    buckets["+Inf"] = len(latencies)
+    return {
+      "count": op["count"],
+      "cacheHits": op["cacheHits"],
+      "errors": dict(op["errors"]),
+      "retries": op["retries"],
+      "latencySeconds": {
+        "sum": round(sum(latencies), 6),
+        "p50": round(_percentile(latencies, 50), 6),
+        "p90": round(_percentile(latencies, 90), 6),
+        "p99": round(_percentile(latencies, 99), 6),
+        "max": round(latencies[-1], 6) if latencies else 0.0,
+        "buckets": buckets,
+      },
+      "bytesIn": op["bytesIn"],
+      "bytesOut": op["bytesOut"],
+      "requestedCost": op["requestedCost"],
+      "actualCost": op["actualCost"],
+      "throttledSeconds": round(op["throttledSeconds"], 6),
+      "backoffSeconds": round(op["backoffSeconds"], 6),
+    }
+
+  def report(self, products: int = 0) -> Dict[str, Any]:
+    with self._lock:
+      operations = {name: self._operation_report(op) for name, op in sorted(self._ops.items())}
+      throttle = dict(self._throttle)
+    totals: Dict[str, Any] = {"requests": 0, "cacheHits": 0, "retries": 0, "errors": {}, "bytesIn": 0, "bytesOut": 0}
+    totals.update(requestedCost=0.0, actualCost=0.0, throttledSeconds=0.0, backoffSeconds=0.0)
+    for op in operations.values():
+      totals["requests"] += op["count"]
+      for key in ("cacheHits", "retries", "bytesIn", "bytesOut", "requestedCost", "actualCost", "throttledSeconds", "backoffSeconds"):
+        totals[key] += op[key]
+      for error, n in op["errors"].items():
+        totals["errors"][error] = totals["errors"].get(error, 0) + n
+    totals["throttledSeconds"] = round(totals["throttledSeconds"], 6)
+    totals["backoffSeconds"] = round(totals["backoffSeconds"], 6)
+    return {
+      "elapsedSeconds": round(time.monotonic() - self.started_at, 3),
+      **totals,
+      "products": products,
+      "requestsPerProduct": round(totals["requests"] / products, 3) if products else None,
+      "actualCostPerProduct": round(totals["actualCost"] / products, 3) if products else None,
+      "throttle": throttle,
+      "operations": operations,
+    }
+
+  def prometheus(self, products: int = 0, prefix: str = "shopify_fetch") -> str:
+    """The report in Prometheus text exposition format (for a node_exporter textfile collector)."""
+    rep = self.report(products)
+    lines: List[str] = []
+
+    def family(name: str, kind: str, help_text: str) -> str:
+      metric = f"{prefix}_{name}"
+      lines.append(f"# HELP {metric} {help_text}")
+      lines.append(f"# TYPE {metric} {kind}")
+      return metric
+
+    def label(value: str) -> str:
+      return value.replace("\\", "\\\\").replace('"', '\\"')
+
+    metric = family("requests_total", "counter", "GraphQL requests by operation.")
+    for name, op in rep["operations"].items():
+      lines.append(f'{metric}{{operation="{label(name)}"}} {op["count"]}')
+    metric = family("request_errors_total", "counter", "GraphQL requests that ended in an error, by class.")
+    for name, op in rep["operations"].items():
+      for error, n in sorted(op["errors"].items()):
+        lines.append(f'{metric}{{operation="{label(name)}",error="{label(error)}"}} {n}')
+    metric = family("cache_hits_total", "counter", "Requests answered by the local response cache.")
+    for name, op in rep["operations"].items():
+      lines.append(f'{metric}{{operation="{label(name)}"}} {op["cacheHits"]}')
+    metric = family("request_retries_total", "counter", "Retries (throttled, HTTP or network) by operation.")
+    for name, op in rep["operations"].items():
+      lines.append(f'{metric}{{operation="{label(name)}"}} {op["retries"]}')
+    metric = family("request_duration_seconds", "histogram", "Wall time per request, retries included.")
+    for name, op in rep["operations"].items():
+      for bound, n in op["latencySeconds"]["buckets"].items():
+        lines.append(f'{metric}_bucket{{operation="{label(name)}",le="{bound}"}} {n}')
+      lines.append(f'{metric}_sum{{operation="{label(name)}"}} {op["latencySeconds"]["sum"]}')
+      lines.append(f'{metric}_count{{operation="{label(name)}"}} {op["count"]}')
+    for key, name, help_text in (
+      ("bytesIn", "response_bytes_total", "Response bytes received (as sent on the wire)."),
+      ("bytesOut", "request_bytes_total", "Request bytes sent."),
+      ("requestedCost", "requested_query_cost_total", "Sum of requestedQueryCost."),
+      ("actualCost", "actual_query_cost_total", "Sum of actualQueryCost."),
+      ("throttledSeconds", "throttled_seconds_total", "Time blocked waiting for the cost bucket."),
+      ("backoffSeconds", "backoff_seconds_total", "Time slept in retry backoff."),
+    ):
+      metric = family(name, "counter", help_text)
+      for op_name, op in rep["operations"].items():
+        lines.append(f'{metric}{{operation="{label(op_name)}"}} {op[key]}')
+    metric = family("products", "gauge", "Products written by the run.")
+    lines.append(f"{metric} {products}")
+    if rep["actualCostPerProduct"] is not None:
+      metric = family("actual_query_cost_per_product", "gauge", "actualQueryCost per product written.")
+      lines.append(f"{metric} {rep['actualCostPerProduct']}")
+    if rep["throttle"]["minAvailable"] is not None:
+      metric = family("throttle_min_available", "gauge", "Lowest currentlyAvailable reported by the server.")
+      lines.append(f"{metric} {rep['throttle']['minAvailable']}")
+    metric = family("elapsed_seconds", "gauge", "Run wall time.")
+    lines.append(f"{metric} {rep['elapsedSeconds']}")
+    return "\n".join(lines) + "\n"
+
+  def close(self) -> None:
+    if self._log is not None:
+      self._log.close()
+      self._log = None
+
+
+_REQUEST_METRICS: Optional[RequestMetrics] = None
+_RESPONSE_CACHE: Optional[ResponseCache] = None
+
+
+def set_request_metrics(metrics: Optional[RequestMetrics]) -> None:
+  """Install (or remove, with None) the process-wide recorder used by every GraphQLClient."""
+  global _REQUEST_METRICS
+  _REQUEST_METRICS = metrics
+
+
+def set_response_cache(cache: Optional[ResponseCache]) -> None:
+  """Install (or remove, with None) the process-wide response cache consulted by every GraphQLClient."""
+  global _RESPONSE_CACHE
+  _RESPONSE_CACHE = cache
+
+
+def _error_class(resp: Dict[str, Any]) -> Optional[str]:
+  for err in resp.get("errors") or []:
+    code = (err.get("extensions") or {}).get("code") if isinstance(err, dict) else None
+    return str(code or "GRAPHQL_ERROR")
+  return None
+
+
+class GraphQLClient:
+  """Admin GraphQL client with a pool of persistent keep-alive connections.
+
+  Replaces one `urllib.request.urlopen` (and one TCP/TLS handshake) per call: connections are reused
+  across products, pagination pages and introspection, responses are requested gzip-compressed and
+  the body is handed to `json.loads` as bytes. Throttling/retry semantics match `gql_post`.
+  """
+
+  def __init__(
+    self,
+    endpoint: str,
+    token: str,
+    max_connections: int = 16,
+    throttle: Optional[ThrottleBucket] = None,
+    ssl_context: Optional[ssl.SSLContext] = None,
+  ):
+    parts = urllib.parse.urlsplit(endpoint)
+    if parts.scheme not in ("http", "https"):
+      raise ValueError(f"Unsupported endpoint scheme: {endpoint}")
+    self.endpoint = endpoint
+    self.token = token
+    self.throttle = throttle or get_throttle_bucket(endpoint)
+    self._scheme = parts.scheme
+    self._host = parts.hostname or ""
+    self._port = parts.port
+    self._path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+    self._ssl_context = ssl_context
+    self._idle: "queue.LifoQueue[http.client.HTTPConnection]" = queue.LifoQueue(maxsize=max(1, max_connections))
+    self._headers = {
+      "Content-Type": "application/json",
+      "Accept": "application/json",
+      "Accept-Encoding": "gzip",
+      "Connection": "keep-alive",
+      "X-Shopify-Access-Token": token,
+    }
+
+  def _new_connection(self, timeout: float) -> http.client.HTTPConnection:
+    if self._scheme == "https":
+      return http.client.HTTPSConnection(
+        self._host, self._port, timeout=timeout, context=self._ssl_context or ssl.create_default_context()
+      )
+    return http.client.HTTPConnection(self._host, self._port, timeout=timeout)
+
+  def _checkout(self, timeout: float) -> Tuple[http.client.HTTPConnection, bool]:
+    try:
+      conn = self._idle.get_nowait()
+    except queue.Empty:
+      return self._new_connection(timeout), False
+    conn.timeout = timeout
+    if conn.sock is not None:
+      conn.sock.settimeout(timeout)
+    return conn, True
+
+  def _checkin(self, conn: http.client.HTTPConnection) -> None:
+    try:
+      self._idle.put_nowait(conn)
+    except queue.Full:
+      conn.close()
+
+  def _send(self, body: bytes, timeout: float) -> Tuple[int, http.client.HTTPMessage, bytes, int]:
+    conn, reused = self._checkout(timeout)
+    try:
+      conn.request("POST", self._path, body=body, headers=self._headers)
+      resp = conn.getresponse()
+      raw = resp.read()
+    except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+      conn.close()
+      if not reused:
+        raise
+      # The server closed an idle keep-alive connection; retry once on a fresh one.
+      conn = self._new_connection(timeout)
+      try:
+        conn.request("POST", self._path, body=body, headers=self._headers)
+        resp = conn.getresponse()
+        raw = resp.read()
+      except Exception:
+        conn.close()
+        raise
+    except Exception:
+      conn.close()
+      raise
+
+    if resp.will_close:
+      conn.close()
+    else:
+      self._checkin(conn)
+
+    wire_bytes = len(raw)
+    if (resp.headers.get("Content-Encoding") or "").lower() == "gzip":
+      raw = gzip.decompress(raw)
+    return resp.status, resp.headers, raw, wire_bytes
+
+  def post(
+    self,
+    query: str,
+    variables: Optional[Dict[str, Any]] = None,
+    timeout: float = 60,
+    max_retries: int = 5,
+    throttle: Optional[ThrottleBucket] = None,
+  ) -> Dict[str, Any]:
+    metrics = _REQUEST_METRICS
+    call: Dict[str, Any] = {
+      "cached": False,
+      "bytesIn": 0,
+      "bytesOut": 0,
+      "retries": 0,
+      "throttledSeconds": 0.0,
+      "backoffSeconds": 0.0,
+      "cost": None,
+      "error": None,
+    }
+    started = time.perf_counter()
+    cache = _RESPONSE_CACHE
+    cache_key = cache.key(self.endpoint, query, variables) if cache is not None and cache.cacheable(query) else None
+    try:
+      result = cache.get(cache_key) if cache is not None and cache_key is not None else None
+      if result is not None:
+        call["cached"] = True
+      else:
+        result = self._post(query, variables, timeout, max_retries, throttle or self.throttle, call)
+        if cache is not None and cache_key is not None and not result.get("errors"):
+          cache.put(cache_key, call["raw"])
+    except urllib.error.HTTPError as e:
+      call["error"] = f"HTTP {e.code}"
+      raise
+    except Exception as e:
+      call["error"] = type(e).__name__
+      raise
+    else:
+      call["error"] = _error_class(result)
+      return result
+    finally:
+      if metrics is not None:
+        metrics.record(query, time.perf_counter() - started, call)
+
+  def _post(
+    self,
+    query: str,
+    variables: Optional[Dict[str, Any]],
+    timeout: float,
+    max_retries: int,
+    bucket: ThrottleBucket,
+    call: Dict[str, Any],
+  ) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {"query": query}
+    if variables is not None:
+      payload["variables"] = variables
+    body = json.dumps(payload).encode("utf-8")
+
+    attempt = 0
+    while True:
+      call["retries"] = attempt
+      reserved = bucket.estimate(query)
+      call["throttledSeconds"] += bucket.acquire(reserved)
+      call["bytesOut"] += len(body)
+      try:
+        status, headers, raw, wire_bytes = self._send(body, timeout)
+      except (OSError, http.client.HTTPException):
+        bucket.release(reserved)
+        if attempt < max_retries:
+          delay = _backoff_delay(attempt)
+          call["backoffSeconds"] += delay
+          time.sleep(delay)
+          attempt += 1
+          continue
+        raise
+      call["bytesIn"] += wire_bytes
+
+      if status >= 400:
+        bucket.release(reserved)
+        if status in RETRYABLE_HTTP_STATUSES and attempt < max_retries:
+          delay = _backoff_delay(attempt, headers.get("Retry-After"))
+          call["backoffSeconds"] += delay
+          time.sleep(delay)
+          attempt += 1
+          continue
+        raise urllib.error.HTTPError(self.endpoint, status, f"HTTP {status}", headers, io.BytesIO(raw))
+
+      result = json.loads(raw)
+      call["raw"] = raw
+      call["cost"] = (result.get("extensions") or {}).get("cost")
+      bucket.observe(query, reserved, result.get("extensions"))
+      if _is_throttled(result) and attempt < max_retries:
+        # Wait for the server bucket to refill; jitter keeps concurrent workers from retrying in lockstep.
+        delay = bucket.throttled_delay(result.get("extensions"), reserved) + _backoff_delay(attempt) / 4
+        call["throttledSeconds"] += delay
+        time.sleep(delay)
+        attempt += 1
+        continue
+      return result
+
+  def close(self) -> None:
+    while True:
+      try:
+        self._idle.get_nowait().close()
+      except queue.Empty:
+        return
+
+
+_CLIENTS: Dict[Tuple[str, str], GraphQLClient] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def get_client(endpoint: str, token: str) -> GraphQLClient:
+  """Process-wide pooled client per (endpoint, token), shared by all worker threads."""
+  with _CLIENTS_LOCK:
+    client = _CLIENTS.get((endpoint, token))
+    if client is None:
+      client = GraphQLClient(endpoint, token)
+      _CLIENTS[(endpoint, token)] = client
+    return client
+
+
+def close_clients() -> None:
+  with _CLIENTS_LOCK:
+    for client in _CLIENTS.values():
+      client.close()
+    _CLIENTS.clear()
+
+
+def gql_post(
+  endpoint: str,
+  token: str,
+  query: str,
+  variables: Optional[Dict[str, Any]] = None,
+  timeout: int = 60,
+  throttle: Optional[ThrottleBucket] = None,
+  max_retries: int = 5,
+) -> Dict[str, Any]:
+  return get_client(endpoint, token).post(
+    query, variables=variables, timeout=timeout, max_retries=max_retries, throttle=throttle
+  )
+
+
+def pick_test_set(report: Dict[str, Any], vendor_count: int, seed: int, pick_mode: str = "random") -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    vendors = report.get("vendors") or []
+    if not vendors:
+        raise RuntimeError("vendor_samples_report.json has no vendors")
+
+    # Only vendors that have at least 1 sampled product
+    eligible = [v for v in vendors if (v.get("sampled") or [])]
+    if len(eligible) < vendor_count:
+        vendor_count = len(eligible)
+
+    if pick_mode == "report-order":
+        chosen_vendors = eligible[:vendor_count]
+    else:
+        chosen_vendors = rng.sample(eligible, vendor_count)
+
+    picked: List[Dict[str, Any]] = []
+    for v in chosen_vendors:
+        sampled = v.get("sampled") or []
+        # Ensure deterministic ordering per vendor for stable output
+        sampled = list(sampled)
+        # If a vendor has >3 sampled in report (shouldn't), take first 3
+        sampled = sampled[:3]
+        picked.append({"vendor": v.get("vendor"), "sampled": sampled, "productCountInFile": v.get("productCountInFile")})
+
+    # Sort by vendor name for readability + stable diffing
+    picked.sort(key=lambda x: (x.get("vendor") or ""))
+    return picked
+
+
+PRODUCT_FIELDS_INTROSPECTION = r'''
+query ProductFields {
+  __type(name: "Product") {
+    name
+    fields {
+      name
+      args {
+        name
+        defaultValue
+        type {
+          kind
+          name
+          ofType {
+            kind
+            name
+            ofType {
+              kind
+              name
+              ofType {
+                kind
+                name
+              }
+            }
+          }
+        }
+      }
+      type {
+        kind
+        name
+        ofType {
+          kind
+          name
+          ofType {
+            kind
+            name
+            ofType {
+              kind
+              name
+            }
+          }
+        }
+      }
+    }
+  }
+}
+'''
+
+
+PRODUCT_DETAILS_QUERY = r'''
+query ProductDetails($id: ID!) {
+  product(id: $id) {
+    id
+    legacyResourceId
+    title
+    handle
+    status
     vendor
     productType
     description
@@ -545,88 +2079,1433 @@ query ProductDetails($id: ID!) {
 }
 '''
 
-
-PRODUCT_METAFIELDS_PAGE_QUERY = r'''
-query ProductMetafieldsPage($id: ID!, $after: String) {
-  product(id: $id) {
-    metafields(first: 250, after: $after) {
-      nodes {
-        id
-        namespace
-        key
-        type
-        value
-        jsonValue
-        createdAt
-        updatedAt
-        ownerType
-        definition {
-          id
-          name
-          namespace
-          key
-          type { name }
-        }
-      }
-      pageInfo {
-        hasNextPage
-        endCursor
-      }
-    }
-  }
+# Named projections of PRODUCT_DETAILS_QUERY (dotted paths; connections are entered through `nodes`
+# implicitly, so `variants.price` means `variants { nodes { price } }`). `full` is the query unchanged, unless
+# --fields narrows it to just the given fields.
+PROJECTION_PROFILES: Dict[str, Optional[List[str]]] = {
+  "full": None,
+  "pricing": [
+    "handle",
+    "status",
+    "vendor",
+    "priceRangeV2",
+    "compareAtPriceRange",
+    "variants.id",
+    "variants.sku",
+    "variants.title",
+    "variants.price",
+    "variants.compareAtPrice",
+    "variants.taxable",
+    "variants.unitPrice",
+    "variants.selectedOptions",
+    "variants.inventoryItem.unitCost",
+  ],
+  "inventory": [
+    "handle",
+    "status",
+    "vendor",
+    "totalInventory",
+    "hasOnlyDefaultVariant",
+    "variants.id",
+    "variants.sku",
+    "variants.barcode",
+    "variants.inventoryQuantity",
+    "variants.availableForSale",
+    "variants.inventoryPolicy",
+    "variants.inventoryItem.id",
+    "variants.inventoryItem.tracked",
+  ],
+  "seo": [
+    "handle",
+    "status",
+    "description",
+    "tags",
+    "seo",
+    "featuredImage.url",
+    "featuredImage.altText",
+    "images.url",
+    "images.altText",
+  ],
+  "metafields-only": [
+    "metafields.id",
+    "metafields.namespace",
+    "metafields.key",
+    "metafields.type",
+    "metafields.value",
+    "metafields.updatedAt",
+  ],
 }
-'''
 
+# Kept in every projection: `id` for batching/pagination/checkpoints, `updatedAt` for --store,
+# `title` for the per-vendor summary.
+PROJECTION_ALWAYS = ("id", "title", "updatedAt")
 
-PRODUCT_VARIANTS_PAGE_QUERY = r'''
-query ProductVariantsPage($id: ID!, $after: String) {
-  product(id: $id) {
-    variants(first: 100, after: $after) {
-      nodes {
-        id
-        legacyResourceId
-        title
-        sku
-        barcode
-        price
-        compareAtPrice
-        taxable
-        inventoryQuantity
-        availableForSale
-        inventoryPolicy
-        requiresComponents
-        unitPrice { amount currencyCode }
-        unitPriceMeasurement {
-          measuredType
-          quantityUnit
-          quantityValue
-          referenceUnit
-          referenceValue
-        }
 
-        selectedOptions { name value }
+def _projection_tree(paths: Iterable[str]) -> Dict[str, Any]:
+  """Dotted paths -> nested dict; `True` marks a field kept with its whole selection."""
+  tree: Dict[str, Any] = {}
+  for path in paths:
+    parts = [p for p in path.strip().split(".") if p]
+    node = tree
+    for i, part in enumerate(parts):
+      if i == len(parts) - 1:
+        node[part] = True
+      elif node.get(part) is True:
+        break
+      else:
+        node = node.setdefault(part, {})
+  return tree
 
-        image { id url altText width height }
 
-        inventoryItem {
-          id
-          tracked
-          unitCost { amount currencyCode }
-        }
-      }
-      pageInfo {
-        hasNextPage
-        endCursor
-      }
-    }
-  }
-}
-'''
+def _project_selections(
+  query: str,
+  selections: List[Dict[str, Any]],
+  tree: Dict[str, Any],
+  indent: str,
+  prefix: str,
+  missing: List[str],
+  transparent: Optional[str] = None,
+) -> Tuple[List[str], set]:
+  """Render the selections named by `tree`. Returns (lines, keys of `tree` that were found).
 
+  Paths that do not exist below a found field are appended to `missing`; `transparent` names a field
+  (a connection's `nodes`) that is entered without appearing in those paths.
+  """
+  lines: List[str] = []
+  found: set = set()
+  for sel in selections:
+    if sel.get("kind") == "inline":
+      sub_lines, sub_found = _project_selections(query, sel["selections"], tree, indent + "  ", prefix, missing, transparent)
+      found |= sub_found
+      if sub_lines:
+        head = f"... on {sel['typeCondition']}" if sel.get("typeCondition") else "..."
+        lines.append(f"{indent}{head} {{\n" + "\n".join(sub_lines) + f"\n{indent}}}")
+      continue
+    if sel.get("kind") != "field":
+      continue
+    key = sel["alias"] or sel["name"]
+    want = tree.get(key)
+    if want is None:
+      continue
+    found.add(key)
+    path = prefix if key == transparent else f"{prefix}{key}."
+    if want is True or not sel["selections"]:
+      if want is not True:
+        missing.extend(path + k for k in want)
+      lines.append(indent + _field_source(query, sel).replace("\n", "\n" + indent))
+      continue
+    children = {c.get("alias") or c.get("name") for c in sel["selections"] if c.get("kind") == "field"}
+    sub = dict(want)
+    nodes = None
+    if "nodes" in children and not ({"nodes", "edges", "pageInfo"} & set(sub)):
+      sub, nodes = {"nodes": sub}, "nodes"
+    if "pageInfo" in children:
+      sub["pageInfo"] = True  # keeps the connection paginatable (see product_connections)
+    sub_lines, sub_found = _project_selections(query, sel["selections"], sub, indent + "  ", path, missing, nodes)
+    missing.extend(path + k for k in sub if k not in sub_found)
+    head = query[sel["span"][0] : query.index("{", sel["span"][0])].rstrip()
+    lines.append(f"{indent}{head} {{\n" + "\n".join(sub_lines) + f"\n{indent}}}")
+  return lines, found
 
-def main() -> int:
-  ap = argparse.ArgumentParser(
-    description="Fetch Shopify product details for 10 test vendors x 3 products each via Admin GraphQL (CLI can't fetch API objects)."
+
+def project_product_query(product_query: str, fields: Iterable[str]) -> str:
+  """Cut a `product(id: $id)` query down to `fields` (dotted paths, see PROJECTION_PROFILES).
+
+  Kept fields are copied from the source text, so arguments and page sizes are unchanged, and kept
+  connections keep their `pageInfo` so the follow-up page queries use the same projection. Raises
+  ValueError for paths that are not in the query.
+  """
+  doc = parse_graphql(product_query)
+  if doc["fragments"]:
+    raise ValueError("Field projection does not support queries with named fragments")
+  product_field = next(
+    s for s in doc["operations"][0]["selections"] if s.get("kind") == "field" and s["name"] == "product"
+  )
+  tree = _projection_tree(list(PROJECTION_ALWAYS) + list(fields))
+  missing: List[str] = []
+  lines, found = _project_selections(product_query, product_field["selections"], tree, "    ", "", missing)
+  missing.extend(k for k in tree if k not in found)
+  if missing:
+    raise ValueError(f"Unknown projection fields: {', '.join(sorted(set(missing)))}")
+  start = product_field["span"][0]
+  head = product_query[: product_query.index("{", start) + 1]
+  return head + "\n" + "\n".join(lines) + "\n  }\n}\n"
+
+
+def product_connections(product_query: str) -> List[Dict[str, Any]]:
+  """Find the paginatable connections of a `product(id: $id)` query and build a page query for each.
+
+  A connection qualifies when it is a top-level Product field with a literal `first:` and selects
+  `pageInfo { hasNextPage endCursor }`. Its page query repeats the field exactly as generated (same
+  alias, arguments and node selection) with `after: $after` added, so follow-up pages have the shape
+  of the first one. Returns [{"key", "name", "query", "estimatedCost"}] in selection order.
+  """
+  doc = parse_graphql(product_query)
+  product_field = next(
+    s for s in doc["operations"][0]["selections"] if s.get("kind") == "field" and s["name"] == "product"
+  )
+
+  out: List[Dict[str, Any]] = []
+  for sel in product_field["selections"]:
+    if sel.get("kind") != "field" or not isinstance(sel["args"].get("first"), int) or "after" in sel["args"]:
+      continue
+    page_info = next((c for c in sel["selections"] if c.get("kind") == "field" and c["name"] == "pageInfo"), None)
+    if page_info is None or not any(c.get("name") == "endCursor" for c in page_info["selections"]):
+      continue
+    head = product_query[sel["span"][0] : product_query.index("{", sel["span"][0])].rstrip()
+    paren = head.index("(")
+    head = head[: paren + 1] + "after: $after, " + head[paren + 1 :]
+    inner = _inner_selection_text(product_query, sel).replace("\n", "\n      ")
+    key = sel["alias"] or sel["name"]
+    name = f"Product{key[:1].upper()}{key[1:]}Page"
+    query = (
+      f"query {name}($id: ID!, $after: String) {{\n  product(id: $id) {{\n    {head} {{\n      {inner}\n    }}\n  }}\n}}"
+    )
+    fragments_text = _fragments_source(product_query, doc, [sel])
+    if fragments_text:
+      query += "\n\n" + fragments_text
+    out.append({"key": key, "name": sel["name"], "query": query, "estimatedCost": estimate_query_cost(query)})
+  return out
+
+
+class ConnectionPaginator:
+  """Walks every paginatable connection of a product until `hasNextPage` is false, under cost budgets.
+
+  The connections of one product are independent, so they are paginated concurrently; all requests go
+  through `gql_post`, i.e. the shared client pool and throttle bucket. Before each page its estimated
+  cost is reserved against the per-product and per-run budgets (0 = unlimited) and settled with the
+  server's `actualQueryCost` afterwards (later pages of that connection reserve the observed cost); a connection whose next page does not fit stops there with
+  `<key>PaginationStopped` in extensions and its real `pageInfo` kept.
+  """
+
+  def __init__(
+    self,
+    endpoint: str,
+    token: str,
+    connections: List[Dict[str, Any]],
+    product_budget: float = 0.0,
+    run_budget: float = 0.0,
+    max_pages: int = 200,
+  ):
+    self.endpoint = endpoint
+    self.token = token
+    self.connections = connections
+    self.product_budget = float(product_budget)
+    self.run_budget = float(run_budget)
+    self.max_pages = int(max_pages)
+    self.run_spent = 0.0
+    self.pages = 0
+    self.stopped: Dict[str, int] = {}
+    self._lock = threading.Lock()
+
+  def _reserve(self, spent: List[float], cost: float) -> Optional[str]:
+    with self._lock:
+      if self.product_budget and spent[0] + cost > self.product_budget:
+        return "productBudget"
+      if self.run_budget and self.run_spent + cost > self.run_budget:
+        return "runBudget"
+      spent[0] += cost
+      self.run_spent += cost
+      return None
+
+  def _settle(self, spent: List[float], reserved: float, resp: Dict[str, Any]) -> float:
+    actual = (((resp.get("extensions") or {}).get("cost") or {}).get("actualQueryCost"))
+    charged = float(actual) if actual is not None else reserved
+    with self._lock:
+      spent[0] += charged - reserved
+      self.run_spent += charged - reserved
+      self.pages += 1
+    return charged
+
+  def needs_pages(self, product: Dict[str, Any]) -> bool:
+    """Whether any of `product`'s paginated connections has a follow-up page."""
+    return any(
+      isinstance(product.get(c["key"]), dict) and (product[c["key"]].get("pageInfo") or {}).get("hasNextPage")
+      for c in self.connections
+    )
+
+  def paginate(
+    self,
+    pid: Any,
+    product: Dict[str, Any],
+    on_page: Optional[Callable[[str, List[Any], Dict[str, Any]], None]] = None,
+    start_pages: Optional[Dict[str, int]] = None,
+  ) -> Dict[str, Any]:
+    """Complete `product`'s connections in place; returns the extensions to record (errors, stops)."""
+    spent = [0.0]
+    start_pages = start_pages or {}
+
+    def walk(conn: Dict[str, Any]) -> Dict[str, Any]:
+      key = conn["key"]
+      container = product.get(key)
+      items_key = "edges" if "edges" in container and "nodes" not in container else "nodes"
+      items = list(container.get(items_key) or [])
+      page_info = container.get("pageInfo") or {}
+      pages = start_pages.get(key, 1)
+      max_pages = int(conn.get("maxPages") or self.max_pages)
+      # Reserve the static estimate for the first page, then what the server actually charged.
+      cost = conn["estimatedCost"]
+      ext: Dict[str, Any] = {}
+      try:
+        while page_info.get("hasNextPage") and page_info.get("endCursor"):
+          if pages >= max_pages:
+            ext[f"{key}PaginationStopped"] = "maxPages"
+            break
+          reason = self._reserve(spent, cost)
+          if reason:
+            ext[f"{key}PaginationStopped"] = reason
+            break
+          page = gql_post(
+            self.endpoint,
+            self.token,
+            conn["query"],
+            variables={"id": pid, "after": page_info["endCursor"]},
+            timeout=120,
+          )
+          cost = self._settle(spent, cost, page)
+          if page.get("errors"):
+            ext[f"{key}PaginationErrors"] = page["errors"]
+            break
+          c2 = ((page.get("data") or {}).get("product") or {}).get(key) or {}
+          new_items = c2.get(items_key) or []
+          items.extend(new_items)
+          page_info = c2.get("pageInfo") or {}
+          pages += 1
+          if on_page is not None:
+            on_page(key, new_items, page_info)
+          if conn.get("delay"):
+            time.sleep(float(conn["delay"]))
+      except Exception as e:
+        ext[f"{key}PaginationException"] = str(e)
+      product[key] = {**container, items_key: items, "pageInfo": page_info}
+      product[f"{key}CountFetched"] = len(items)
+      stopped = ext.get(f"{key}PaginationStopped")
+      if stopped:
+        with self._lock:
+          self.stopped[stopped] = self.stopped.get(stopped, 0) + 1
+      return ext
+
+    todo = [c for c in self.connections if isinstance(product.get(c["key"]), dict)]
+    if len(todo) > 1:
+      with ThreadPoolExecutor(max_workers=len(todo)) as ex:
+        results = list(ex.map(walk, todo))
+    else:
+      results = [walk(c) for c in todo]
+    merged: Dict[str, Any] = {}
+    for ext in results:
+      merged.update(ext)
+    return merged
+
+  def summary(self) -> Dict[str, Any]:
+    return {
+      "connections": [c["key"] for c in self.connections],
+      "productBudget": self.product_budget or None,
+      "runBudget": self.run_budget or None,
+      "maxPages": self.max_pages,
+      "pages": self.pages,
+      "costSpent": self.run_spent,
+      "stopped": dict(self.stopped),
+    }
+
+
+def fetch_product_entry(
+  endpoint: str,
+  token: str,
+  sample: Dict[str, Any],
+  query_to_use: str,
+  base_resp: Optional[Dict[str, Any]] = None,
+  query_parts: Optional[List[str]] = None,
+  checkpoint: Optional["FetchCheckpoint"] = None,
+  paginator: Optional[ConnectionPaginator] = None,
+) -> Dict[str, Any]:
+  """Fetch one sampled product: base query, then follow-up pages of its connections via `paginator`.
+
+  Self-contained so it can run on worker threads; returns the per-product output entry.
+  `base_resp` skips the base query when the product already came back from a batch request;
+  `query_parts` replaces the base query with a cost-planned split query. The paginator completes the
+  product's connections concurrently (metafields, plus variants with --paginate-variants, or all of them
+  with --paginate-connections). With a `checkpoint`, every follow-up page is journaled, and a product left half-paginated by an earlier run continues from
+  its last cursor instead of starting over.
+  """
+  pid = sample.get("productId")
+
+  resumed = checkpoint.resume_state(pid) if checkpoint is not None else None
+  start_pages: Dict[str, int] = {}
+  if resumed is not None:
+    resp, start_pages = resumed
+  elif base_resp is not None:
+    resp = base_resp
+  elif query_parts and len(query_parts) > 1:
+    resp = fetch_product_parts(endpoint, token, pid, query_parts)
+  else:
+    resp = gql_post(endpoint, token, query_to_use, variables={"id": pid}, timeout=120)
+
+  product = (resp.get("data") or {}).get("product")
+  if isinstance(product, dict):
+    # Always record how many variants the base response carried, whether or not they are paginated.
+    variants = product.get("variants")
+    if isinstance(variants, dict) and isinstance(variants.get("nodes"), list):
+      product["variantsCountFetched"] = len(variants["nodes"])
+    if paginator is not None:
+      on_page = None
+      if checkpoint is not None:
+        # The base response is journaled before the paginator threads start mutating `product`, and
+        # only when a follow-up page exists: products that need none cost one journal line (their entry).
+        if resumed is None and paginator.needs_pages(product):
+          checkpoint.record_base(pid, resp)
+        on_page = functools.partial(checkpoint.record_page, pid)
+      extensions = paginator.paginate(pid, product, on_page=on_page, start_pages=start_pages)
+      if extensions:
+        resp.setdefault("extensions", {}).update(extensions)
+
+  return {
+    "productId": pid,
+    "productLineInJsonl": sample.get("productLine"),
+    "graphql": resp,
+  }
+
+
+MAX_NODES_PER_QUERY = 250
+_BATCH_TYPENAME_ALIAS = "_batchTypename"
+
+
+def _product_selection(product_query: str) -> str:
+  """Return the selection set body of `product(id: $id) { ... }` in a single-product query."""
+  start = product_query.find("product(id: $id)")
+  if start < 0:
+    raise ValueError("Query has no product(id: $id) field")
+  open_idx = product_query.index("{", start)
+  depth = 0
+  for i in range(open_idx, len(product_query)):
+    ch = product_query[i]
+    if ch == "{":
+      depth += 1
+    elif ch == "}":
+      depth -= 1
+      if depth == 0:
+        return product_query[open_idx + 1 : i]
+  raise ValueError("Unbalanced braces in product query")
+
+
+def build_batch_query(product_query: str) -> str:
+  """Turn a single-product query into a `nodes(ids:)` query with the same Product selection.
+
+  The node type is read through an alias (stripped again in `split_batch_response`) so the
+  per-product payload keeps exactly the keys of the single-product query. Fragments the selection
+  spreads are carried over.
+  """
+  selection = _product_selection(product_query)
+  query = (
+    "query ProductDetailsBatch($ids: [ID!]!) {\n  nodes(ids: $ids) {\n    ... on Product {"
+    + selection
+    + f"}}\n    {_BATCH_TYPENAME_ALIAS}: __typename\n  }}\n}}"
+  )
+  doc = parse_graphql(product_query)
+  product_field = next(
+    s for s in doc["operations"][0]["selections"] if s.get("kind") == "field" and s["name"] == "product"
+  )
+  fragments_text = _fragments_source(product_query, doc, product_field["selections"])
+  if fragments_text:
+    query += "\n\n" + fragments_text
+  return query
+
+
+def choose_batch_size(single_query_cost: Optional[float], max_query_cost: float = MAX_SINGLE_QUERY_COST) -> int:
+  """Largest N such that N products (plus the `nodes` field itself) stay under `max_query_cost`."""
+  if not single_query_cost or single_query_cost <= 0:
+    return 1
+  n = int((max_query_cost - 1) // float(single_query_cost))
+  return max(1, min(MAX_NODES_PER_QUERY, n))
+
+
+def split_batch_response(resp: Dict[str, Any], count: int) -> List[Dict[str, Any]]:
+  """Split a `nodes(ids:)` response into per-product responses shaped like `product(id:)` ones.
+
+  Errors are routed by their `["nodes", i, ...]` path and rewritten to `["product", ...]`.
+  """
+  nodes = (resp.get("data") or {}).get("nodes") or []
+  out: List[Dict[str, Any]] = []
+  for i in range(count):
+    node = nodes[i] if i < len(nodes) else None
+    if isinstance(node, dict):
+      if node.get(_BATCH_TYPENAME_ALIAS) != "Product":
+        node = None
+      else:
+        node = {k: v for k, v in node.items() if k != _BATCH_TYPENAME_ALIAS}
+    single: Dict[str, Any] = {"data": {"product": node}}
+    errors = []
+    for err in resp.get("errors") or []:
+      path = (err or {}).get("path") or []
+      if len(path) >= 2 and path[0] == "nodes" and path[1] == i:
+        errors.append({**err, "path": ["product"] + list(path[2:])})
+    if errors:
+      single["errors"] = errors
+    if resp.get("extensions") is not None:
+      single["extensions"] = {**resp["extensions"], "batch": {"size": count, "index": i}}
+    out.append(single)
+  return out
+
+
+def fetch_product_batch(
+  endpoint: str,
+  token: str,
+  samples: List[Dict[str, Any]],
+  query_to_use: str,
+  batch_query: str,
+  checkpoint: Optional["FetchCheckpoint"] = None,
+  paginator: Optional[ConnectionPaginator] = None,
+) -> List[Dict[str, Any]]:
+  """Fetch several products with one `nodes(ids:)` request, then paginate each one as needed.
+
+  Metafield/variant follow-up pages are only requested per product when `hasNextPage` is true. If the
+  batch request fails as a whole (no data, e.g. MAX_COST_EXCEEDED) every product falls back to the
+  single-product path.
+  """
+  ids = [s.get("productId") for s in samples]
+  resp = gql_post(endpoint, token, batch_query, variables={"ids": ids}, timeout=120)
+  if not isinstance((resp.get("data") or {}).get("nodes"), list):
+    return [
+      fetch_product_entry(endpoint, token, s, query_to_use, checkpoint=checkpoint, paginator=paginator)
+      for s in samples
+    ]
+
+  return [
+    fetch_product_entry(
+      endpoint, token, s, query_to_use, base_resp=single, checkpoint=checkpoint, paginator=paginator
+    )
+    for s, single in zip(samples, split_batch_response(resp, len(samples)))
+  ]
+
+
+BULK_RUN_QUERY_MUTATION = r'''
+mutation BulkProducts($query: String!) {
+  bulkOperationRunQuery(query: $query) {
+    bulkOperation { id status }
+    userErrors { field message }
+  }
+}
+'''
+
+
+BULK_OPERATION_STATUS_QUERY = r'''
+query BulkOperationStatus($id: ID!) {
+  node(id: $id) {
+    ... on BulkOperation {
+      id
+      status
+      errorCode
+      objectCount
+      fileSize
+      url
+      partialDataUrl
+    }
+  }
+}
+'''
+
+
+# Bulk operations allow at most 5 connections per query; `products` itself is one of them.
+BULK_MAX_NESTED_CONNECTIONS = 4
+
+# Product ids per `products(query: "id:... OR id:...")` search; longer id lists become several bulk
+# operations so the search string stays well under Shopify's query length limit.
+BULK_MAX_IDS_PER_SEARCH = 250
+
+# Child rows in a bulk JSONL only carry `__parentId`; the connection they belong to is recovered
+# from the gid resource type of the row.
+BULK_GID_TYPE_TO_CONNECTION = {
+  "Metafield": "metafields",
+  "ProductVariant": "variants",
+  "Collection": "collections",
+  "ProductImage": "images",
+  "Image": "images",
+  "MediaImage": "media",
+  "Video": "media",
+  "ExternalVideo": "media",
+  "Model3d": "media",
+  "ResourcePublication": "resourcePublications",
+  "ResourcePublicationV2": "resourcePublicationsV2",
+  "SellingPlanGroup": "sellingPlanGroups",
+}
+
+
+def _gid_type(gid: Any) -> str:
+  parts = str(gid or "").split("/")
+  return parts[3] if len(parts) > 4 and parts[0] == "gid:" else ""
+
+
+def _inner_selection_text(query: str, field: Dict[str, Any]) -> str:
+  text = query[field["span"][0] : field["span"][1]]
+  inner = textwrap.dedent(text[text.index("{") + 1 : text.rindex("}")].strip("\n")).strip()
+  return "\n".join(line.rstrip() for line in inner.split("\n"))
+
+
+def build_bulk_product_queries(product_query: str, product_ids: List[str]) -> List[Dict[str, Any]]:
+  """Translate a `product(id: $id)` query into bulk `products(query:)` queries for the given ids.
+
+  Connections become `edges { node { ... } }` without pagination arguments. When there are more
+  connections than a bulk query allows, the largest (by page size) stay in the first query and the rest
+  are spread over extra queries that only select `id` plus their connections. The ids are searched in
+  chunks of BULK_MAX_IDS_PER_SEARCH, so every plan has one query per chunk (same chunk order in all plans).
+  Returns [{"queries": [str], "connections": [names], "pageInfo": [names selecting pageInfo],
+  "pageSizes": {name: first}}], main plan first.
+  """
+  doc = parse_graphql(product_query)
+  product_field = next(
+    s for s in doc["operations"][0]["selections"] if s.get("kind") == "field" and s["name"] == "product"
+  )
+
+  plain: List[str] = []
+  plain_sels: List[Dict[str, Any]] = []
+  connections: List[Tuple[int, str, str, Dict[str, Any]]] = []
+  with_page_info: List[str] = []
+  for sel in product_field["selections"]:
+    if sel.get("kind") != "field":
+      continue
+    size = sel["args"].get("first") if isinstance(sel["args"].get("first"), int) else None
+    nodes = next((c for c in sel["selections"] if c.get("kind") == "field" and c["name"] == "nodes"), None)
+    if size is None or nodes is None:
+      plain.append(_field_source(product_query, sel))
+      plain_sels.append(sel)
+      continue
+    node_sel = _inner_selection_text(product_query, nodes).replace("\n", "\n      ")
+    key = sel["alias"] or sel["name"]
+    if any(c.get("kind") == "field" and c["name"] == "pageInfo" for c in sel["selections"]):
+      with_page_info.append(key)
+    head = f"{key}: {sel['name']}" if sel["alias"] else key
+    connections.append((size, key, f"{head} {{\n  edges {{\n    node {{\n      {node_sel}\n    }}\n  }}\n}}", sel))
+
+  ordered = sorted(connections, key=lambda c: -c[0])
+  groups = [ordered[i : i + BULK_MAX_NESTED_CONNECTIONS] for i in range(0, len(ordered), BULK_MAX_NESTED_CONNECTIONS)] or [[]]
+
+  numeric_ids = [pid.rsplit("/", 1)[-1] for pid in product_ids]
+  searches = [
+    " OR ".join(f"id:{n}" for n in numeric_ids[i : i + BULK_MAX_IDS_PER_SEARCH])
+    for i in range(0, len(numeric_ids), BULK_MAX_IDS_PER_SEARCH)
+  ] or [""]
+
+  out: List[Dict[str, Any]] = []
+  for gi, group in enumerate(groups):
+    fields = (plain if gi == 0 else ["id"]) + [c[2] for c in group]
+    body = "\n".join(fields).replace("\n", "\n        ")
+    fragments_text = _fragments_source(product_query, doc, (plain_sels if gi == 0 else []) + [c[3] for c in group])
+    queries = []
+    for search in searches:
+      query = (
+        "{\n  products(query: " + json.dumps(search) + ") {\n    edges {\n      node {\n        "
+        + body
+        + "\n      }\n    }\n  }\n}"
+      )
+      if fragments_text:
+        query += "\n\n" + fragments_text
+      queries.append(query)
+    out.append({
+      "queries": queries,
+      "connections": [c[1] for c in group],
+      "pageInfo": [c[1] for c in group if c[1] in with_page_info],
+      "pageSizes": {c[1]: c[0] for c in group},
+    })
+  return out
+
+
+def run_bulk_operation(endpoint: str, token: str, bulk_query: str, timeout_seconds: float = 3600) -> Dict[str, Any]:
+  """Submit a bulk query and poll (with backoff) until it finishes. Returns the BulkOperation node."""
+  resp = gql_post(endpoint, token, BULK_RUN_QUERY_MUTATION, variables={"query": bulk_query}, timeout=120)
+  payload = (resp.get("data") or {}).get("bulkOperationRunQuery") or {}
+  if resp.get("errors") or payload.get("userErrors"):
+    raise RuntimeError(f"bulkOperationRunQuery failed: {resp.get('errors') or payload.get('userErrors')}")
+  op = payload.get("bulkOperation") or {}
+  op_id = op.get("id")
+  if not op_id:
+    raise RuntimeError(f"bulkOperationRunQuery returned no operation: {resp}")
+
+  deadline = time.monotonic() + timeout_seconds
+  delay = 1.0
+  while True:
+    status_resp = gql_post(endpoint, token, BULK_OPERATION_STATUS_QUERY, variables={"id": op_id}, timeout=60)
+    op = (status_resp.get("data") or {}).get("node") or {}
+    status = op.get("status")
+    if status == "COMPLETED":
+      return op
+    if status in ("FAILED", "CANCELED", "CANCELING", "EXPIRED"):
+      raise RuntimeError(f"Bulk operation {op_id} ended with {status} ({op.get('errorCode')})")
+    if time.monotonic() + delay > deadline:
+      raise TimeoutError(f"Bulk operation {op_id} still {status} after {timeout_seconds:.0f}s")
+    time.sleep(delay)
+    delay = min(15.0, delay * 1.5)
+
+
+@contextlib.contextmanager
+def open_bulk_stream(source: str, decompress_thread: bool = False) -> Iterator[Any]:
+  """Binary stream of a bulk result: URL, local file or "-" (stdin); gzip/bz2/xz detected by magic bytes."""
+  with contextlib.ExitStack() as stack:
+    if source == "-":
+      raw = sys.stdin.buffer
+    elif source.startswith(("http://", "https://")):
+      raw = stack.enter_context(urllib.request.urlopen(source, timeout=300))
+    else:
+      raw = stack.enter_context(open(source, "rb"))
+    yield stack.enter_context(decompressed(raw, decompress_thread))
+
+
+def iter_bulk_rows(source: Optional[str], decompress_thread: bool = False) -> Iterator[Dict[str, Any]]:
+  """Stream JSONL rows from a bulk result URL, a local file or stdin ("-"), one line at a time.
+
+  gzip/bz2/xz input is decompressed on the fly (optionally in a background thread).
+  """
+  if not source:
+    return
+  with open_bulk_stream(source, decompress_thread) as stream:
+    for line_no, raw in enumerate(stream, start=1):
+      raw = raw.strip()
+      if not raw:
+        continue
+      try:
+        yield json.loads(raw)
+      except json.JSONDecodeError as e:
+        raise RuntimeError(f"Invalid JSON on bulk line {line_no}: {e}") from e
+
+
+def iter_bulk_products(
+  rows: Iterable[Dict[str, Any]],
+  connections: List[str],
+  stats: Dict[str, int],
+  page_info: Iterable[str] = (),
+) -> Iterator[Dict[str, Any]]:
+  """Reassemble products from bulk rows: child rows follow their parent, so only one product is open.
+
+  Children are attached by `__parentId`, routed to a connection by gid type (or to the only connection
+  of the query). Children whose parent is no longer open are counted in `stats["orphanRows"]`.
+  Connections listed in `page_info` get a final (exhausted) pageInfo like the paginated interactive path.
+  """
+  page_info = set(page_info)
+  current: Optional[Dict[str, Any]] = None
+  for row in rows:
+    parent = row.pop("__parentId", None)
+    if parent is None:
+      if current is not None:
+        yield current
+      current = dict(row)
+      for name in connections:
+        current[name] = {"nodes": []}
+        if name in page_info:
+          current[name]["pageInfo"] = {"hasNextPage": False, "endCursor": None}
+      stats["products"] = stats.get("products", 0) + 1
+      continue
+
+    if current is None or current.get("id") != parent:
+      stats["orphanRows"] = stats.get("orphanRows", 0) + 1
+      continue
+    name = BULK_GID_TYPE_TO_CONNECTION.get(_gid_type(row.get("id")))
+    if name not in connections:
+      name = connections[0] if len(connections) == 1 else None
+    if name is None:
+      stats["unroutedRows"] = stats.get("unroutedRows", 0) + 1
+      continue
+    current[name]["nodes"].append(row)
+    stats["childRows"] = stats.get("childRows", 0) + 1
+  if current is not None:
+    yield current
+
+
+def fetch_products_bulk(
+  endpoint: str,
+  token: str,
+  product_ids: List[str],
+  product_query: str,
+  args: argparse.Namespace,
+  paginated: Iterable[Dict[str, Any]] = (),
+) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Any]]:
+  """Fetch products through the Bulk Operations API. Returns ({productId: graphql response}, meta).
+
+  Bulk results are not paginated, so every connection is cut to what the interactive path returns: its
+  `first:` page size, times the page cap for the `paginated` connections (the ConnectionPaginator
+  specs). A cut connection gets `hasNextPage: true` and, if paginated, `<key>PaginationStopped:
+  "maxPages"` in extensions; `endCursor` is always null (bulk rows carry no cursors). Cost budgets do
+  not apply.
+
+  Ids are fetched chunk by chunk (see BULK_MAX_IDS_PER_SEARCH). Within a chunk the extra (overflow)
+  queries run first and are held per product; the main query is then streamed and each product is
+  completed as soon as its child rows end. Responses are shaped like `product(id:)` results.
+  """
+  plans = build_bulk_product_queries(product_query, product_ids)
+  field_order = [
+    (s["alias"] or s["name"])
+    for s in next(
+      f for f in parse_graphql(product_query)["operations"][0]["selections"] if f.get("kind") == "field"
+    )["selections"]
+    if s.get("kind") == "field"
+  ]
+  meta: Dict[str, Any] = {"operations": [], "stats": {}}
+  max_pages = {c["key"]: int(c.get("maxPages") or args.connection_max_pages) for c in paginated}
+  limits = {key: size * max_pages.get(key, 1) for plan in plans for key, size in plan["pageSizes"].items()}
+
+  def source_for(query: str) -> Optional[str]:
+    if args.bulk_jsonl:
+      return args.bulk_jsonl
+    op = run_bulk_operation(endpoint, token, query, timeout_seconds=args.bulk_timeout)
+    meta["operations"].append({k: op.get(k) for k in ("id", "status", "objectCount", "fileSize")})
+    return op.get("url")
+
+  main_plans = plans[:1] if not args.bulk_jsonl else plans
+  main_connections = [c for p in main_plans for c in p["connections"]]
+  main_page_info = [c for p in main_plans for c in p["pageInfo"]]
+  wanted = set(product_ids)
+  results: Dict[str, Dict[str, Any]] = {}
+  # A given --bulk-jsonl file is the result of one (main) query that already holds every product.
+  for chunk in range(1 if args.bulk_jsonl else len(plans[0]["queries"])):
+    extras: Dict[str, Dict[str, Any]] = {}
+    if not args.bulk_jsonl:
+      for plan in plans[1:]:
+        rows = iter_bulk_rows(source_for(plan["queries"][chunk]), args.bulk_decompress_thread)
+        for product in iter_bulk_products(rows, plan["connections"], meta["stats"], plan["pageInfo"]):
+          extras.setdefault(product["id"], {}).update({c: product[c] for c in plan["connections"]})
+
+    rows = iter_bulk_rows(source_for(plans[0]["queries"][chunk]), args.bulk_decompress_thread)
+    for product in iter_bulk_products(rows, main_connections, meta["stats"], main_page_info):
+      pid = product.get("id")
+      if pid not in wanted:
+        continue
+      product.update(extras.pop(pid, {}))
+      ordered = {k: product[k] for k in field_order if k in product}
+      ordered.update({k: v for k, v in product.items() if k not in ordered})
+      extensions: Dict[str, Any] = {"bulk": True}
+      for key, limit in limits.items():
+        conn = ordered.get(key)
+        if not isinstance(conn, dict):
+          continue
+        if len(conn["nodes"]) > limit:
+          conn["nodes"] = conn["nodes"][:limit]
+          if "pageInfo" in conn:
+            conn["pageInfo"] = {"hasNextPage": True, "endCursor": None}
+          if key in max_pages:
+            extensions[f"{key}PaginationStopped"] = "maxPages"
+        if key in max_pages or key == "variants":
+          ordered[f"{key}CountFetched"] = len(conn["nodes"])
+      results[pid] = {"data": {"product": ordered}, "extensions": extensions}
+  return results, meta
+
+
+def _open_text_output(path: str, compress: bool) -> Any:
+  os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+  if compress:
+    return gzip.open(path, "wt", encoding="utf-8", compresslevel=6)
+  return open(path, "w", encoding="utf-8")
+
+
+class ProductDetailsWriter:
+  """Writes fetched products either as the legacy single JSON document or as a JSONL stream.
+
+  - `json`: products are collected into the vendor entries and dumped once at the end (as before).
+  - `jsonl`: one compact line per product, written (and flushed) as soon as the product is complete;
+    the run header, vendor list and counts go to `<path>.manifest.json` when the run finishes.
+  Either format may be gzip-compressed. Use `read_product_details` to load both.
+  """
+
+  # gzip members are flushed every N products: a crash loses at most that many, the ratio stays good.
+  GZIP_FLUSH_EVERY = 64
+
+  def __init__(self, path: str, fmt: str = "auto", compress: Optional[bool] = None):
+    self.path = path
+    if compress is None:
+      compress = path.endswith(".gz")
+    if fmt == "auto":
+      fmt = "jsonl" if path.endswith((".jsonl", ".jsonl.gz", ".ndjson", ".ndjson.gz")) else "json"
+    self.format = fmt
+    self.compress = compress
+    self.manifest_path = f"{path}.manifest.json"
+    self.count = 0
+    self._stream = _open_text_output(path, compress) if fmt == "jsonl" else None
+
+  def add(self, vendor_entry: Dict[str, Any], entry: Dict[str, Any]) -> None:
+    self.count += 1
+    if self._stream is None:
+      vendor_entry["products"].append(entry)
+      return
+    line = {
+      "vendor": vendor_entry.get("vendor"),
+      "productCountInFile": vendor_entry.get("productCountInFile"),
+      **entry,
+    }
+    self._stream.write(json.dumps(line, ensure_ascii=False, separators=(",", ":")) + "\n")
+    if not self.compress or self.count % self.GZIP_FLUSH_EVERY == 0:
+      self._stream.flush()
+
+  def close(self, out: Dict[str, Any]) -> None:
+    """Finish the run: dump the legacy document, or close the stream and write the manifest."""
+    if self._stream is None:
+      with _open_text_output(self.path, self.compress) as f:
+        json.dump(out, f, ensure_ascii=False, indent=2)
+      return
+    self._stream.close()
+    self._stream = None
+    manifest = {k: v for k, v in out.items() if k != "vendors"}
+    manifest["format"] = "jsonl"
+    manifest["compressed"] = self.compress
+    manifest["productsFile"] = os.path.basename(self.path)
+    manifest["vendors"] = [
+      {k: v for k, v in vendor.items() if k != "products"} for vendor in out.get("vendors") or []
+    ]
+    with open(self.manifest_path, "w", encoding="utf-8") as f:
+      json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+
+def _open_text_input(path: str) -> Any:
+  with open(path, "rb") as probe:
+    magic = probe.read(2)
+  if magic == b"\x1f\x8b":
+    return gzip.open(path, "rt", encoding="utf-8")
+  return open(path, "r", encoding="utf-8")
+
+
+def _looks_like_jsonl(first_line: str) -> bool:
+  try:
+    obj = json.loads(first_line)
+  except json.JSONDecodeError:
+    return False  # pretty-printed legacy document: its first line is just "{"
+  return isinstance(obj, dict) and "vendors" not in obj
+
+
+def iter_product_details(path: str) -> Iterator[Dict[str, Any]]:
+  """Stream product entries (each carrying `vendor`/`productCountInFile`) from either format."""
+  with _open_text_input(path) as f:
+    first = ""
+    for first in f:
+      if first.strip():
+        break
+    if not first.strip():
+      return
+    if _looks_like_jsonl(first):
+      for line in itertools.chain([first], f):
+        if line.strip():
+          yield json.loads(line)
+      return
+    doc = json.loads(first + f.read())
+  for vendor in doc.get("vendors") or []:
+    for product in vendor.get("products") or []:
+      yield {"vendor": vendor.get("vendor"), "productCountInFile": vendor.get("productCountInFile"), **product}
+
+
+def read_product_details(path: str) -> Dict[str, Any]:
+  """Load product details written in either format into the legacy single-document structure."""
+  manifest_path = f"{path}.manifest.json"
+  if not os.path.exists(manifest_path):
+    with _open_text_input(path) as f:
+      text = f.read()
+    first = next((ln for ln in text.splitlines() if ln.strip()), "")
+    if not _looks_like_jsonl(first):
+      return json.loads(text)
+
+  header: Dict[str, Any] = {}
+  if os.path.exists(manifest_path):
+    with open(manifest_path, "r", encoding="utf-8") as f:
+      header = json.load(f)
+  out = {k: v for k, v in header.items() if k not in ("format", "compressed", "productsFile", "vendors")}
+  vendors: Dict[Any, Dict[str, Any]] = {
+    v.get("vendor"): {**v, "products": []} for v in header.get("vendors") or []
+  }
+  for product in iter_product_details(path):
+    name = product.pop("vendor", None)
+    count = product.pop("productCountInFile", None)
+    if name not in vendors:
+      vendors[name] = {"vendor": name, "productCountInFile": count, "products": []}
+    vendors[name]["products"].append(product)
+  out["vendors"] = list(vendors.values())
+  return out
+
+
+class FetchCheckpoint:
+  """Append-only JSONL journal that lets an interrupted fetch run resume without refetching.
+
+  Record types (one JSON object per line):
+  - `run`: written first; identifies the shop, API version and product query. `--resume` refuses a
+    journal written for a different query, since its entries would not match the new output.
+  - `base`: the base response of a product whose metafields/variants still need follow-up pages.
+  - `page`: one follow-up page (`connection`, `nodes`, `pageInfo`) for a product.
+  - `done`: the final output entry of a product.
+  Lines are flushed as they are written; a torn last line (crash mid-write) is ignored on load.
+  """
+
+  # fetch_product_entry keeps a product whose follow-up pages raised (network error, Ctrl-C in a worker)
+  # in the output; in the journal it stays partial so --resume picks the pagination up again.
+  RESUMABLE_ERROR_SUFFIX = "PaginationException"
+
+  def __init__(self, path: str, run: Dict[str, Any], resume: bool = False):
+    self.path = path
+    self.run = run
+    self.done: Dict[str, Dict[str, Any]] = {}
+    self.unfinished = 0
+    self._partial: Dict[str, Dict[str, Any]] = {}
+    self._lock = threading.Lock()
+    self.resumed = resume and os.path.exists(path)
+    if self.resumed:
+      self._load()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    self._f = open(path, "w", encoding="utf-8")
+    # Compact on (re)open: carry over what is still useful, drop superseded partial state.
+    self._write({"type": "run", **run})
+    for entry in self.done.values():
+      self._write({"type": "done", "entry": entry})
+    for pid, state in self._partial.items():
+      self._write({"type": "base", "productId": pid, "graphql": state["graphql"]})
+      for connection, pages in state["pages"].items():
+        for page in pages:
+          self._write({"type": "page", "productId": pid, "connection": connection, **page})
+    self._f.flush()
+
+  def _load(self) -> None:
+    with open(self.path, "r", encoding="utf-8") as f:
+      lines = f.read().splitlines()
+    for n, line in enumerate(lines):
+      if not line.strip():
+        continue
+      try:
+        rec = json.loads(line)
+      except json.JSONDecodeError:
+        if n == len(lines) - 1:
+          break
+        raise
+      kind = rec.get("type")
+      if kind == "run":
+        journal_run = {k: v for k, v in rec.items() if k != "type"}
+        if journal_run != self.run:
+          raise SystemExit(
+            f"Checkpoint {self.path} was written for a different run "
+            f"({journal_run} != {self.run}); rerun without --resume to start over."
+          )
+      elif kind == "base":
+        self._partial[rec["productId"]] = {"graphql": rec["graphql"], "pages": {}}
+      elif kind == "page":
+        state = self._partial.get(rec["productId"])
+        if state is not None:
+          state["pages"].setdefault(rec["connection"], []).append(
+            {"nodes": rec.get("nodes") or [], "pageInfo": rec.get("pageInfo") or {}}
+          )
+      elif kind == "done":
+        entry = rec["entry"]
+        self.done[entry.get("productId")] = entry
+        self._partial.pop(entry.get("productId"), None)
+
+  def _write(self, record: Dict[str, Any]) -> None:
+    self._f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+  def _append(self, record: Dict[str, Any]) -> None:
+    line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+    with self._lock:
+      self._f.write(line)
+      self._f.flush()
+
+  @property
+  def partial_count(self) -> int:
+    return len(self._partial)
+
+  def has_partial(self, pid: Any) -> bool:
+    return pid in self._partial
+
+  def resume_state(self, pid: Any) -> Optional[Tuple[Dict[str, Any], Dict[str, int]]]:
+    """Rebuild a half-paginated product: (response with the journaled pages applied, pages per connection)."""
+    with self._lock:
+      state = self._partial.pop(pid, None)
+    if state is None:
+      return None
+    resp = state["graphql"]
+    product = (resp.get("data") or {}).get("product") or {}
+    page_counts: Dict[str, int] = {}
+    for connection, pages in state["pages"].items():
+      conn = product.get(connection) or {}
+      items_key = "edges" if "edges" in conn and "nodes" not in conn else "nodes"
+      items = list(conn.get(items_key) or [])
+      for page in pages:
+        items.extend(page["nodes"])
+      product[connection] = {**conn, items_key: items, "pageInfo": pages[-1]["pageInfo"] if pages else conn.get("pageInfo")}
+      page_counts[connection] = 1 + len(pages)
+    return resp, page_counts
+
+  def record_base(self, pid: Any, resp: Dict[str, Any]) -> None:
+    self._append({"type": "base", "productId": pid, "graphql": resp})
+
+  def record_page(self, pid: Any, connection: str, nodes: List[Any], page_info: Dict[str, Any]) -> None:
+    self._append({"type": "page", "productId": pid, "connection": connection, "nodes": nodes, "pageInfo": page_info})
+
+  def record_done(self, entry: Dict[str, Any]) -> None:
+    """Mark a product finished, unless its pagination died on an exception (it stays resumable)."""
+    extensions = (entry.get("graphql") or {}).get("extensions") or {}
+    if any(key.endswith(self.RESUMABLE_ERROR_SUFFIX) for key in extensions):
+      with self._lock:
+        self.unfinished += 1
+      return
+    self._append({"type": "done", "entry": entry})
+
+  def close(self, remove: bool = False) -> None:
+    """Close the journal; `remove` deletes it unless some product still has unfinished pagination."""
+    with self._lock:
+      if not self._f.closed:
+        self._f.close()
+    if remove and not self.unfinished and os.path.exists(self.path):
+      os.remove(self.path)
+
+
+def checkpoint_run_key(shop: str, api_version: str, queries: List[str], args: argparse.Namespace) -> Dict[str, Any]:
+  """What a journal must match to be resumable: same shop, API version, product query and pagination."""
+  digest = hashlib.sha256("\n\n".join(queries).encode("utf-8")).hexdigest()
+  return {
+    "shop": shop,
+    "apiVersion": api_version,
+    "queryHash": digest,
+    "paginateVariants": bool(args.paginate_variants),
+    "paginateConnections": bool(args.paginate_connections),
+  }
+
+
+PRODUCT_UPDATES_QUERY = r'''
+query ProductUpdates($query: String!, $after: String) {
+  products(first: 250, after: $after, query: $query, sortKey: UPDATED_AT) {
+    nodes {
+      id
+      updatedAt
+    }
+    pageInfo {
+      hasNextPage
+      endCursor
+    }
+  }
+}
+'''
+
+
+class ProductStore:
+  """SQLite store of fetched product entries for incremental (`--store`) runs.
+
+  Rows are keyed by (fetch key, product id): the fetch key hashes shop, API version, product query and
+  pagination flags, so entries fetched with a different query never stand in for each other. Each row
+  keeps the product's `updatedAt` and the client time it was fetched; the oldest fetch time of the
+  products in a run is the `updated_at:>` watermark for the change listing.
+  """
+
+  # Shopify's `updated_at` search and our clock are not in lockstep; list a little further back.
+  WATERMARK_SLACK = timedelta(minutes=10)
+
+  def __init__(self, path: str, fetch_key: Dict[str, Any]):
+    self.path = path
+    self.key = hashlib.sha256(json.dumps(fetch_key, sort_keys=True).encode("utf-8")).hexdigest()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    self._db = sqlite3.connect(path)
+    self._db.execute(
+      "CREATE TABLE IF NOT EXISTS products ("
+      " fetch_key TEXT NOT NULL, product_id TEXT NOT NULL, updated_at TEXT, fetched_at TEXT NOT NULL,"
+      " entry TEXT NOT NULL, PRIMARY KEY (fetch_key, product_id))"
+    )
+    self._db.commit()
+
+  def lookup(self, product_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Stored rows for these ids: {id: {"updatedAt", "fetchedAt", "entry"}}."""
+    rows: Dict[str, Dict[str, Any]] = {}
+    ids = list(dict.fromkeys(product_ids))
+    for i in range(0, len(ids), 500):
+      chunk = ids[i : i + 500]
+      cur = self._db.execute(
+        "SELECT product_id, updated_at, fetched_at, entry FROM products"
+        f" WHERE fetch_key = ? AND product_id IN ({','.join('?' * len(chunk))})",
+        [self.key, *chunk],
+      )
+      for pid, updated_at, fetched_at, entry in cur:
+        rows[pid] = {"updatedAt": updated_at, "fetchedAt": fetched_at, "entry": json.loads(entry)}
+    return rows
+
+  def put(self, entry: Dict[str, Any], fetched_at: str) -> bool:
+    """Store a freshly fetched entry; incomplete ones (errors, unfinished pagination) are skipped."""
+    graphql = entry.get("graphql") or {}
+    product = (graphql.get("data") or {}).get("product")
+    extensions = graphql.get("extensions") or {}
+    if not isinstance(product, dict) or graphql.get("errors") or any("Pagination" in k for k in extensions):
+      return False
+    self._db.execute(
+      "INSERT OR REPLACE INTO products (fetch_key, product_id, updated_at, fetched_at, entry) VALUES (?, ?, ?, ?, ?)",
+      (self.key, entry.get("productId"), product.get("updatedAt"), fetched_at, json.dumps(entry, ensure_ascii=False)),
+    )
+    return True
+
+  def touch(self, product_ids: List[str], verified_at: str) -> None:
+    """Move `fetched_at` forward for rows the change listing just confirmed as unchanged.
+
+    Keeps the next run's watermark (and so its listing) recent instead of anchored at the first fetch.
+    """
+    self._db.executemany(
+      "UPDATE products SET fetched_at = ? WHERE fetch_key = ? AND product_id = ?",
+      [(verified_at, self.key, pid) for pid in product_ids],
+    )
+    self._db.commit()
+
+  def commit(self) -> None:
+    self._db.commit()
+
+  def close(self) -> None:
+    self._db.commit()
+    self._db.close()
+
+
+def _utc_now_iso() -> str:
+  return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def list_product_updates(endpoint: str, token: str, since: str) -> Tuple[Dict[str, str], Dict[str, Any]]:
+  """List ids + updatedAt of every product changed after `since` (ISO time). Returns (updates, stats)."""
+  updates: Dict[str, str] = {}
+  stats = {"since": since, "requests": 0, "actualQueryCost": 0.0}
+  search = f"updated_at:>'{since}'"
+  cursor: Optional[str] = None
+  while True:
+    resp = gql_post(endpoint, token, PRODUCT_UPDATES_QUERY, variables={"query": search, "after": cursor}, timeout=60)
+    stats["requests"] += 1
+    stats["actualQueryCost"] += float((((resp.get("extensions") or {}).get("cost") or {}).get("actualQueryCost")) or 0)
+    if resp.get("errors"):
+      raise RuntimeError(f"Product update listing failed: {resp['errors']}")
+    conn = (resp.get("data") or {}).get("products") or {}
+    for node in conn.get("nodes") or []:
+      updates[node.get("id")] = node.get("updatedAt")
+    page_info = conn.get("pageInfo") or {}
+    if not page_info.get("hasNextPage") or not page_info.get("endCursor"):
+      break
+    cursor = page_info["endCursor"]
+  stats["changed"] = len(updates)
+  return updates, stats
+
+
+def plan_store_sync(
+  endpoint: str, token: str, store: ProductStore, product_ids: List[str]
+) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Any]]:
+  """Decide which products can be served from the store. Returns ({id: stored entry}, stats).
+
+  A stored product is reused unless the `updated_at:>` listing (since the oldest stored fetch among
+  these ids) reports an `updatedAt` different from the stored one.
+  """
+  stored = store.lookup(product_ids)
+  stats: Dict[str, Any] = {"path": store.path, "stored": len(stored), "listing": None}
+  if not stored:
+    return {}, stats
+  oldest = min(datetime.strptime(r["fetchedAt"], "%Y-%m-%dT%H:%M:%SZ") for r in stored.values())
+  since = (oldest - ProductStore.WATERMARK_SLACK).strftime("%Y-%m-%dT%H:%M:%SZ")
+  updates, stats["listing"] = list_product_updates(endpoint, token, since)
+  reuse = {
+    pid: dict(row["entry"], storedAt=row["fetchedAt"])
+    for pid, row in stored.items()
+    if pid not in updates or (row["updatedAt"] is not None and updates[pid] == row["updatedAt"])
+  }
+  return reuse, stats
+
+
+# Options that name one shop's files; in --shops mode every shop gets its own copy (see _shop_path).
+SHOP_PATH_OPTIONS = (
+  "out_details",
+  "out_schema",
+  "out_everything_query",
+  "checkpoint",
+  "store",
+  "metrics_out",
+  "metrics_prom",
+  "metrics_requests",
+)
+SHOPS_MODE_OPTIONS = ("--shops", "--shops-parallel", "--shops-summary")
+
+
+def _shop_path(path: str, name: str) -> str:
+  """`Outputs/product_details.jsonl.gz` -> `Outputs/product_details.<name>.jsonl.gz`."""
+  directory, base = os.path.split(path)
+  m = re.match(r"^(.*?)((?:\.(?:json|jsonl|prom|sqlite|db|graphql|txt))?(?:\.gz)?)$", base)
+  stem, ext = (m.group(1), m.group(2)) if m and m.group(1) else (base, "")
+  return os.path.join(directory, f"{stem}.{name}{ext}")
+
+
+def _strip_options(argv: List[str], names: Iterable[str]) -> List[str]:
+  """Drop `--name value` / `--name=value` pairs from an argv list."""
+  names = tuple(names)
+  out: List[str] = []
+  skip = False
+  for a in argv:
+    if skip:
+      skip = False
+    elif a in names:
+      skip = True
+    elif not a.startswith(tuple(f"{n}=" for n in names)):
+      out.append(a)
+  return out
+
+
+def load_shops_manifest(path: str) -> List[Dict[str, Any]]:
+  """Read a --shops manifest: a JSON list (or {"shops": [...]}) of shop entries.
+
+  Each entry has a `name` (used in output paths and log prefixes) and credentials, either `env` (an
+  env file with SHOPIFY_SHOP_DOMAIN/SHOPIFY_ADMIN_API_TOKEN) or `shop` plus `token`/`tokenEnv` (name of
+  an environment variable holding the token). Optional: `report`, `endpoint` and `args` (extra CLI
+  arguments for this shop only). Relative `env`/`report` paths are resolved against the manifest.
+  """
+  with open(path, "r", encoding="utf-8") as f:
+    doc = json.load(f)
+  entries = doc.get("shops") if isinstance(doc, dict) else doc
+  if not isinstance(entries, list) or not entries:
+    raise ValueError(f"{path}: expected a non-empty list of shops")
+  base = os.path.dirname(os.path.abspath(path))
+  shops: List[Dict[str, Any]] = []
+  seen: set = set()
+  for i, entry in enumerate(entries):
+    name = str(entry.get("name") or entry.get("shop") or "").split(".")[0]
+    if not re.match(r"^[A-Za-z0-9_-]+$", name):
+      raise ValueError(f"{path}: shop #{i + 1} needs a `name` made of letters, digits, '-' or '_'")
+    if name in seen:
+      raise ValueError(f"{path}: duplicate shop name {name!r}")
+    seen.add(name)
+    credentials: Optional[Dict[str, str]] = None
+    if entry.get("shop"):
+      token = entry.get("token") or os.environ.get(entry.get("tokenEnv") or "", "")
+      if not token:
+        raise ValueError(f"{path}: shop {name!r} has no `token` (or `tokenEnv` is unset)")
+      credentials = {"SHOPIFY_SHOP_DOMAIN": entry["shop"], "SHOPIFY_ADMIN_API_TOKEN": token}
+    elif not entry.get("env"):
+      raise ValueError(f"{path}: shop {name!r} needs `env` or `shop` + `token`/`tokenEnv`")
+    shops.append(
+      {
+        "name": name,
+        "env": os.path.join(base, entry["env"]) if entry.get("env") else "",
+        "credentials": credentials,
+        "report": os.path.join(base, entry["report"]) if entry.get("report") else "",
+        "endpoint": entry.get("endpoint") or "",
+        "args": [str(a) for a in entry.get("args") or []],
+      }
+    )
+  return shops
+
+
+class _PrefixedWriter(io.TextIOBase):
+  """Line-buffered stdout wrapper that tags every line with the shop name."""
+
+  def __init__(self, stream: Any, prefix: str):
+    self._stream = stream
+    self._prefix = prefix
+    self._pending = ""
+
+  def write(self, text: str) -> int:
+    lines = (self._pending + text).split("\n")
+    self._pending = lines.pop()
+    for line in lines:
+      self._stream.write(f"{self._prefix}{line}\n")
+    if lines:
+      self._stream.flush()
+    return len(text)
+
+  def flush(self) -> None:
+    if self._pending:
+      self._stream.write(f"{self._prefix}{self._pending}\n")
+      self._pending = ""
+    self._stream.flush()
+
+
+def _run_shop(job: Dict[str, Any]) -> Dict[str, Any]:
+  """Worker process: one shop's fetch run, with its own client pool and throttle bucket."""
+  # Pool workers are reused across shops: drop whatever process-wide state the previous shop's run
+  # left behind (shared-throttle directory, buckets, pooled clients, metrics/response-cache hooks).
+  enable_shared_throttle(None)
+  reset_throttle_buckets()
+  close_clients()
+  set_request_metrics(None)
+  set_response_cache(None)
+  stdout = sys.stdout
+  sys.stdout = _PrefixedWriter(stdout, f"[{job['name']}] ")
+  started = time.monotonic()
+  result: Dict[str, Any] = {"name": job["name"], "exitCode": 1, "error": None}
+  try:
+    result["exitCode"] = main(job["argv"], credentials=job["credentials"])
+  except SystemExit as e:
+    result["exitCode"] = e.code if isinstance(e.code, int) else 1
+    result["error"] = None if isinstance(e.code, int) else str(e.code)
+  except Exception as e:
+    result["error"] = f"{type(e).__name__}: {e}"
+  finally:
+    sys.stdout.flush()
+    sys.stdout = stdout
+  result["seconds"] = round(time.monotonic() - started, 3)
+  try:
+    with open(job["metricsOut"], "r", encoding="utf-8") as f:
+      metrics = json.load(f)
+    result.update({k: metrics.get(k) for k in ("products", "requests", "retries", "errors", "bytesIn", "bytesOut")})
+    result.update({k: metrics.get(k) for k in ("actualCost", "throttledSeconds", "backoffSeconds")})
+  except (OSError, ValueError):
+    pass
+  return result
+
+
+def run_shops(args: argparse.Namespace, argv: List[str]) -> int:
+  """--shops: run every shop of the manifest in its own process and print a combined summary."""
+  try:
+    shops = load_shops_manifest(args.shops)
+  except (OSError, ValueError) as e:
+    raise SystemExit(f"Invalid --shops manifest: {e}")
+  base_argv = _strip_options(argv, SHOPS_MODE_OPTIONS)
+  jobs: List[Dict[str, Any]] = []
+  for shop in shops:
+    name = shop["name"]
+    shop_argv = list(base_argv)
+    for dest in SHOP_PATH_OPTIONS:
+      if getattr(args, dest):
+        shop_argv += [f"--{dest.replace('_', '-')}", _shop_path(getattr(args, dest), name)]
+    # Metrics are always written: the combined summary is built from them.
+    metrics_out = _shop_path(args.metrics_out, name) if args.metrics_out else (
+      re.sub(r"\.jsonl?(\.gz)?$", "", _shop_path(args.out_details, name)) + ".metrics.json"
+    )
+    if not args.metrics_out:
+      shop_argv += ["--metrics-out", metrics_out]
+    if shop["env"]:
+      shop_argv += ["--env", shop["env"]]
+    if shop["report"]:
+      shop_argv += ["--report", shop["report"]]
+    if shop["endpoint"]:
+      shop_argv += ["--endpoint", shop["endpoint"]]
+    shop_argv += shop["args"]
+    jobs.append({"name": name, "argv": shop_argv, "credentials": shop["credentials"], "metricsOut": metrics_out})
+
+  workers = max(1, min(len(jobs), args.shops_parallel or len(jobs)))
+  print(f"Fetching {len(jobs)} shops with {workers} worker processes: {', '.join(j['name'] for j in jobs)}")
+  sys.stdout.flush()
+  started = time.monotonic()
+  results: Dict[str, Dict[str, Any]] = {}
+  with ProcessPoolExecutor(max_workers=workers) as ex:
+    futures = {ex.submit(_run_shop, job): job["name"] for job in jobs}
+    for future in as_completed(futures):
+      name = futures[future]
+      try:
+        res = future.result()
+      except Exception as e:  # the worker process itself died
+        res = {"name": name, "exitCode": 1, "error": f"{type(e).__name__}: {e}"}
+      results[name] = res
+      status = "ok" if res.get("exitCode") == 0 else f"FAILED ({res.get('error') or 'exit ' + str(res.get('exitCode'))})"
+      print(
+        f"[{len(results)}/{len(jobs)}] {name}: {status}, {res.get('products') or 0} products, "
+        f"{res.get('requests') or 0} requests in {res.get('seconds', 0):.1f}s"
+      )
+  wall = time.monotonic() - started
+
+  ordered = [results[j["name"]] for j in jobs]
+  totals: Dict[str, Any] = {"shops": len(ordered), "failed": sum(1 for r in ordered if r.get("exitCode") != 0)}
+  for key in ("products", "requests", "retries", "bytesIn", "bytesOut", "actualCost", "throttledSeconds", "backoffSeconds"):
+    totals[key] = sum(r.get(key) or 0 for r in ordered)
+  totals["wallSeconds"] = round(wall, 3)
+  totals["sumShopSeconds"] = round(sum(r.get("seconds") or 0 for r in ordered), 3)
+  summary = {"manifest": args.shops, "workers": workers, "totals": totals, "shops": ordered}
+
+  print(
+    f"All shops: {totals['products']} products, {totals['requests']} requests, "
+    f"{totals['wallSeconds']:.1f}s wall ({totals['sumShopSeconds']:.1f}s summed over shops), "
+    f"{totals['failed']} failed"
+  )
+  if args.shops_summary:
+    with open(args.shops_summary, "w", encoding="utf-8") as f:
+      json.dump(summary, f, ensure_ascii=False, indent=2)
+    print(f"Wrote shops summary: {args.shops_summary}")
+  return 0 if totals["failed"] == 0 else 1
+
+
+def main(argv: Optional[List[str]] = None, credentials: Optional[Dict[str, str]] = None) -> int:
+  ap = argparse.ArgumentParser(
+    description="Fetch Shopify product details for 10 test vendors x 3 products each via Admin GraphQL (CLI can't fetch API objects)."
   )
   ap.add_argument("--env", default="../../.env", help="Env file path (default: ../../.env)")
   ap.add_argument(
@@ -635,6 +3514,11 @@ def main() -> int:
     help="Input report from JSONL sampling (default: Research Produse/Outputs/vendor_samples_report.json)",
   )
   ap.add_argument("--api-version", default="2025-10", help="Shopify Admin API version")
+  ap.add_argument(
+    "--endpoint",
+    default="",
+    help="Override the Admin GraphQL URL (e.g. a local shopify_mock_server.py); the token still comes from --env.",
+  )
   ap.add_argument("--vendor-count", type=int, default=10, help="How many vendors to test")
   ap.add_argument("--seed", type=int, default=20251222, help="Random seed for choosing vendors")
   ap.add_argument(
@@ -648,6 +3532,18 @@ def main() -> int:
     default="Research Produse/Outputs/test_vendors_products_details.json",
     help="Output file with fetched product details (default: Research Produse/Outputs/test_vendors_products_details.json)",
   )
+  ap.add_argument(
+    "--out-format",
+    choices=["auto", "json", "jsonl"],
+    default="auto",
+    help="json = one document written at the end; jsonl = one line per product as it completes, plus "
+    "<out>.manifest.json. auto picks jsonl for .jsonl/.ndjson paths (default: auto).",
+  )
+  ap.add_argument(
+    "--out-gzip",
+    action="store_true",
+    help="gzip-compress --out-details (implied by a .gz suffix).",
+  )
   ap.add_argument(
     "--out-schema",
     default="Research Produse/Outputs/product_type_fields.json",
@@ -658,6 +3554,20 @@ def main() -> int:
     default="",
     help="If set, writes the generated --everything GraphQL query to this path (debug/research).",
   )
+  ap.add_argument(
+    "--profile",
+    choices=sorted(PROJECTION_PROFILES),
+    default="full",
+    help="Fetch only a slice of PRODUCT_DETAILS_QUERY: pricing, inventory, seo, metafields-only or full (default). "
+    "Pagination pages use the same projection.",
+  )
+  ap.add_argument(
+    "--fields",
+    default="",
+    help="Comma-separated dotted fields to fetch, e.g. 'vendor,variants.sku,variants.price,metafields.value' "
+    "(connections are entered through nodes implicitly). Alone or with --profile full the query is narrowed to exactly "
+    "these fields; with another --profile they are added to it. id, title and updatedAt are always kept.",
+  )
   ap.add_argument(
     "--everything",
     action="store_true",
@@ -681,6 +3591,18 @@ def main() -> int:
     default=25,
     help="How many scalar fields to include for nested objects/nodes in --everything mode (default: 25)",
   )
+  ap.add_argument(
+    "--everything-target-cost",
+    type=float,
+    default=MAX_SINGLE_QUERY_COST,
+    help=f"Estimated cost ceiling for the --everything query; page sizes shrink, then the query is split (default: {MAX_SINGLE_QUERY_COST}, 0 = off).",
+  )
+  ap.add_argument(
+    "--everything-min-connection-first",
+    type=int,
+    default=5,
+    help="Smallest connection page size the cost planner may shrink to before splitting the query (default: 5).",
+  )
   ap.add_argument(
     "--everything-skip-fields",
     default="",
@@ -700,32 +3622,255 @@ def main() -> int:
   ap.add_argument(
     "--paginate-variants-sleep",
     type=float,
-    default=0.02,
-    help="Sleep seconds between variants page requests (default: 0.02).",
+    default=0.0,
+    help="Extra fixed sleep seconds between variants page requests (default: 0; pacing follows Shopify throttleStatus).",
+  )
+  ap.add_argument(
+    "--paginate-connections",
+    action="store_true",
+    help="Follow hasNextPage on every connection of the product query that selects pageInfo (images, media, "
+    "collections, ... in --everything mode), concurrently per product and under the budgets below.",
+  )
+  ap.add_argument(
+    "--connection-budget-per-product",
+    type=float,
+    default=2000,
+    help="With --paginate-connections: max estimated cost points of follow-up pages per product (default: 2000, 0 = unlimited).",
+  )
+  ap.add_argument(
+    "--connection-budget-per-run",
+    type=float,
+    default=0,
+    help="With --paginate-connections: max cost points of follow-up pages for the whole run (default: 0 = unlimited).",
+  )
+  ap.add_argument(
+    "--connection-max-pages",
+    type=int,
+    default=200,
+    help="With --paginate-connections: safety cap of pages per connection (default: 200).",
+  )
+  ap.add_argument(
+    "--concurrency",
+    type=int,
+    default=1,
+    help="How many products to fetch in flight (thread pool). Output order is unchanged (default: 1 = sequential).",
+  )
+  ap.add_argument(
+    "--batch-size",
+    type=int,
+    default=1,
+    help="Products per request via nodes(ids:). 0 = auto from the query cost, 1 = one product per request (default: 1).",
+  )
+  ap.add_argument(
+    "--max-query-cost",
+    type=float,
+    default=MAX_SINGLE_QUERY_COST,
+    help=f"Per-query cost ceiling used to size --batch-size 0 (default: {MAX_SINGLE_QUERY_COST}).",
+  )
+  ap.add_argument(
+    "--bulk",
+    action="store_true",
+    help="Fetch the picked products with one Bulk Operations query (bulkOperationRunQuery) and stream the JSONL result.",
+  )
+  ap.add_argument(
+    "--bulk-timeout",
+    type=float,
+    default=3600,
+    help="Seconds to wait for a bulk operation to complete (default: 3600).",
+  )
+  ap.add_argument(
+    "--bulk-jsonl",
+    default="",
+    help="With --bulk: reassemble an already downloaded bulk result file instead of running an operation "
+    "(gzip/bz2/xz are detected automatically; - reads stdin).",
+  )
+  ap.add_argument(
+    "--bulk-decompress-thread",
+    action="store_true",
+    help="Decompress a gzip/bz2/xz bulk result in a background thread, overlapping with parsing.",
+  )
+  ap.add_argument(
+    "--store",
+    default="",
+    help="SQLite product store for incremental runs: list products changed since the last fetch "
+    "(updated_at:>...), refetch only those and serve the rest from the store.",
+  )
+  ap.add_argument(
+    "--store-full-refresh",
+    action="store_true",
+    help="With --store: refetch every product (and rewrite the store) instead of serving unchanged ones.",
+  )
+  ap.add_argument(
+    "--checkpoint",
+    default="",
+    help="Journal finished products and in-progress pagination cursors to this JSONL file "
+    "(default with --resume: <out-details>.checkpoint.jsonl). Removed after a successful run.",
+  )
+  ap.add_argument(
+    "--resume",
+    action="store_true",
+    help="Continue from the --checkpoint journal: skip finished products, resume half-paginated ones from their cursor.",
+  )
+  ap.add_argument(
+    "--introspection-cache-dir",
+    default=os.path.join(DEFAULT_CACHE_DIR, "introspection"),
+    help="Directory for the persistent schema introspection cache, keyed by shop + API version.",
+  )
+  ap.add_argument(
+    "--introspection-cache-ttl-hours",
+    type=float,
+    default=24.0,
+    help="How long cached introspection results and generated queries stay valid (default: 24).",
+  )
+  ap.add_argument(
+    "--refresh-introspection-cache",
+    action="store_true",
+    help="Drop the cached introspection for this shop + API version before running.",
+  )
+  ap.add_argument(
+    "--no-introspection-cache",
+    action="store_true",
+    help="Do not read or write the persistent introspection cache.",
+  )
+  ap.add_argument(
+    "--metrics-out",
+    default="",
+    help="Write a JSON run metrics report: per-operation latency histograms, bytes, query cost, retries, "
+    "errors, time blocked on throttling and cost per product.",
+  )
+  ap.add_argument(
+    "--metrics-prom",
+    default="",
+    help="Write the run metrics in Prometheus text format (e.g. for a node_exporter textfile collector).",
+  )
+  ap.add_argument(
+    "--metrics-requests",
+    default="",
+    help="Log every GraphQL request (operation, latency, bytes, cost, bucket level, retries, error) to this JSONL file.",
+  )
+  ap.add_argument(
+    "--response-cache",
+    action="store_true",
+    help="Serve repeated queries (same shop, API version, query and variables) from a local gzip response cache "
+    "instead of the network, and store new error-free responses in it.",
+  )
+  ap.add_argument(
+    "--response-cache-dir",
+    default=os.path.join(DEFAULT_CACHE_DIR, "responses"),
+    help="Directory of the --response-cache.",
+  )
+  ap.add_argument(
+    "--response-cache-ttl-hours",
+    type=float,
+    default=24.0,
+    help="How long cached responses are served (default: 24).",
+  )
+  ap.add_argument(
+    "--response-cache-max-mb",
+    type=float,
+    default=1024.0,
+    help="Size bound of the response cache; least recently used responses are evicted beyond it (default: 1024).",
   )
-  args = ap.parse_args()
+  ap.add_argument(
+    "--shared-throttle",
+    action="store_true",
+    help="Share the cost bucket with every other run on this host that also passes --shared-throttle "
+    "(flock-protected state file per shop), so concurrent jobs against one shop do not trip its throttle together.",
+  )
+  ap.add_argument(
+    "--shared-throttle-dir",
+    default=os.path.join(DEFAULT_CACHE_DIR, "throttle"),
+    help="Directory for the --shared-throttle state files.",
+  )
+  ap.add_argument(
+    "--shops",
+    default="",
+    help="JSON manifest of shops + credentials: fetch every shop in parallel worker processes, each with its own "
+    "throttle bucket and outputs (<out-details> becomes <stem>.<name><ext>, likewise the other output paths).",
+  )
+  ap.add_argument(
+    "--shops-parallel",
+    type=int,
+    default=0,
+    help="With --shops: worker processes (default: 0 = one per shop).",
+  )
+  ap.add_argument(
+    "--shops-summary",
+    default="",
+    help="With --shops: write the combined per-shop progress and metrics summary to this JSON file.",
+  )
+  argv = list(sys.argv[1:] if argv is None else argv)
+  args = ap.parse_args(argv)
+  if args.shops:
+    return run_shops(args, argv)
+
+  projection_fields: Optional[List[str]] = PROJECTION_PROFILES[args.profile]
+  extra_fields = [f.strip() for f in (args.fields or "").split(",") if f.strip()]
+  if extra_fields:
+    projection_fields = (projection_fields or []) + extra_fields
+  if projection_fields is not None and args.everything:
+    raise SystemExit("--profile/--fields select from PRODUCT_DETAILS_QUERY; use --everything-skip-fields with --everything")
+  product_query = PRODUCT_DETAILS_QUERY
+  if projection_fields is not None:
+    try:
+      product_query = project_product_query(PRODUCT_DETAILS_QUERY, projection_fields)
+    except ValueError as e:
+      raise SystemExit(str(e))
 
-  env = load_env_file(args.env)
+  env = credentials or load_env_file(args.env)
   shop = env.get("SHOPIFY_SHOP_DOMAIN")
   token = env.get("SHOPIFY_ADMIN_API_TOKEN")
 
   if not shop or not token:
     raise SystemExit("Missing SHOPIFY_SHOP_DOMAIN or SHOPIFY_ADMIN_API_TOKEN in env file")
 
-  endpoint = f"https://{shop}/admin/api/{args.api_version}/graphql.json"
+  endpoint = args.endpoint or f"https://{shop}/admin/api/{args.api_version}/graphql.json"
+  response_cache: Optional[ResponseCache] = None
+  if args.response_cache:
+    response_cache = ResponseCache(
+      args.response_cache_dir,
+      ttl_seconds=float(args.response_cache_ttl_hours) * 3600,
+      max_bytes=int(float(args.response_cache_max_mb) * 1024 * 1024),
+    )
+    set_response_cache(response_cache)
+  if args.shared_throttle:
+    if fcntl is None:
+      raise SystemExit("--shared-throttle needs fcntl (POSIX only)")
+    enable_shared_throttle(args.shared_throttle_dir)
+
+  metrics: Optional[RequestMetrics] = None
+  if args.metrics_out or args.metrics_prom or args.metrics_requests:
+    metrics = RequestMetrics(args.metrics_requests or None)
+    set_request_metrics(metrics)
 
   with open(args.report, "r", encoding="utf-8") as f:
     report = json.load(f)
 
   picked = pick_test_set(report, vendor_count=args.vendor_count, seed=args.seed, pick_mode=args.vendor_pick_mode)
 
+  type_cache: Optional[IntrospectionCache] = None
+  if not args.no_introspection_cache:
+    type_cache = IntrospectionCache(
+      args.introspection_cache_dir,
+      shop,
+      args.api_version,
+      ttl_seconds=float(args.introspection_cache_ttl_hours) * 3600,
+    )
+    if args.refresh_introspection_cache:
+      type_cache.invalidate()
+
   # 1) Introspection: list all Product fields
-  schema_resp = gql_post(endpoint, token, PRODUCT_FIELDS_INTROSPECTION, variables=None, timeout=60)
-  if schema_resp.get("errors"):
-    raise RuntimeError(f"Introspection errors: {schema_resp['errors']}")
+  schema_data = type_cache.get("productFields", "Product") if type_cache is not None else None
+  if schema_data is None:
+    schema_resp = gql_post(endpoint, token, PRODUCT_FIELDS_INTROSPECTION, variables=None, timeout=60)
+    if schema_resp.get("errors"):
+      raise RuntimeError(f"Introspection errors: {schema_resp['errors']}")
+    schema_data = schema_resp.get("data", {})
+    if type_cache is not None:
+      type_cache.put("productFields", "Product", schema_data)
 
   with open(args.out_schema, "w", encoding="utf-8") as f:
-    json.dump(schema_resp.get("data", {}), f, ensure_ascii=False, indent=2)
+    json.dump(schema_data, f, ensure_ascii=False, indent=2)
 
   # 2) Fetch details for products
   out: Dict[str, Any] = {
@@ -735,204 +3880,328 @@ def main() -> int:
     "vendorCount": len(picked),
     "vendors": [],
   }
+  if projection_fields is not None:
+    out["projection"] = {
+      "profile": args.profile,
+      "fields": projection_fields,
+      "estimatedCost": estimate_query_cost(product_query),
+      "fullEstimatedCost": estimate_query_cost(PRODUCT_DETAILS_QUERY),
+    }
 
   # Build dynamic query for --everything mode
   everything_query = None
+  everything_queries: List[str] = []
   everything_meta: Dict[str, Any] = {}
+  cost_plan: Optional[Dict[str, Any]] = None
   if args.everything:
     try:
       skip_fields = [s.strip() for s in (args.everything_skip_fields or "").split(",") if s.strip()]
-      everything_query, everything_meta = build_everything_product_query(
-        endpoint,
-        token,
-        max_depth=args.everything_max_depth,
-        connection_first=args.everything_connection_first,
-        connection_max_fields=args.everything_connection_max_fields,
-        skip_fields=skip_fields,
+      # Bulk queries are not bound by the single-query cost limit, so they are never shrunk or split.
+      target_cost = args.everything_target_cost if args.everything_target_cost > 0 and not args.bulk else float("inf")
+      builder_params = {
+        "maxDepth": args.everything_max_depth,
+        "connectionFirst": args.everything_connection_first,
+        "connectionMaxFields": args.everything_connection_max_fields,
+        "skipFields": sorted(skip_fields),
+        # The target the plan is built for (None = unsplit, e.g. under --bulk): a bulk plan must never
+        # be reused by a regular run that has to stay under the single-query limit.
+        "targetCost": target_cost if math.isfinite(target_cost) else None,
+        "minConnectionFirst": args.everything_min_connection_first,
+      }
+      query_key = json.dumps(builder_params, sort_keys=True)
+      cached_query = type_cache.get("queries", query_key) if type_cache is not None else None
+      if cached_query is not None:
+        everything_queries = list(cached_query["queries"])
+        everything_meta = dict(cached_query["meta"], fromCache=True)
+        cost_plan = dict(cached_query["costPlan"])
+      else:
+        schema_index = load_schema_index(endpoint, token, type_cache)
+
+        def build(first: int) -> Tuple[str, Dict[str, Any]]:
+          return build_everything_product_query(
+            endpoint,
+            token,
+            max_depth=args.everything_max_depth,
+            connection_first=first,
+            connection_max_fields=args.everything_connection_max_fields,
+            skip_fields=skip_fields,
+            type_cache=type_cache,
+            schema_index=schema_index,
+          )
+
+        everything_queries, everything_meta, cost_plan = plan_everything_query(
+          build,
+          args.everything_connection_first,
+          target_cost=target_cost,
+          min_connection_first=args.everything_min_connection_first,
+        )
+        if type_cache is not None:
+          type_cache.put(
+            "queries", query_key, {"queries": everything_queries, "meta": everything_meta, "costPlan": cost_plan}
+          )
+      everything_query = everything_queries[0]
+      print(
+        f"Everything query: estimated cost {cost_plan['estimatedCost']:.0f} "
+        f"(target {args.everything_target_cost}), connectionFirst={cost_plan['connectionFirst']}, "
+        f"parts={len(everything_queries)}, document {everything_meta.get('documentHash', '')[:12]}"
       )
       out["everything"] = {
         "enabled": True,
         "maxDepth": args.everything_max_depth,
-        "connectionFirst": args.everything_connection_first,
+        "connectionFirst": cost_plan["connectionFirst"],
         "connectionMaxFields": args.everything_connection_max_fields,
         "skipFields": skip_fields,
+        "documentHash": everything_meta.get("documentHash"),
         "meta": everything_meta,
+        "costPlan": cost_plan,
       }
 
       if args.out_everything_query:
         os.makedirs(os.path.dirname(args.out_everything_query) or ".", exist_ok=True)
         with open(args.out_everything_query, "w", encoding="utf-8") as f:
-          f.write(everything_query)
+          f.write("\n\n".join(everything_queries))
     except Exception as e:
       out["everything"] = {
         "enabled": True,
         "error": str(e),
       }
       everything_query = None
+      everything_queries = []
+      cost_plan = None
 
-  total_products = 0
+  if type_cache is not None:
+    type_cache.flush()
+
+  # Flatten (vendor, sample) jobs in report order; results are re-attached in the same order so the
+  # output stays deterministic regardless of how many products are in flight.
+  Job = Tuple[Dict[str, Any], Dict[str, Any]]
+  jobs: List[Job] = []
   for v in picked:
-    vendor_name = v.get("vendor")
     vendor_entry: Dict[str, Any] = {
-      "vendor": vendor_name,
+      "vendor": v.get("vendor"),
       "productCountInFile": v.get("productCountInFile"),
       "products": [],
     }
-
+    out["vendors"].append(vendor_entry)
     for s in (v.get("sampled") or [])[:3]:
-      pid = s.get("productId")
-      if not pid:
+      if not s.get("productId"):
         continue
+      jobs.append((vendor_entry, s))
 
-      query_to_use = PRODUCT_DETAILS_QUERY
-      if args.everything and everything_query:
-        query_to_use = everything_query
+  query_to_use = product_query
+  if args.everything and everything_query:
+    query_to_use = everything_query
 
-      resp = gql_post(endpoint, token, query_to_use, variables={"id": pid}, timeout=120)
-      # If product exists, paginate metafields to collect ALL (custom/unstructured included).
-      try:
-        product = (resp.get("data") or {}).get("product")
-        if product and isinstance(product, dict):
-          mf = product.get("metafields") or {}
-          nodes = list((mf.get("nodes") or []))
-          page_info = mf.get("pageInfo") or {}
-          has_next = bool(page_info.get("hasNextPage"))
-          cursor = page_info.get("endCursor")
-
-          # Safety cap to avoid infinite loops if API misbehaves
-          pages = 1
-          while has_next and cursor and pages < 200:
-            page = gql_post(
-              endpoint,
-              token,
-              PRODUCT_METAFIELDS_PAGE_QUERY,
-              variables={"id": pid, "after": cursor},
-              timeout=90,
-            )
-            if page.get("errors"):
-              # Keep the partial result; also attach errors for visibility
-              resp.setdefault("extensions", {})
-              resp["extensions"]["metafieldsPaginationErrors"] = page["errors"]
-              break
-
-            p2 = (page.get("data") or {}).get("product") or {}
-            mf2 = (p2.get("metafields") or {})
-            nodes2 = mf2.get("nodes") or []
-            nodes.extend(nodes2)
-            pi2 = mf2.get("pageInfo") or {}
-            has_next = bool(pi2.get("hasNextPage"))
-            cursor = pi2.get("endCursor")
-            pages += 1
-            time.sleep(0.02)
-
-          # Replace with full set
-          product["metafields"] = {
-            "nodes": nodes,
-            "pageInfo": {
-              "hasNextPage": False,
-              "endCursor": cursor,
-            },
-          }
-          product["metafieldsCountFetched"] = len(nodes)
-      except Exception as e:
-        # Non-fatal; keep base response
-        resp.setdefault("extensions", {})
-        resp["extensions"]["metafieldsPaginationException"] = str(e)
+  query_parts = everything_queries if len(everything_queries) > 1 else None
+  if query_parts and args.batch_size != 1:
+    print("Note: --batch-size is ignored because the --everything query was split into several parts.")
+    args.batch_size = 1
 
-      # Always record how many variants were fetched in the base response.
-      # (This is independent of whether we paginate beyond the first 100.)
-      try:
-        product = (resp.get("data") or {}).get("product")
-        if product and isinstance(product, dict):
-          variants = product.get("variants") or {}
-          vnodes = variants.get("nodes") or []
-          if isinstance(vnodes, list) and "variantsCountFetched" not in product:
-            product["variantsCountFetched"] = len(vnodes)
-      except Exception as e:
-        resp.setdefault("extensions", {})
-        resp["extensions"]["variantsCountBaseException"] = str(e)
+  # Connections are looked up in every part of a split query; each one lives in exactly one part.
+  connections = [c for q in (query_parts or [query_to_use]) for c in product_connections(q)]
+  if not args.paginate_connections:
+    # Default: all metafields (safety cap 200 pages), variants only when asked for; no cost budget.
+    caps = {"metafields": {"maxPages": 200}}
+    if args.paginate_variants:
+      caps["variants"] = {"maxPages": args.paginate_variants_max_pages, "delay": args.paginate_variants_sleep}
+    connections = [dict(c, **caps[c["key"]]) for c in connections if c["key"] in caps]
+  paginator: Optional[ConnectionPaginator] = None
+  if not args.bulk:
+    paginator = ConnectionPaginator(
+      endpoint,
+      token,
+      connections,
+      product_budget=args.connection_budget_per_product if args.paginate_connections else 0,
+      run_budget=args.connection_budget_per_run if args.paginate_connections else 0,
+      max_pages=args.connection_max_pages,
+    )
+    if args.paginate_connections:
+      print(f"Paginating connections: {', '.join(c['key'] for c in connections) or '(none)'}")
 
-      # Optional: paginate variants (beyond first 100) if requested.
-      try:
-        if args.paginate_variants:
-          product = (resp.get("data") or {}).get("product")
-          if product and isinstance(product, dict):
-            variants = product.get("variants") or {}
-            vnodes = list((variants.get("nodes") or []))
-            vpi = variants.get("pageInfo") or {}
-            v_has_next = bool(vpi.get("hasNextPage"))
-            v_cursor = vpi.get("endCursor")
-
-            pages = 1
-            while v_has_next and v_cursor and pages < int(args.paginate_variants_max_pages):
-              page = gql_post(
-                endpoint,
-                token,
-                PRODUCT_VARIANTS_PAGE_QUERY,
-                variables={"id": pid, "after": v_cursor},
-                timeout=120,
-              )
-              if page.get("errors"):
-                resp.setdefault("extensions", {})
-                resp["extensions"]["variantsPaginationErrors"] = page["errors"]
-                break
-
-              p2 = (page.get("data") or {}).get("product") or {}
-              v2 = (p2.get("variants") or {})
-              vnodes.extend(v2.get("nodes") or [])
-              vpi2 = v2.get("pageInfo") or {}
-              v_has_next = bool(vpi2.get("hasNextPage"))
-              v_cursor = vpi2.get("endCursor")
-              pages += 1
-              time.sleep(float(args.paginate_variants_sleep))
-
-            product["variants"] = {
-              "nodes": vnodes,
-              "pageInfo": {
-                "hasNextPage": False,
-                "endCursor": v_cursor,
-              },
-            }
-            product["variantsCountFetched"] = len(vnodes)
-      except Exception as e:
-        resp.setdefault("extensions", {})
-        resp["extensions"]["variantsPaginationException"] = str(e)
-
-      # Note: In --everything mode, we intentionally do not attempt to fully paginate every connection
-      # automatically (variants/images/media/collections/resourcePublications/etc) because that can explode
-      # API costs quickly. If needed, we can add targeted pagination for specific connections next.
-
-      vendor_entry["products"].append(
-        {
-          "productId": pid,
-          "productLineInJsonl": s.get("productLine"),
-          "graphql": resp,
-        }
+  run_key = checkpoint_run_key(shop, args.api_version, query_parts or [query_to_use], args)
+  checkpoint: Optional[FetchCheckpoint] = None
+  checkpoint_path = args.checkpoint or (f"{args.out_details}.checkpoint.jsonl" if args.resume else "")
+  if checkpoint_path:
+    checkpoint = FetchCheckpoint(checkpoint_path, run_key, resume=args.resume)
+    if checkpoint.resumed:
+      print(
+        f"Resuming from {checkpoint_path}: {len(checkpoint.done)} products done, "
+        f"{checkpoint.partial_count} partially paginated"
       )
-      total_products += 1
-      time.sleep(0.05)
 
-    out["vendors"].append(vendor_entry)
+  def run_group(group: List[Job]) -> List[Dict[str, Any]]:
+    if len(group) == 1:
+      entries = [
+        fetch_product_entry(
+          endpoint,
+          token,
+          group[0][1],
+          query_to_use,
+          query_parts=query_parts,
+          checkpoint=checkpoint,
+          paginator=paginator,
+        )
+      ]
+    else:
+      # Half-paginated products continue from their journaled cursor instead of joining the batch.
+      resuming = [i for i, (_, s) in enumerate(group) if checkpoint is not None and checkpoint.has_partial(s.get("productId"))]
+      rest = [s for i, (_, s) in enumerate(group) if i not in resuming]
+      fetched = iter(
+        fetch_product_batch(endpoint, token, rest, query_to_use, batch_query, checkpoint, paginator) if rest else []
+      )
+      entries = [
+        fetch_product_entry(endpoint, token, s, query_to_use, checkpoint=checkpoint, paginator=paginator)
+        if i in resuming
+        else next(fetched)
+        for i, (_, s) in enumerate(group)
+      ]
+    if checkpoint is not None:
+      for entry in entries:
+        checkpoint.record_done(entry)
+    return entries
+
+  batch_query = build_batch_query(query_to_use) if args.batch_size != 1 else ""
+  total_products = 0
+  done: List[Tuple[List[Job], List[Dict[str, Any]]]] = []
+  # Entries that need no request in this run: journaled by an interrupted run, or unchanged in the store.
+  ready: Dict[int, Dict[str, Any]] = {}
+  if checkpoint is not None:
+    ready = {
+      i: checkpoint.done[s.get("productId")] for i, (_, s) in enumerate(jobs) if s.get("productId") in checkpoint.done
+    }
+  store: Optional[ProductStore] = None
+  fetched_at = _utc_now_iso()  # taken before any product request: the next run's listing watermark
+  if args.store:
+    store = ProductStore(args.store, run_key)
+    unchanged: Dict[str, Dict[str, Any]] = {}
+    if not args.store_full_refresh:
+      unchanged, out["store"] = plan_store_sync(
+        endpoint, token, store, [s.get("productId") for i, (_, s) in enumerate(jobs) if i not in ready]
+      )
+      store.touch(list(unchanged), fetched_at)
+    else:
+      out["store"] = {"path": store.path, "fullRefresh": True}
+    for i, (_, s) in enumerate(jobs):
+      if i not in ready and s.get("productId") in unchanged:
+        ready[i] = unchanged[s.get("productId")]
+    out["store"]["served"] = sum(1 for e in ready.values() if "storedAt" in e)
+    print(f"Store {store.path}: serving {out['store']['served']} unchanged products, fetching {len(jobs) - len(ready)}")
+  pending = [job for i, job in enumerate(jobs) if i not in ready]
+  batch_size = max(1, int(args.batch_size))
+  if args.bulk and pending:
+    # Bulk mode replaces the per-product requests entirely; nothing is left for the pool.
+    # The bulk result is cut to the same page caps the paginator would stop at.
+    bulk_results, bulk_meta = fetch_products_bulk(
+      endpoint, token, [s.get("productId") for _, s in pending], query_to_use, args, paginated=connections
+    )
+    out["bulk"] = bulk_meta
+    for job in pending:
+      pid = job[1].get("productId")
+      entry = {
+        "productId": pid,
+        "productLineInJsonl": job[1].get("productLine"),
+        "graphql": bulk_results.get(pid) or {"data": {"product": None}},
+      }
+      if checkpoint is not None:
+        checkpoint.record_done(entry)
+      done.append(([job], [entry]))
+    pending = []
+  elif args.batch_size == 0 and pending:
+    # Auto: fetch the first product alone and size batches from its requestedQueryCost.
+    first = pending.pop(0)
+    done.append(([first], run_group([first])))
+    cost = (((done[0][1][0].get("graphql") or {}).get("extensions") or {}).get("cost") or {}).get("requestedQueryCost")
+    batch_size = choose_batch_size(cost, args.max_query_cost)
+    print(f"Auto batch size: {batch_size} (single-product requestedQueryCost={cost})")
+  groups = [pending[i : i + batch_size] for i in range(0, len(pending), batch_size)]
+
+  concurrency = max(1, int(args.concurrency))
+  if concurrency == 1:
+    results: Iterable[List[Dict[str, Any]]] = map(run_group, groups)
+    executor = None
+  else:
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    # Executor.map yields in submission order, not completion order.
+    results = executor.map(run_group, groups)
+
+  writer = ProductDetailsWriter(
+    args.out_details,
+    fmt=args.out_format,
+    compress=True if args.out_gzip else None,
+  )
+  observed_costs: List[Dict[str, Any]] = []
+  titles_by_vendor: Dict[int, int] = {}
+
+  def ordered_entries() -> Iterator[Tuple[Job, Dict[str, Any], bool]]:
+    # Fetched results come back in `pending` order; splice the ready ones back into report order.
+    fetched = (
+      pair for group, entries in itertools.chain(done, zip(groups, results)) for pair in zip(group, entries)
+    )
+    for i, job in enumerate(jobs):
+      yield (job, ready[i], False) if i in ready else (*next(fetched), True)
+
+  stored = 0
+  try:
+    for (vendor_entry, _), entry, fresh in ordered_entries():
+      graphql = entry.get("graphql") or {}
+      if "storedAt" not in entry:
+        observed_costs.append((graphql.get("extensions") or {}).get("cost") or {})
+      # Only entries fetched by this run are stored: `fetched_at` is not their fetch time otherwise.
+      if fresh and store is not None and store.put(entry, fetched_at):
+        stored += 1
+        if stored % 100 == 0:
+          store.commit()
+      if ((graphql.get("data") or {}).get("product") or {}).get("title"):
+        titles_by_vendor[id(vendor_entry)] = titles_by_vendor.get(id(vendor_entry), 0) + 1
+      writer.add(vendor_entry, entry)
+      total_products += 1
+  finally:
+    if executor is not None:
+      executor.shutdown(wait=True, cancel_futures=True)
+    close_clients()
+    if checkpoint is not None:
+      checkpoint.close()
+    if store is not None:
+      store.close()
 
   out["fetchedProductCount"] = total_products
+  if store is not None:
+    out["store"]["updated"] = stored
+  if paginator is not None and args.paginate_connections:
+    out["connectionPagination"] = paginator.summary()
+  if cost_plan is not None and "everything" in out:
+    out["everything"]["costPlan"]["observed"] = summarize_observed_costs(observed_costs, cost_plan)
+  if response_cache is not None:
+    set_response_cache(None)
+    out["responseCache"] = response_cache.stats()
 
-  with open(args.out_details, "w", encoding="utf-8") as f:
-    json.dump(out, f, ensure_ascii=False, indent=2)
+  writer.close(out)
+  if checkpoint is not None:
+    checkpoint.close(remove=True)
+    if checkpoint.unfinished:
+      print(
+        f"Note: {checkpoint.unfinished} products stopped mid-pagination; "
+        f"rerun with --resume --checkpoint {checkpoint.path} to complete them."
+      )
+  if metrics is not None:
+    set_request_metrics(None)
+    metrics.close()
+    if args.metrics_out:
+      with open(args.metrics_out, "w", encoding="utf-8") as f:
+        json.dump(metrics.report(total_products), f, ensure_ascii=False, indent=2)
+    if args.metrics_prom:
+      with open(args.metrics_prom, "w", encoding="utf-8") as f:
+        f.write(metrics.prometheus(total_products))
 
   print(f"Picked vendors: {len(picked)}")
   print(f"Fetched products: {total_products}")
   print(f"Wrote schema fields: {args.out_schema}")
-  print(f"Wrote product details: {args.out_details}")
+  print(f"Wrote product details: {args.out_details}" + (f" (manifest: {writer.manifest_path})" if writer.format == "jsonl" else ""))
+  if args.metrics_out or args.metrics_prom:
+    print(f"Wrote run metrics: {', '.join(p for p in (args.metrics_out, args.metrics_prom) if p)}")
 
   for v in out["vendors"]:
-    titles: List[str] = []
-    for p in v.get("products") or []:
-      data = (p.get("graphql") or {}).get("data") or {}
-      prod = data.get("product") or {}
-      t = prod.get("title")
-      if t:
-        titles.append(t)
-    print(f"- {v.get('vendor')}: {len(titles)} titles")
+    print(f"- {v.get('vendor')}: {titles_by_vendor.get(id(v), 0)} titles")
 
   return 0
 
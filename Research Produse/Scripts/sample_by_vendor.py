@@ -1,18 +1,39 @@
 #!/usr/bin/env python3
 import argparse
+import bz2
+import contextlib
+import gzip
+import io
 import json
+import lzma
+import mmap
 import os
+import queue
 import random
 import sys
+import threading
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+
+INDEX_VERSION = 1
+
+COMPRESSION_MAGIC = ((b"\x1f\x8b", "gzip"), (b"BZh", "bz2"), (b"\xfd7zXZ\x00", "xz"))
+
+_DECOMPRESS_THREAD = False
+
+# (vendor product counts, sampled items per vendor, selected vendors or None, products by id, variants by parent id)
+SampleResult = Tuple[
+    Dict[str, int], Dict[str, List[Dict[str, Any]]], Optional[List[str]], Dict[str, Dict[str, Any]], Dict[str, List[Dict[str, Any]]]
+]
 
 
 @dataclass
 class Reservoir:
     seen: int
-    items: List[Dict[str, Any]]  # each item: {"id": str, "product": dict}
+    items: List[Dict[str, Any]]  # each item: {"id": str, "line": int, ...}
 
 
 def normalize_vendor(vendor: Any) -> str:
@@ -24,16 +45,230 @@ def normalize_vendor(vendor: Any) -> str:
     return str(vendor)
 
 
+def detect_compression(head: bytes) -> Optional[str]:
+    for magic, name in COMPRESSION_MAGIC:
+        if head.startswith(magic):
+            return name
+    return None
+
+
+class _Prefixed(io.RawIOBase):
+    """`head` followed by the rest of a non-seekable stream (the magic bytes already read from it)."""
+
+    def __init__(self, head: bytes, rest: BinaryIO):
+        self._head = head
+        self._rest = rest
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b: Any) -> int:
+        if self._head:
+            n = min(len(b), len(self._head))
+            b[:n] = self._head[:n]
+            self._head = self._head[n:]
+            return n
+        return self._rest.readinto(b)
+
+
+class _ThreadedReader(io.RawIOBase):
+    """Reads `source` in a background thread and hands the chunks over through a bounded queue.
+
+    zlib, bz2 and lzma release the GIL while decompressing, so decompression overlaps with parsing.
+    """
+
+    def __init__(self, source: BinaryIO, chunk_size: int = 1 << 20, depth: int = 8):
+        self._source = source
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._chunk = b""
+        self._pos = 0
+        self._eof = False
+        self._thread = threading.Thread(target=self._pump, args=(chunk_size,), daemon=True)
+        self._thread.start()
+
+    def _put(self, item: Any) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False  # the reader was closed
+
+    def _pump(self, chunk_size: int) -> None:
+        try:
+            while True:
+                data = self._source.read(chunk_size)
+                if not self._put(data) or not data:
+                    return
+        except BaseException as e:  # re-raised in the reading thread
+            self._put(e)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b: Any) -> int:
+        while self._pos >= len(self._chunk):
+            if self._eof:
+                return 0
+            item = self._queue.get()
+            if isinstance(item, BaseException):
+                raise item
+            if not item:
+                self._eof = True
+                return 0
+            self._chunk, self._pos = item, 0
+        n = min(len(b), len(self._chunk) - self._pos)
+        b[:n] = self._chunk[self._pos : self._pos + n]
+        self._pos += n
+        return n
+
+    def close(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        super().close()
+
+
+def set_decompress_thread(enabled: bool) -> None:
+    """Decompress compressed input in a background thread (see `open_bulk`)."""
+    global _DECOMPRESS_THREAD
+    _DECOMPRESS_THREAD = enabled
+
+
+def bulk_compression(path: str) -> Optional[str]:
+    """"gzip"/"bz2"/"xz" by magic bytes, "stdin" for "-", None for a plain file."""
+    if path == "-":
+        return "stdin"
+    with open(path, "rb") as f:
+        return detect_compression(f.read(6))
+
+
+@contextlib.contextmanager
+def decompressed(raw: BinaryIO, threaded: bool = False) -> Iterator[BinaryIO]:
+    """`raw` (a file, stdin or an HTTP response) as a binary stream; gzip/bz2/xz input is detected by its
+    magic bytes and decompressed on the fly, in a background thread with `threaded`. `raw` stays open.
+    """
+    with contextlib.ExitStack() as stack:
+        head = b""
+        while len(head) < 6:
+            data = raw.read(6 - len(head))
+            if not data:
+                break
+            head += data
+        if raw.seekable():
+            raw.seek(0)
+            source: BinaryIO = raw
+        else:
+            source = io.BufferedReader(_Prefixed(head, raw))
+        kind = detect_compression(head)
+        if kind == "gzip":
+            stream: BinaryIO = stack.enter_context(gzip.GzipFile(fileobj=source, mode="rb"))
+        elif kind == "bz2":
+            stream = stack.enter_context(bz2.BZ2File(source))
+        elif kind == "xz":
+            stream = stack.enter_context(lzma.LZMAFile(source))
+        else:
+            stream = source
+        if kind and threaded:
+            stream = stack.enter_context(io.BufferedReader(_ThreadedReader(stream), buffer_size=1 << 20))
+        yield stream
+
+
+@contextlib.contextmanager
+def open_bulk(path: str) -> Iterator[BinaryIO]:
+    """Binary stream of a bulk JSONL file ("-" for stdin), see `decompressed` (threaded after
+    `set_decompress_thread(True)`).
+    """
+    with contextlib.ExitStack() as stack:
+        raw = sys.stdin.buffer if path == "-" else stack.enter_context(open(path, "rb"))
+        yield stack.enter_context(decompressed(raw, _DECOMPRESS_THREAD))
+
+
 def iter_jsonl(path: str):
-    with open(path, "r", encoding="utf-8", errors="replace") as f:
-        for line_no, line in enumerate(f, start=1):
-            line = line.strip()
+    with open_bulk(path) as raw:
+        f = io.TextIOWrapper(raw, encoding="utf-8", errors="replace")
+        try:
+            for line_no, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield line_no, json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise RuntimeError(f"Invalid JSON on line {line_no}: {e}") from e
+        finally:
+            f.detach()  # closing the wrapper would close `raw`, i.e. sys.stdin for "-"
+
+
+def _raw_string(line: bytes, key: bytes) -> Optional[str]:
+    """Plain string value of `"key":` in `line`; None when the key is missing, its value is anything else
+    or the line ends inside it (truncated line).
+    """
+    pos = line.find(key)
+    if pos < 0:
+        return None
+    start = pos + len(key)
+    if start < len(line) and line[start] == 32:  # json.dumps' default `": "` separator
+        start += 1
+    if start >= len(line) or line[start] != 34:  # not a string (null, number, ...)
+        return None
+    end = line.find(b'"', start + 1)
+    if end < 0:
+        return None
+    token = line[start + 1 : end]
+    if b"\\" in token:  # escapes: let json.loads handle them
+        return None
+    return token.decode("utf-8", errors="replace")
+
+
+def peek_keys(line: bytes) -> Tuple[Optional[Dict[str, Any]], Optional[Any]]:
+    """Top-level `__parentId` (child rows) or `id`/`vendor` of a bulk JSONL line, read from the raw bytes.
+
+    Returns (keys, row): `keys` holds whichever of those keys the row has (None if the line is not a
+    JSON object); `row` is the decoded line when a full `json.loads` was needed, else None.
+
+    Only byte searches for `"key":` are used; a quoted key followed by ':' cannot occur inside a JSON
+    string (its quotes would be escaped), so a hit is a real key. Child rows are recognised by
+    `__parentId`, which bulk output only puts at the top level. Other rows are read this way only when
+    they are flat (no nested `{`, so every key is top-level) and both `id` and `vendor` are plain
+    strings. Everything else (nested objects, escapes, null/numeric values, rows without those keys)
+    falls back to `json.loads`, and so do lines that do not end in `}` (e.g. the truncated last line of
+    an interrupted download), so they fail as invalid JSON. Other lines that are not decoded are not
+    validated as JSON.
+    """
+    if line[:1] == b"{" and line[-1:] == b"}":
+        if b'"__parentId":' in line:
+            parent = _raw_string(line, b'"__parentId":')
+            if parent is not None:
+                return {"__parentId": parent}, None
+        elif line.find(b"{", 1) < 0:
+            pid = _raw_string(line, b'"id":')
+            vendor = _raw_string(line, b'"vendor":') if pid is not None else None
+            if vendor is not None:
+                return {"id": pid, "vendor": vendor}, None
+    row = json.loads(line.decode("utf-8", errors="replace"))
+    if not isinstance(row, dict):
+        return None, row
+    return {k: row[k] for k in ("__parentId", "id", "vendor") if k in row}, row
+
+
+def iter_jsonl_keys(path: str):
+    """Like `iter_jsonl`, but yields (line_no, raw line, keys, row or None) using `peek_keys`; decode rows with `decode_row`."""
+    with open_bulk(path) as f:
+        for line_no, raw in enumerate(f, start=1):
+            line = raw.strip()
             if not line:
                 continue
             try:
-                yield line_no, json.loads(line)
-            except json.JSONDecodeError as e:
+                keys, row = peek_keys(line)
+            except ValueError as e:
                 raise RuntimeError(f"Invalid JSON on line {line_no}: {e}") from e
+            yield line_no, line, keys, row
+
+
+def decode_row(line: bytes, row: Optional[Any] = None) -> Any:
+    return row if row is not None else json.loads(line.decode("utf-8", errors="replace"))
 
 
 def is_variant(obj: Dict[str, Any]) -> bool:
@@ -45,15 +280,19 @@ def is_product(obj: Dict[str, Any]) -> bool:
     return ("vendor" in obj) and ("id" in obj) and (not is_variant(obj))
 
 
-def reservoir_update(res: Reservoir, item: Dict[str, Any], k: int, rng: random.Random) -> None:
+def reservoir_update(res: Reservoir, item: Dict[str, Any], k: int, rng: random.Random) -> Optional[Dict[str, Any]]:
+    """Offer `item`; returns the item that is not in the reservoir afterwards (evicted or `item` itself), if any."""
     res.seen += 1
     if len(res.items) < k:
         res.items.append(item)
-        return
+        return None
 
     j = rng.randrange(res.seen)
     if j < k:
+        evicted = res.items[j]
         res.items[j] = item
+        return evicted
+    return item
 
 
 def _vendor_bucket(vendor: str) -> str:
@@ -82,55 +321,28 @@ def pick_vendors_alphabet_first(vendors_sorted: List[str], alphabet: str) -> Lis
     return picked
 
 
-def main() -> int:
-    parser = argparse.ArgumentParser(
-        description="Count unique vendors in a Shopify bulk JSONL and sample K random products per vendor (with their variants)."
-    )
-    parser.add_argument("jsonl", help="Path to bulk JSONL (e.g., bulk-products.jsonl)")
-    parser.add_argument("--k", type=int, default=3, help="Products to sample per vendor (default: 3)")
-    parser.add_argument("--seed", type=int, default=None, help="Random seed (optional)")
-    parser.add_argument(
-        "--alphabet-pick",
-        action="store_true",
-        help="Deterministic mode: sort vendors and pick the first vendor for each letter in --alphabet (27 buckets).",
-    )
-    parser.add_argument(
-        "--alphabet",
-        default="ABCDEFGHIJKLMNOPQRSTUVWXYZ#",
-        help="Alphabet buckets used with --alphabet-pick (default: ABCDEFGHIJKLMNOPQRSTUVWXYZ#)",
-    )
-    parser.add_argument(
-        "--out",
-        default="Research Produse/Outputs/vendor_samples_report.json",
-        help="Output JSON report path (default: Research Produse/Outputs/vendor_samples_report.json)",
-    )
-    args = parser.parse_args()
-
-    if args.k <= 0:
-        raise SystemExit("--k must be >= 1")
-
-    seed = args.seed
-    if seed is None:
-        env_seed = os.getenv("SAMPLE_SEED")
-        seed = int(env_seed) if env_seed else None
+def sample_three_pass(path: str, k: int, rng: random.Random, alphabet: Optional[str]) -> SampleResult:
+    """Count vendors, sample, then collect products + variants: three scans of the file.
 
+    Passes 1 and 2 only look at the keys `peek_keys` reads from the raw line; pass 3 decodes just the
+    selected products and their child rows.
+    """
     vendor_product_counts: Dict[str, int] = defaultdict(int)
 
     # Pass 1: count vendors
-    for _line_no, obj in iter_jsonl(args.jsonl):
-        if not isinstance(obj, dict):
+    for _line_no, _line, keys, _row in iter_jsonl_keys(path):
+        if keys is None:
             continue
-        if not is_product(obj):
+        if not is_product(keys):
             continue
-        vendor = normalize_vendor(obj.get("vendor"))
+        vendor = normalize_vendor(keys.get("vendor"))
         vendor_product_counts[vendor] += 1
 
     vendors = sorted(vendor_product_counts.keys())
 
     # Choose which vendors to include
     selected_vendors: Optional[List[str]] = None
-    if args.alphabet_pick:
-        alphabet = (args.alphabet or "").strip() or "ABCDEFGHIJKLMNOPQRSTUVWXYZ#"
+    if alphabet is not None:
         selected_vendors = pick_vendors_alphabet_first(vendors, alphabet)
 
     # Pass 2: collect selected products (either reservoir-sampled per vendor, or deterministic first-K)
@@ -138,29 +350,27 @@ def main() -> int:
     sampled_by_vendor: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
     selected_product_ids = set()
 
-    rng = random.Random(seed)
-
     selected_vendor_set = set(selected_vendors) if selected_vendors is not None else None
 
-    for line_no, obj in iter_jsonl(args.jsonl):
-        if not isinstance(obj, dict):
+    for line_no, _line, keys, _row in iter_jsonl_keys(path):
+        if keys is None:
             continue
-        if not is_product(obj):
+        if not is_product(keys):
             continue
 
-        vendor = normalize_vendor(obj.get("vendor"))
+        vendor = normalize_vendor(keys.get("vendor"))
         if selected_vendor_set is not None and vendor not in selected_vendor_set:
             continue
 
-        pid = obj.get("id")
+        pid = keys.get("id")
         if not pid:
             continue
 
-        if args.alphabet_pick:
+        if alphabet is not None:
             # Deterministic: first K products per vendor in file order.
-            if len(sampled_by_vendor[vendor]) >= args.k:
+            if len(sampled_by_vendor[vendor]) >= k:
                 continue
-            sampled_by_vendor[vendor].append({"id": pid, "product": obj, "line": line_no})
+            sampled_by_vendor[vendor].append({"id": pid, "line": line_no})
             selected_product_ids.add(pid)
         else:
             # Random: reservoir sampling per vendor.
@@ -168,15 +378,16 @@ def main() -> int:
                 reservoirs[vendor] = Reservoir(seen=0, items=[])
             reservoir_update(
                 reservoirs[vendor],
-                {"id": pid, "product": obj, "line": line_no},
-                args.k,
+                {"id": pid, "line": line_no},
+                k,
                 rng,
             )
 
-    if not args.alphabet_pick:
+    if alphabet is None:
         selected_product_ids = set()
         for vendor in vendors:
-            for item in reservoirs.get(vendor, Reservoir(seen=0, items=[])).items:
+            sampled_by_vendor[vendor] = reservoirs.get(vendor, Reservoir(seen=0, items=[])).items
+            for item in sampled_by_vendor[vendor]:
                 if item.get("id"):
                     selected_product_ids.add(item["id"])
 
@@ -184,23 +395,482 @@ def main() -> int:
     products_by_id: Dict[str, Dict[str, Any]] = {}
     variants_by_parent: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
 
-    for _line_no, obj in iter_jsonl(args.jsonl):
-        if not isinstance(obj, dict):
+    for _line_no, line, keys, row in iter_jsonl_keys(path):
+        if keys is None:
             continue
 
-        if is_variant(obj):
-            parent = obj.get("__parentId")
+        if is_variant(keys):
+            parent = keys.get("__parentId")
             if parent in selected_product_ids:
-                variants_by_parent[parent].append(obj)
+                variants_by_parent[parent].append(decode_row(line, row))
+            continue
+
+        pid = keys.get("id")
+        if pid in selected_product_ids and is_product(keys):
+            products_by_id[pid] = decode_row(line, row)
+
+    return vendor_product_counts, sampled_by_vendor, selected_vendors, products_by_id, variants_by_parent
+
+
+def sample_single_pass(path: str, k: int, rng: random.Random, alphabet: Optional[str]) -> SampleResult:
+    """Same result as `sample_three_pass` from one scan of the file.
+
+    Bulk exports write child rows (`__parentId`) after their parent, so a child only has to be matched
+    against the products currently held in a reservoir; a product that is evicted drops its children
+    with it. Products are offered to the reservoirs in file order, so the RNG draws (and the sample for a
+    given seed) are the same as in the three-pass scan.
+
+    With `alphabet`, each bucket keeps its smallest vendor so far plus that vendor's first K products. A
+    vendor can only become the bucket minimum at its first product, so nothing is missed and no
+    vendor pre-scan is needed.
+    """
+    vendor_product_counts: Dict[str, int] = defaultdict(int)
+    reservoirs: Dict[str, Reservoir] = {}
+    bucket_first: Dict[str, Tuple[str, List[Dict[str, Any]]]] = {}
+    held: Dict[str, Dict[str, Any]] = {}  # product id -> sampled item (collects its child rows)
+
+    for line_no, line, keys, row in iter_jsonl_keys(path):
+        if keys is None:
+            continue
+
+        if is_variant(keys):
+            item = held.get(keys.get("__parentId"))
+            if item is not None:
+                item["variants"].append(decode_row(line, row))
+            continue
+
+        if not is_product(keys):
             continue
+        vendor = normalize_vendor(keys.get("vendor"))
+        vendor_product_counts[vendor] += 1
+
+        pid = keys.get("id")
+        if not pid:
+            continue
+        # The product row is decoded only if it is still sampled at the end.
+        item = {"id": pid, "line": line_no, "variants": [], "raw": (line, row)}
+
+        if alphabet is not None:
+            bucket = _vendor_bucket(vendor)
+            if bucket not in alphabet:
+                continue
+            current = bucket_first.get(bucket)
+            if current is None or vendor < current[0]:
+                for old in current[1] if current else []:
+                    held.pop(old["id"], None)
+                current = bucket_first[bucket] = (vendor, [])
+            if current[0] != vendor or len(current[1]) >= k:
+                continue
+            current[1].append(item)
+            held[pid] = item
+        else:
+            if vendor not in reservoirs:
+                reservoirs[vendor] = Reservoir(seen=0, items=[])
+            out = reservoir_update(reservoirs[vendor], item, k, rng)
+            if out is not item:
+                if out is not None:
+                    held.pop(out["id"], None)
+                held[pid] = item
+
+    selected_vendors: Optional[List[str]] = None
+    sampled_by_vendor: Dict[str, List[Dict[str, Any]]] = {}
+    if alphabet is not None:
+        selected_vendors = [bucket_first[b][0] for b in alphabet if b in bucket_first]
+        sampled_by_vendor = {bucket_first[b][0]: bucket_first[b][1] for b in alphabet if b in bucket_first}
+    else:
+        sampled_by_vendor = {vendor: res.items for vendor, res in reservoirs.items()}
+
+    products_by_id: Dict[str, Dict[str, Any]] = {}
+    variants_by_parent: Dict[str, List[Dict[str, Any]]] = {}
+    for items in sampled_by_vendor.values():
+        for item in items:
+            products_by_id[item["id"]] = decode_row(*item.pop("raw"))
+            variants_by_parent[item["id"]] = item.pop("variants")
+    return vendor_product_counts, sampled_by_vendor, selected_vendors, products_by_id, variants_by_parent
+
+
+def default_index_path(path: str) -> str:
+    return path + ".idx.json"
+
+
+def _file_signature(path: str) -> Dict[str, int]:
+    st = os.stat(path)
+    return {"size": st.st_size, "mtimeNs": st.st_mtime_ns}
+
+
+def _scan_range(path: str, begin: int, stop: int) -> Dict[str, Any]:
+    """Index the lines in [begin, stop) of the file; `begin` is at a line start.
+
+    Line numbers are relative to the range. Child rows before the range's first non-child row may
+    belong to a product in an earlier range, so they are returned as `head` and resolved by
+    `_merge_ranges`; so are children that do not follow their parent (`stray`), which need the
+    products of every earlier range.
+    """
+    vendors: Dict[str, int] = {}
+    local_vendors: Dict[str, int] = {}
+    rows: Dict[str, List[Any]] = {"id": [], "vendor": [], "line": [], "offset": [], "length": [], "end": []}
+    head: List[Tuple[str, int, int]] = []
+    stray: List[Tuple[str, int, int]] = []
+    block_row: Optional[int] = None  # row whose child block is still open
+    saw_non_child = False
+
+    offset = begin
+    line_no = 0
+    with open(path, "rb") as f:
+        f.seek(begin)
+        for raw in f:
+            if offset >= stop:
+                break
+            line_no += 1
+            start, offset = offset, offset + len(raw)
+            line = raw.strip()
+            if not line:
+                continue
+            try:
+                keys, _row = peek_keys(line)
+            except ValueError as e:
+                raise RuntimeError(f"Invalid JSON at byte offset {start}: {e}") from e
+            if keys is None:
+                continue
+
+            if is_variant(keys):
+                parent = keys.get("__parentId")
+                if not saw_non_child:
+                    head.append((parent, start, offset))
+                elif block_row is not None and rows["id"][block_row] == parent:
+                    rows["end"][block_row] = offset
+                else:
+                    stray.append((parent, start, offset - start))
+                continue
+
+            saw_non_child = True
+            block_row = None
+            if not is_product(keys):
+                continue
+            vendor = normalize_vendor(keys.get("vendor"))
+            vendors[vendor] = vendors.get(vendor, 0) + 1
+            if vendor not in local_vendors:
+                local_vendors[vendor] = len(local_vendors)
+
+            pid = keys.get("id")
+            if not pid:
+                continue
+            block_row = len(rows["id"])
+            for name, value in (
+                ("id", pid), ("vendor", local_vendors[vendor]), ("line", line_no),
+                ("offset", start), ("length", offset - start), ("end", offset),
+            ):
+                rows[name].append(value)
+
+    return {
+        "lines": line_no,
+        "vendors": vendors,
+        "rowVendors": list(local_vendors),
+        "rows": rows,
+        "head": head,
+        "stray": stray,
+        "sawNonChild": saw_non_child,
+        "tailOpen": block_row is not None,
+    }
+
 
-        pid = obj.get("id")
-        if pid in selected_product_ids and is_product(obj):
-            products_by_id[pid] = obj
+def _merge_ranges(ranges: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Concatenate `_scan_range` results (in file order) into index columns, as one sequential scan would."""
+    vendor_ids: Dict[str, int] = {}
+    vendor_counts: List[int] = []
+    columns: Dict[str, List[Any]] = {"id": [], "vendor": [], "line": [], "offset": [], "length": [], "end": []}
+    stray: Dict[str, List[List[int]]] = defaultdict(list)
+    row_by_id: Dict[str, int] = {}
+    block_row: Optional[int] = None
+    line_base = 0
+
+    for part in ranges:
+        for parent, start, end in part["head"]:
+            if block_row is not None and columns["id"][block_row] == parent:
+                columns["end"][block_row] = end
+            elif parent in row_by_id:
+                stray[parent].append([start, end - start])
+
+        for vendor, count in part["vendors"].items():
+            if vendor not in vendor_ids:
+                vendor_ids[vendor] = len(vendor_counts)
+                vendor_counts.append(0)
+            vendor_counts[vendor_ids[vendor]] += count
+        to_global = [vendor_ids[v] for v in part["rowVendors"]]
+        rows = part["rows"]
+        base = len(columns["id"])
+        for i, pid in enumerate(rows["id"]):
+            row_by_id[pid] = base + i
+        columns["id"].extend(rows["id"])
+        columns["vendor"].extend(to_global[v] for v in rows["vendor"])
+        columns["line"].extend(line_base + n for n in rows["line"])
+        columns["offset"].extend(rows["offset"])
+        columns["length"].extend(rows["length"])
+        columns["end"].extend(rows["end"])
+
+        # A child only counts as stray for a product that came before it.
+        for parent, start, length in part["stray"]:
+            row = row_by_id.get(parent)
+            if row is not None and columns["offset"][row] < start:
+                stray[parent].append([start, length])
+
+        if part["sawNonChild"]:
+            block_row = len(columns["id"]) - 1 if part["tailOpen"] else None
+        line_base += part["lines"]
+
+    return {"vendors": list(vendor_ids), "vendorCounts": vendor_counts, "products": columns, "strayChildren": stray}
+
+
+def split_ranges(path: str, parts: int) -> List[Tuple[int, int]]:
+    """Split the file into up to `parts` byte ranges that start and end on line boundaries."""
+    size = os.path.getsize(path)
+    cuts = [0]
+    with open(path, "rb") as f:
+        for i in range(1, parts):
+            pos = max(cuts[-1], size * i // parts)
+            if pos > 0:
+                f.seek(pos - 1)
+                f.readline()  # finish the line that `pos - 1` is on
+                pos = f.tell()
+            if cuts[-1] < pos < size:
+                cuts.append(pos)
+    cuts.append(size)
+    return list(zip(cuts, cuts[1:]))
+
+
+def build_index(path: str, workers: int = 1) -> Dict[str, Any]:
+    """Scan the bulk JSONL once and record where every product and its child rows live.
+
+    Columns are parallel lists over the sampleable products (those with an id), in file order:
+    `offset`/`length` of the product line and `end` of the child-row block that follows it (children
+    are written right after their parent). Child rows that show up anywhere else are kept per parent
+    under `strayChildren`. `vendors`/`vendorCounts` are in first-seen order and count every product,
+    like pass 1 of the scan.
+
+    With `workers` > 1 the file is split into line-aligned ranges parsed in a process pool; the merged
+    index is the same as the sequential one.
+    """
+    signature = _file_signature(path)
+    if workers > 1:
+        ranges = split_ranges(path, workers * 4)
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            parts = list(ex.map(_scan_range, [path] * len(ranges), [r[0] for r in ranges], [r[1] for r in ranges]))
+    else:
+        parts = [_scan_range(path, 0, signature["size"])]
+    return {"version": INDEX_VERSION, "source": signature, **_merge_ranges(parts)}
+
+
+def load_index(path: str, index_path: str) -> Optional[Dict[str, Any]]:
+    """The sidecar index, or None when it is missing or was built for a different version of the file."""
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if index.get("version") != INDEX_VERSION or index.get("source") != _file_signature(path):
+        return None
+    return index
+
+
+def ensure_index(path: str, index_path: str, rebuild: bool = False, workers: int = 1) -> Dict[str, Any]:
+    index = None if rebuild else load_index(path, index_path)
+    if index is None:
+        print(f"Building index: {index_path}", file=sys.stderr)
+        index = build_index(path, workers=workers)
+        tmp = index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, index_path)
+    return index
+
+
+class IndexedBulkFile:
+    """Random access to products and their child rows through the index and an mmap of the file."""
+
+    def __init__(self, path: str, index: Dict[str, Any]):
+        self.index = index
+        self.products = index["products"]
+        self.row_by_id = {pid: row for row, pid in enumerate(self.products["id"])}
+        self._file = open(path, "rb")
+        # mmap rejects empty files; an empty file has no rows to read anyway.
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if index["source"]["size"] else None
+
+    def close(self) -> None:
+        if self._mm is not None:
+            self._mm.close()
+        self._file.close()
+
+    def __enter__(self) -> "IndexedBulkFile":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def _rows(self, start: int, end: int) -> List[Dict[str, Any]]:
+        out = []
+        for line in self._mm[start:end].split(b"\n"):
+            line = line.strip()
+            if line:
+                out.append(json.loads(line.decode("utf-8", errors="replace")))
+        return out
+
+    def product(self, row: int) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """(product, child rows) for an index row; children are the rows whose `__parentId` is the product."""
+        pid = self.products["id"][row]
+        start, length = self.products["offset"][row], self.products["length"][row]
+        product = self._rows(start, start + length)[0]
+        children = [obj for obj in self._rows(start + length, self.products["end"][row]) if isinstance(obj, dict) and obj.get("__parentId") == pid]
+        for child_start, child_length in self.index["strayChildren"].get(pid, []):
+            children.extend(self._rows(child_start, child_start + child_length))
+        return product, children
+
+    def lookup(self, pid: str) -> Optional[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+        row = self.row_by_id.get(pid)
+        return self.product(row) if row is not None else None
+
+
+def sample_from_index(bulk: IndexedBulkFile, k: int, rng: random.Random, alphabet: Optional[str]) -> SampleResult:
+    """Same result as the scans, without parsing anything but the selected products.
+
+    Reservoir offers are replayed over the index rows in file order, so the RNG draws match the scan.
+    """
+    index = bulk.index
+    vendors_in_file = index["vendors"]
+    vendor_product_counts: Dict[str, int] = defaultdict(int, zip(vendors_in_file, index["vendorCounts"]))
+    columns = bulk.products
+    ids, vendor_col, lines = columns["id"], columns["vendor"], columns["line"]
+
+    selected_vendors: Optional[List[str]] = None
+    sampled_by_vendor: Dict[str, List[Dict[str, Any]]] = {}
+    if alphabet is not None:
+        selected_vendors = pick_vendors_alphabet_first(sorted(vendors_in_file), alphabet)
+        wanted = {vendors_in_file.index(v): v for v in selected_vendors}
+        for v in selected_vendors:
+            sampled_by_vendor[v] = []
+        for row, vi in enumerate(vendor_col):
+            vendor = wanted.get(vi)
+            if vendor is not None and len(sampled_by_vendor[vendor]) < k:
+                sampled_by_vendor[vendor].append({"id": ids[row], "line": lines[row], "row": row})
+    else:
+        reservoirs: Dict[int, Reservoir] = {}
+        for row, vi in enumerate(vendor_col):
+            if vi not in reservoirs:
+                reservoirs[vi] = Reservoir(seen=0, items=[])
+            reservoir_update(reservoirs[vi], {"id": ids[row], "line": lines[row], "row": row}, k, rng)
+        sampled_by_vendor = {vendors_in_file[vi]: res.items for vi, res in reservoirs.items()}
+
+    products_by_id: Dict[str, Dict[str, Any]] = {}
+    variants_by_parent: Dict[str, List[Dict[str, Any]]] = {}
+    for items in sampled_by_vendor.values():
+        for item in items:
+            products_by_id[item["id"]], variants_by_parent[item["id"]] = bulk.product(item.pop("row"))
+    return vendor_product_counts, sampled_by_vendor, selected_vendors, products_by_id, variants_by_parent
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Count unique vendors in a Shopify bulk JSONL and sample K random products per vendor (with their variants)."
+    )
+    parser.add_argument(
+        "jsonl",
+        help="Path to bulk JSONL (e.g., bulk-products.jsonl); gzip/bz2/xz are detected automatically, - reads stdin",
+    )
+    parser.add_argument("--k", type=int, default=3, help="Products to sample per vendor (default: 3)")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed (optional)")
+    parser.add_argument(
+        "--alphabet-pick",
+        action="store_true",
+        help="Deterministic mode: sort vendors and pick the first vendor for each letter in --alphabet (27 buckets).",
+    )
+    parser.add_argument(
+        "--alphabet",
+        default="ABCDEFGHIJKLMNOPQRSTUVWXYZ#",
+        help="Alphabet buckets used with --alphabet-pick (default: ABCDEFGHIJKLMNOPQRSTUVWXYZ#)",
+    )
+    parser.add_argument(
+        "--out",
+        default="Research Produse/Outputs/vendor_samples_report.json",
+        help="Output JSON report path (default: Research Produse/Outputs/vendor_samples_report.json)",
+    )
+    parser.add_argument(
+        "--single-pass",
+        action="store_true",
+        help="Count, sample and collect variants in one scan of the file (same report as the default three passes)",
+    )
+    parser.add_argument(
+        "--index",
+        action="store_true",
+        help="Sample through a byte-offset sidecar index (built on first use, rebuilt when the file changes)",
+    )
+    parser.add_argument("--index-path", default="", help="Sidecar index path (default: <jsonl>.idx.json)")
+    parser.add_argument("--rebuild-index", action="store_true", help="Rebuild the sidecar index even if it is current")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Parse the file in N processes over line-aligned chunks (same report as the sequential scan; default: 1)",
+    )
+    parser.add_argument(
+        "--decompress-thread",
+        action="store_true",
+        help="Decompress gzip/bz2/xz input in a background thread, overlapping with parsing",
+    )
+    parser.add_argument(
+        "--lookup",
+        action="append",
+        default=[],
+        help="Print the product (and its variants) with this id as JSON using the index, then exit (repeatable)",
+    )
+    args = parser.parse_args()
+
+    if args.k <= 0:
+        raise SystemExit("--k must be >= 1")
+
+    seed = args.seed
+    if seed is None:
+        env_seed = os.getenv("SAMPLE_SEED")
+        seed = int(env_seed) if env_seed else None
+
+    set_decompress_thread(args.decompress_thread)
+    compression = bulk_compression(args.jsonl)
+    random_access = args.index or args.lookup or args.rebuild_index or args.workers > 1
+    if compression and random_access:
+        raise SystemExit(f"--index/--lookup/--workers need an uncompressed file, not {compression} input")
+    if compression == "stdin" and not args.single_pass:
+        print("stdin can only be read once: using the single-pass scan", file=sys.stderr)
+        args.single_pass = True
+
+    rng = random.Random(seed)
+    alphabet = ((args.alphabet or "").strip() or "ABCDEFGHIJKLMNOPQRSTUVWXYZ#") if args.alphabet_pick else None
+    if random_access:
+        if args.index or args.lookup or args.rebuild_index:
+            index_path = args.index_path or default_index_path(args.jsonl)
+            index = ensure_index(args.jsonl, index_path, rebuild=args.rebuild_index, workers=args.workers)
+        else:
+            # Parallel scan without a sidecar: build the index in memory and sample from it.
+            index = build_index(args.jsonl, workers=args.workers)
+        with IndexedBulkFile(args.jsonl, index) as bulk:
+            if args.lookup:
+                found = []
+                for pid in args.lookup:
+                    hit = bulk.lookup(pid)
+                    found.append({"productId": pid, "product": hit[0] if hit else None, "variants": hit[1] if hit else []})
+                json.dump({"products": found}, sys.stdout, ensure_ascii=False, indent=2)
+                print()
+                return 0
+            vendor_product_counts, sampled_by_vendor, selected_vendors, products_by_id, variants_by_parent = sample_from_index(
+                bulk, args.k, rng, alphabet
+            )
+    else:
+        sample = sample_single_pass if args.single_pass else sample_three_pass
+        vendor_product_counts, sampled_by_vendor, selected_vendors, products_by_id, variants_by_parent = sample(
+            args.jsonl, args.k, rng, alphabet
+        )
+    vendors = sorted(vendor_product_counts.keys())
 
     # Build output structure
     report: Dict[str, Any] = {
-        "source": os.path.abspath(args.jsonl),
+        "source": os.path.abspath(args.jsonl) if args.jsonl != "-" else "-",
         "seed": seed,
         "k": args.k,
         "vendorCount": len(vendors),
@@ -213,7 +883,7 @@ def main() -> int:
     vendors_to_emit = selected_vendors if selected_vendors is not None else vendors
 
     for vendor in vendors_to_emit:
-        sampled = sampled_by_vendor[vendor] if args.alphabet_pick else reservoirs.get(vendor, Reservoir(seen=0, items=[])).items
+        sampled = sampled_by_vendor.get(vendor, [])
         vendor_entry = {
             "vendor": vendor,
             "productCountInFile": vendor_product_counts[vendor],
@@ -0,0 +1,996 @@
+#!/usr/bin/env python3
+"""Local stand-in for the Shopify Admin GraphQL API, for testing and benchmarking the fetch scripts.
+
+Serves a synthetic catalog (or product payloads recorded by fetch_shopify_products.py) through a small
+GraphQL executor built on the same parser the fetch script uses:
+
+- `product(id:)`, `nodes(ids:)`, `node(id:)`, `products(first/after/query:)` with `id:` and
+  `updated_at:>'...'` search terms; cursor pagination (`first/last/after/before/reverse`) on every
+  connection, with `nodes`, `edges { cursor node }` and `pageInfo`.
+- Introspection (`__schema`, `__type(name:)`, aliased batches) from a built-in Product schema or a
+  recorded `__schema` result (`--schema`).
+- `extensions.cost` with requestedQueryCost (same estimator as the client), actualQueryCost (objects
+  actually returned) and a leaky-bucket `throttleStatus`; THROTTLED / MAX_COST_EXCEEDED errors;
+  spreads of undefined fragments are rejected like Shopify's validation does.
+- Bulk operations: `bulkOperationRunQuery` runs in the background and writes a JSONL result
+  (child rows carry `__parentId`) served from `/bulk/<n>.jsonl`; `node(id:)` reports its status.
+- Simulated latency/jitter and random 502s; request/byte counters at `GET /__stats`.
+
+Example:
+  python3 Research Produse/Scripts/shopify_mock_server.py --port 8765 --products 10000 --latency-ms 20
+  python3 Research Produse/Scripts/fetch_shopify_products.py --endpoint http://127.0.0.1:8765/admin/api/2025-10/graphql.json ...
+"""
+
+import argparse
+import base64
+import gzip
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from fetch_shopify_products import estimate_query_cost, iter_product_details, parse_graphql
+
+
+# --- schema -------------------------------------------------------------------------------------
+
+def _ref(kind: str, name: Optional[str] = None, of_type: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    return {"kind": kind, "name": name, "ofType": of_type}
+
+
+def _nn(t: Dict[str, Any]) -> Dict[str, Any]:
+    return _ref("NON_NULL", None, t)
+
+
+def _list_of(t: Dict[str, Any]) -> Dict[str, Any]:
+    return _ref("LIST", None, t)
+
+
+def _scalar(name: str) -> Dict[str, Any]:
+    return _ref("SCALAR", name)
+
+
+def _obj(name: str) -> Dict[str, Any]:
+    return _ref("OBJECT", name)
+
+
+def _arg(name: str, type_ref: Dict[str, Any], default: Optional[str] = None) -> Dict[str, Any]:
+    return {"name": name, "description": None, "type": type_ref, "defaultValue": default}
+
+
+def _field(name: str, type_ref: Dict[str, Any], args: Iterable[Dict[str, Any]] = ()) -> Dict[str, Any]:
+    return {
+        "name": name,
+        "description": None,
+        "args": list(args),
+        "type": type_ref,
+        "isDeprecated": False,
+        "deprecationReason": None,
+    }
+
+
+def _type(kind: str, name: str, fields: Optional[List[Dict[str, Any]]] = None, **extra: Any) -> Dict[str, Any]:
+    t = {
+        "kind": kind,
+        "name": name,
+        "description": None,
+        "fields": fields,
+        "inputFields": None,
+        "interfaces": [] if kind == "OBJECT" else None,
+        "enumValues": None,
+        "possibleTypes": None,
+    }
+    t.update(extra)
+    return t
+
+
+def _enum(name: str, values: List[str]) -> Dict[str, Any]:
+    return _type(
+        "ENUM",
+        name,
+        None,
+        enumValues=[{"name": v, "description": None, "isDeprecated": False, "deprecationReason": None} for v in values],
+    )
+
+
+CONNECTION_ARGS = [
+    _arg("first", _scalar("Int")),
+    _arg("after", _scalar("String")),
+    _arg("last", _scalar("Int")),
+    _arg("before", _scalar("String")),
+    _arg("reverse", _scalar("Boolean"), "false"),
+]
+
+
+def _connection_types(node: str, node_kind: str = "OBJECT") -> List[Dict[str, Any]]:
+    node_ref = _ref(node_kind, node)
+    return [
+        _type("OBJECT", f"{node}Connection", [
+            _field("nodes", _nn(_list_of(_nn(node_ref)))),
+            _field("edges", _nn(_list_of(_nn(_obj(f"{node}Edge"))))),
+            _field("pageInfo", _nn(_obj("PageInfo"))),
+        ]),
+        _type("OBJECT", f"{node}Edge", [
+            _field("cursor", _nn(_scalar("String"))),
+            _field("node", _nn(node_ref)),
+        ]),
+    ]
+
+
+def _connection_field(name: str, node: str, extra_args: Iterable[Dict[str, Any]] = ()) -> Dict[str, Any]:
+    return _field(name, _nn(_obj(f"{node}Connection")), CONNECTION_ARGS + list(extra_args))
+
+
+def build_schema() -> Dict[str, Any]:
+    """Introspection result (`__schema`) for the subset of the Admin API the mock can execute."""
+    S = _scalar
+    node_iface = _ref("INTERFACE", "Node")
+    media_iface = _ref("INTERFACE", "Media")
+    money = _obj("MoneyV2")
+    image = _obj("Image")
+    types: List[Dict[str, Any]] = [
+        _type("OBJECT", "QueryRoot", [
+            _field("product", _obj("Product"), [_arg("id", _nn(S("ID")))]),
+            _connection_field("products", "Product", [_arg("query", S("String")), _arg("sortKey", _ref("ENUM", "ProductSortKeys"))]),
+            _field("nodes", _nn(_list_of(node_iface)), [_arg("ids", _nn(_list_of(_nn(S("ID")))))]),
+            _field("node", node_iface, [_arg("id", _nn(S("ID")))]),
+        ]),
+        _type("OBJECT", "Mutation", [
+            _field("bulkOperationRunQuery", _obj("BulkOperationRunQueryPayload"), [_arg("query", _nn(S("String")))]),
+        ]),
+        _type("OBJECT", "BulkOperationRunQueryPayload", [
+            _field("bulkOperation", _obj("BulkOperation")),
+            _field("userErrors", _nn(_list_of(_nn(_obj("UserError"))))),
+        ]),
+        _type("OBJECT", "UserError", [_field("field", _list_of(_nn(S("String")))), _field("message", _nn(S("String")))]),
+        _type("OBJECT", "BulkOperation", [
+            _field("id", _nn(S("ID"))),
+            _field("status", _nn(_ref("ENUM", "BulkOperationStatus"))),
+            _field("errorCode", _ref("ENUM", "BulkOperationErrorCode")),
+            _field("objectCount", _nn(S("UnsignedInt64"))),
+            _field("fileSize", S("UnsignedInt64")),
+            _field("url", S("URL")),
+            _field("partialDataUrl", S("URL")),
+            _field("query", _nn(S("String"))),
+            _field("createdAt", _nn(S("DateTime"))),
+            _field("completedAt", S("DateTime")),
+        ], interfaces=[node_iface]),
+        _type("INTERFACE", "Node", [_field("id", _nn(S("ID")))],
+              possibleTypes=[_obj(n) for n in ("Product", "ProductVariant", "Collection", "Metafield", "MediaImage", "BulkOperation")]),
+        _type("INTERFACE", "Media", [_field("alt", S("String")), _field("mediaContentType", _nn(_ref("ENUM", "MediaContentType")))],
+              possibleTypes=[_obj("MediaImage")]),
+        _type("OBJECT", "Product", [
+            _field("id", _nn(S("ID"))),
+            _field("legacyResourceId", _nn(S("UnsignedInt64"))),
+            _field("title", _nn(S("String"))),
+            _field("handle", _nn(S("String"))),
+            _field("status", _nn(_ref("ENUM", "ProductStatus"))),
+            _field("vendor", _nn(S("String"))),
+            _field("productType", _nn(S("String"))),
+            _field("description", _nn(S("String"))),
+            _field("descriptionHtml", _nn(S("HTML"))),
+            _field("createdAt", _nn(S("DateTime"))),
+            _field("updatedAt", _nn(S("DateTime"))),
+            _field("publishedAt", S("DateTime")),
+            _field("templateSuffix", S("String")),
+            _field("tags", _nn(_list_of(_nn(S("String"))))),
+            _field("hasOnlyDefaultVariant", _nn(S("Boolean"))),
+            _field("totalInventory", _nn(S("Int"))),
+            _field("onlineStoreUrl", S("URL")),
+            _field("seo", _nn(_obj("SEO"))),
+            _field("options", _nn(_list_of(_nn(_obj("ProductOption")))), [_arg("first", S("Int"))]),
+            _field("featuredImage", image),
+            _field("priceRangeV2", _nn(_obj("ProductPriceRangeV2"))),
+            _field("compareAtPriceRange", _obj("ProductCompareAtPriceRange")),
+            _connection_field("images", "Image"),
+            _connection_field("media", "Media"),
+            _connection_field("collections", "Collection"),
+            _connection_field("metafields", "Metafield", [_arg("namespace", S("String"))]),
+            _field("metafield", _obj("Metafield"), [_arg("namespace", S("String")), _arg("key", _nn(S("String")))]),
+            _connection_field("variants", "ProductVariant"),
+        ], interfaces=[node_iface]),
+        _type("OBJECT", "SEO", [_field("title", S("String")), _field("description", S("String"))]),
+        _type("OBJECT", "ProductOption", [
+            _field("id", _nn(S("ID"))),
+            _field("name", _nn(S("String"))),
+            _field("values", _nn(_list_of(_nn(S("String"))))),
+        ]),
+        _type("OBJECT", "Image", [
+            _field("id", S("ID")),
+            _field("url", _nn(S("URL"))),
+            _field("altText", S("String")),
+            _field("width", S("Int")),
+            _field("height", S("Int")),
+        ]),
+        _type("OBJECT", "MediaImage", [
+            _field("id", _nn(S("ID"))),
+            _field("alt", S("String")),
+            _field("mediaContentType", _nn(_ref("ENUM", "MediaContentType"))),
+            _field("image", image),
+        ], interfaces=[node_iface, media_iface]),
+        _type("OBJECT", "MoneyV2", [_field("amount", _nn(S("Decimal"))), _field("currencyCode", _nn(_ref("ENUM", "CurrencyCode")))]),
+        _type("OBJECT", "ProductPriceRangeV2", [_field("minVariantPrice", _nn(money)), _field("maxVariantPrice", _nn(money))]),
+        _type("OBJECT", "ProductCompareAtPriceRange", [
+            _field("minVariantCompareAtPrice", _nn(money)),
+            _field("maxVariantCompareAtPrice", _nn(money)),
+        ]),
+        _type("OBJECT", "Collection", [
+            _field("id", _nn(S("ID"))),
+            _field("handle", _nn(S("String"))),
+            _field("title", _nn(S("String"))),
+            _field("updatedAt", _nn(S("DateTime"))),
+        ], interfaces=[node_iface]),
+        _type("OBJECT", "Metafield", [
+            _field("id", _nn(S("ID"))),
+            _field("namespace", _nn(S("String"))),
+            _field("key", _nn(S("String"))),
+            _field("type", _nn(S("String"))),
+            _field("value", _nn(S("String"))),
+            _field("jsonValue", _nn(S("JSON"))),
+            _field("createdAt", _nn(S("DateTime"))),
+            _field("updatedAt", _nn(S("DateTime"))),
+            _field("ownerType", _nn(_ref("ENUM", "MetafieldOwnerType"))),
+            _field("definition", _obj("MetafieldDefinition")),
+        ], interfaces=[node_iface]),
+        _type("OBJECT", "MetafieldDefinition", [
+            _field("id", _nn(S("ID"))),
+            _field("name", _nn(S("String"))),
+            _field("namespace", _nn(S("String"))),
+            _field("key", _nn(S("String"))),
+            _field("type", _nn(_obj("MetafieldDefinitionType"))),
+        ]),
+        _type("OBJECT", "MetafieldDefinitionType", [_field("name", _nn(S("String")))]),
+        _type("OBJECT", "ProductVariant", [
+            _field("id", _nn(S("ID"))),
+            _field("legacyResourceId", _nn(S("UnsignedInt64"))),
+            _field("title", _nn(S("String"))),
+            _field("sku", S("String")),
+            _field("barcode", S("String")),
+            _field("price", _nn(S("Money"))),
+            _field("compareAtPrice", S("Money")),
+            _field("taxable", _nn(S("Boolean"))),
+            _field("inventoryQuantity", S("Int")),
+            _field("availableForSale", _nn(S("Boolean"))),
+            _field("inventoryPolicy", _nn(_ref("ENUM", "ProductVariantInventoryPolicy"))),
+            _field("requiresComponents", _nn(S("Boolean"))),
+            _field("unitPrice", money),
+            _field("unitPriceMeasurement", _obj("UnitPriceMeasurement")),
+            _field("selectedOptions", _nn(_list_of(_nn(_obj("SelectedOption"))))),
+            _field("image", image),
+            _field("inventoryItem", _nn(_obj("InventoryItem"))),
+        ], interfaces=[node_iface]),
+        _type("OBJECT", "UnitPriceMeasurement", [
+            _field("measuredType", _ref("ENUM", "UnitPriceMeasurementMeasuredType")),
+            _field("quantityUnit", _ref("ENUM", "UnitPriceMeasurementMeasuredUnit")),
+            _field("quantityValue", _nn(S("Float"))),
+            _field("referenceUnit", _ref("ENUM", "UnitPriceMeasurementMeasuredUnit")),
+            _field("referenceValue", _nn(S("Int"))),
+        ]),
+        _type("OBJECT", "SelectedOption", [_field("name", _nn(S("String"))), _field("value", _nn(S("String")))]),
+        _type("OBJECT", "InventoryItem", [
+            _field("id", _nn(S("ID"))),
+            _field("tracked", _nn(S("Boolean"))),
+            _field("unitCost", money),
+        ], interfaces=[node_iface]),
+        _type("OBJECT", "PageInfo", [
+            _field("hasNextPage", _nn(S("Boolean"))),
+            _field("hasPreviousPage", _nn(S("Boolean"))),
+            _field("startCursor", S("String")),
+            _field("endCursor", S("String")),
+        ]),
+        _enum("ProductStatus", ["ACTIVE", "ARCHIVED", "DRAFT"]),
+        _enum("ProductSortKeys", ["ID", "TITLE", "UPDATED_AT"]),
+        _enum("MediaContentType", ["EXTERNAL_VIDEO", "IMAGE", "MODEL_3D", "VIDEO"]),
+        _enum("CurrencyCode", ["EUR", "RON", "USD"]),
+        _enum("MetafieldOwnerType", ["PRODUCT", "PRODUCTVARIANT"]),
+        _enum("ProductVariantInventoryPolicy", ["CONTINUE", "DENY"]),
+        _enum("UnitPriceMeasurementMeasuredType", ["AREA", "COUNT", "LENGTH", "VOLUME", "WEIGHT"]),
+        _enum("UnitPriceMeasurementMeasuredUnit", ["CL", "G", "KG", "L", "M", "ML"]),
+        _enum("BulkOperationStatus", ["CANCELED", "CANCELING", "COMPLETED", "CREATED", "EXPIRED", "FAILED", "RUNNING"]),
+        _enum("BulkOperationErrorCode", ["ACCESS_DENIED", "INTERNAL_SERVER_ERROR", "TIMEOUT"]),
+    ]
+    for node, kind in (("Image", "OBJECT"), ("Media", "INTERFACE"), ("Collection", "OBJECT"),
+                       ("Metafield", "OBJECT"), ("ProductVariant", "OBJECT"), ("Product", "OBJECT")):
+        types.extend(_connection_types(node, kind))
+    for name in ("ID", "String", "Int", "Float", "Boolean", "DateTime", "HTML", "URL", "JSON", "Decimal",
+                 "Money", "UnsignedInt64"):
+        types.append(_type("SCALAR", name))
+    return {
+        "queryType": {"name": "QueryRoot"},
+        "mutationType": {"name": "Mutation"},
+        "subscriptionType": None,
+        "types": types,
+        "directives": [],
+    }
+
+
+def load_schema(path: str) -> Dict[str, Any]:
+    """Read a recorded introspection result: `{"data": {"__schema": ...}}`, `{"__schema": ...}` or the schema itself."""
+    with open(path, "r", encoding="utf-8") as f:
+        doc = json.load(f)
+    doc = doc.get("data", doc)
+    return doc.get("__schema", doc)
+
+
+# --- data ---------------------------------------------------------------------------------------
+
+def _encode_cursor(position: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"p": position}).encode("ascii")).decode("ascii")
+
+
+def _decode_cursor(cursor: Any) -> Optional[int]:
+    try:
+        return int(json.loads(base64.urlsafe_b64decode(str(cursor).encode("ascii")))["p"])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+class Connection:
+    """A lazily materialized list behind cursor pagination (cursors are opaque positions)."""
+
+    def __init__(self, total: int, item: Callable[[int], Any]):
+        self.total = total
+        self.item = item
+
+    def window(self, args: Dict[str, Any]) -> Tuple[int, int]:
+        lo, hi = 0, self.total
+        after = _decode_cursor(args.get("after")) if args.get("after") else None
+        before = _decode_cursor(args.get("before")) if args.get("before") else None
+        if after is not None:
+            lo = max(lo, after + 1)
+        if before is not None:
+            hi = min(hi, before)
+        if isinstance(args.get("first"), int):
+            hi = min(hi, lo + max(0, args["first"]))
+        elif isinstance(args.get("last"), int):
+            lo = max(lo, hi - max(0, args["last"]))
+        return lo, max(lo, hi)
+
+    def at(self, position: int, reverse: bool) -> Any:
+        return self.item(self.total - 1 - position if reverse else position)
+
+    def page(self, args: Dict[str, Any]) -> Dict[str, Any]:
+        lo, hi = self.window(args)
+        reverse = bool(args.get("reverse"))
+        items = [self.at(p, reverse) for p in range(lo, hi)]
+        return {
+            "__typename": "Connection",
+            "nodes": items,
+            "edges": [{"__typename": "Edge", "cursor": _encode_cursor(p), "node": it} for p, it in zip(range(lo, hi), items)],
+            "pageInfo": {
+                "__typename": "PageInfo",
+                "hasNextPage": hi < self.total,
+                "hasPreviousPage": lo > 0,
+                "startCursor": _encode_cursor(lo) if items else None,
+                "endCursor": _encode_cursor(hi - 1) if items else None,
+            },
+        }
+
+
+def _gid(kind: str, n: int) -> str:
+    return f"gid://shopify/{kind}/{n}"
+
+
+def _gid_number(gid: Any) -> Optional[int]:
+    m = re.match(r"^gid://shopify/\w+/(\d+)$", str(gid or ""))
+    return int(m.group(1)) if m else None
+
+
+class SyntheticCatalog:
+    """Deterministic products 1..N, generated on demand so 100k-product catalogs cost no memory."""
+
+    BASE_UPDATED_AT = "2025-01-01T00:00:00Z"
+
+    def __init__(
+        self,
+        products: int,
+        variants: int = 3,
+        metafields: int = 5,
+        images: int = 2,
+        collections: int = 2,
+        vendors: int = 0,
+        touch_every: int = 0,
+        description_bytes: int = 300,
+    ):
+        self.count = products
+        self.variants = variants
+        self.metafields = metafields
+        self.images = images
+        self.collections = collections
+        self.vendors = vendors or max(1, products // 3)
+        self.touch_every = touch_every
+        self.description = ("Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * (description_bytes // 56 + 1))[:description_bytes]
+        self.started_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+    def ids(self) -> List[str]:
+        return [_gid("Product", i) for i in range(1, self.count + 1)]
+
+    def updated_at(self, n: int) -> str:
+        return self.started_at if self.touch_every and n % self.touch_every == 0 else self.BASE_UPDATED_AT
+
+    def vendor(self, n: int) -> str:
+        return f"Vendor {(n - 1) // 3 % self.vendors + 1:05d}"
+
+    def product(self, gid: Any) -> Optional[Dict[str, Any]]:
+        n = _gid_number(gid)
+        if n is None or not str(gid).startswith("gid://shopify/Product/") or not 1 <= n <= self.count:
+            return None
+        price = f"{(n % 500) + 9.99:.2f}"
+        money = {"__typename": "MoneyV2", "amount": price, "currencyCode": "RON"}
+        image = self._image(n, 0)
+        return {
+            "__typename": "Product",
+            "id": _gid("Product", n),
+            "legacyResourceId": str(n),
+            "title": f"Product {n}",
+            "handle": f"product-{n}",
+            "status": "ACTIVE",
+            "vendor": self.vendor(n),
+            "productType": f"Type {n % 20}",
+            "description": self.description,
+            "descriptionHtml": f"<p>{self.description}</p>",
+            "createdAt": self.BASE_UPDATED_AT,
+            "updatedAt": self.updated_at(n),
+            "publishedAt": self.BASE_UPDATED_AT,
+            "templateSuffix": None,
+            "tags": [f"tag-{n % 7}", f"tag-{n % 11}"],
+            "hasOnlyDefaultVariant": self.variants <= 1,
+            "totalInventory": n % 100,
+            "onlineStoreUrl": f"https://mock.myshopify.com/products/product-{n}",
+            "seo": {"__typename": "SEO", "title": f"Product {n}", "description": None},
+            "options": [{"__typename": "ProductOption", "id": _gid("ProductOption", n), "name": "Size", "values": ["S", "M", "L"]}],
+            "featuredImage": image if self.images else None,
+            "priceRangeV2": {"__typename": "ProductPriceRangeV2", "minVariantPrice": money, "maxVariantPrice": money},
+            "compareAtPriceRange": None,
+            "images": Connection(self.images, lambda j: self._image(n, j)),
+            "media": Connection(self.images, lambda j: self._media(n, j)),
+            "collections": Connection(self.collections, lambda j: self._collection(n, j)),
+            "metafields": Connection(self.metafields, lambda j: self._metafield(n, j)),
+            "metafield": None,
+            "variants": Connection(self.variants, lambda j: self._variant(n, j, money)),
+        }
+
+    def _image(self, n: int, j: int) -> Dict[str, Any]:
+        return {
+            "__typename": "Image",
+            "id": _gid("ProductImage", n * 100 + j),
+            "url": f"https://cdn.mock.shopify.com/p/{n}/{j}.jpg",
+            "altText": None,
+            "width": 1024,
+            "height": 1024,
+        }
+
+    def _media(self, n: int, j: int) -> Dict[str, Any]:
+        return {
+            "__typename": "MediaImage",
+            "__implements": ("Media", "Node"),
+            "id": _gid("MediaImage", n * 100 + j),
+            "alt": None,
+            "mediaContentType": "IMAGE",
+            "image": self._image(n, j),
+        }
+
+    def _collection(self, n: int, j: int) -> Dict[str, Any]:
+        c = (n + j) % 50 + 1
+        return {"__typename": "Collection", "id": _gid("Collection", c), "handle": f"collection-{c}", "title": f"Collection {c}", "updatedAt": self.BASE_UPDATED_AT}
+
+    def _metafield(self, n: int, j: int) -> Dict[str, Any]:
+        value = f"value {n}-{j}"
+        return {
+            "__typename": "Metafield",
+            "id": _gid("Metafield", n * 1000 + j),
+            "namespace": "custom",
+            "key": f"field_{j}",
+            "type": "single_line_text_field",
+            "value": value,
+            "jsonValue": value,
+            "createdAt": self.BASE_UPDATED_AT,
+            "updatedAt": self.BASE_UPDATED_AT,
+            "ownerType": "PRODUCT",
+            "definition": None,
+        }
+
+    def _variant(self, n: int, j: int, money: Dict[str, Any]) -> Dict[str, Any]:
+        size = ["S", "M", "L", "XL"][j % 4]
+        return {
+            "__typename": "ProductVariant",
+            "id": _gid("ProductVariant", n * 1000 + j),
+            "legacyResourceId": str(n * 1000 + j),
+            "title": size,
+            "sku": f"SKU-{n}-{j}",
+            "barcode": None,
+            "price": money["amount"],
+            "compareAtPrice": None,
+            "taxable": True,
+            "inventoryQuantity": (n + j) % 30,
+            "availableForSale": True,
+            "inventoryPolicy": "DENY",
+            "requiresComponents": False,
+            "unitPrice": None,
+            "unitPriceMeasurement": None,
+            "selectedOptions": [{"__typename": "SelectedOption", "name": "Size", "value": size}],
+            "image": None,
+            "inventoryItem": {"__typename": "InventoryItem", "id": _gid("InventoryItem", n * 1000 + j), "tracked": True, "unitCost": None},
+        }
+
+
+class RecordedCatalog(SyntheticCatalog):
+    """Products replayed from a fetch_shopify_products.py output (JSON or JSONL); connections re-paginate their nodes."""
+
+    def __init__(self, path: str):
+        self._products: Dict[str, Dict[str, Any]] = {}
+        for entry in iter_product_details(path):
+            product = ((entry.get("graphql") or {}).get("data") or {}).get("product")
+            if isinstance(product, dict) and product.get("id"):
+                self._products[product["id"]] = product
+        self.count = len(self._products)
+        self.started_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+    def ids(self) -> List[str]:
+        return list(self._products)
+
+    def product(self, gid: Any) -> Optional[Dict[str, Any]]:
+        recorded = self._products.get(gid)
+        if recorded is None:
+            return None
+        return self._revive(dict(recorded, __typename="Product"))
+
+    def _revive(self, obj: Dict[str, Any]) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        for key, value in obj.items():
+            if isinstance(value, dict) and isinstance(value.get("nodes"), list) and "pageInfo" in value:
+                items = value["nodes"]
+                out[key] = Connection(len(items), lambda j, items=items: items[j])
+            else:
+                out[key] = value
+        return out
+
+
+# --- execution ----------------------------------------------------------------------------------
+
+def _resolve_value(value: Any, variables: Dict[str, Any]) -> Any:
+    if isinstance(value, dict) and "$var" in value:
+        return variables.get(value["$var"])
+    if isinstance(value, list):
+        return [_resolve_value(v, variables) for v in value]
+    if isinstance(value, dict):
+        return {k: _resolve_value(v, variables) for k, v in value.items()}
+    return value
+
+
+def _type_matches(obj: Any, type_condition: Optional[str]) -> bool:
+    if type_condition is None or not isinstance(obj, dict) or "__typename" not in obj:
+        return True
+    return obj["__typename"] == type_condition or type_condition in obj.get("__implements", ())
+
+
+def _merge(into: Dict[str, Any], key: str, value: Any) -> None:
+    if isinstance(into.get(key), dict) and isinstance(value, dict):
+        for k, v in value.items():
+            _merge(into[key], k, v)
+    else:
+        into[key] = value
+
+
+def _undefined_fragments(doc: Dict[str, Any]) -> List[str]:
+    """Names of fragments spread somewhere in the document but never defined (GraphQL validation error)."""
+    missing: List[str] = []
+
+    def walk(sels: List[Dict[str, Any]]) -> None:
+        for sel in sels:
+            if sel.get("kind") == "spread":
+                if sel["name"] not in doc["fragments"] and sel["name"] not in missing:
+                    missing.append(sel["name"])
+            else:
+                walk(sel.get("selections") or [])
+
+    for definition in list(doc["operations"]) + list(doc["fragments"].values()):
+        walk(definition["selections"])
+    return missing
+
+
+class Executor:
+    """Executes parsed operations over plain dicts; `Connection` values paginate, callables take field args."""
+
+    def __init__(self, doc: Dict[str, Any], variables: Dict[str, Any]):
+        self.doc = doc
+        self.variables = variables
+        self.cost = 0
+
+    def selections(self, obj: Dict[str, Any], selections: List[Dict[str, Any]], charge: bool = True) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        for sel in selections:
+            kind = sel.get("kind")
+            if kind == "field":
+                name = sel["name"]
+                if name == "__typename":
+                    out[sel["alias"] or name] = obj.get("__typename")
+                    continue
+                args = {k: _resolve_value(v, self.variables) for k, v in sel["args"].items()}
+                value = obj.get(name)
+                if callable(value) and not isinstance(value, Connection):
+                    value = value(args)
+                free = not charge or name.startswith("__")
+                if isinstance(value, Connection):
+                    value = value.page(args)
+                    if not free:
+                        self.cost += 2
+                _merge(out, sel["alias"] or name, self.complete(value, sel["selections"], not free, connection=True))
+            else:
+                if kind == "spread":
+                    frag = self.doc["fragments"][sel["name"]]  # undefined fragments are rejected before execution
+                    type_condition, sub = frag.get("typeCondition"), frag["selections"]
+                else:
+                    type_condition, sub = sel.get("typeCondition"), sel["selections"]
+                if _type_matches(obj, type_condition):
+                    for k, v in self.selections(obj, sub, charge).items():
+                        _merge(out, k, v)
+        return out
+
+    def complete(self, value: Any, selections: List[Dict[str, Any]], charge: bool, connection: bool = False) -> Any:
+        if value is None or not selections:
+            return value
+        if isinstance(value, list):
+            return [self.complete(v, selections, charge) for v in value]
+        if isinstance(value, dict):
+            if charge and not (connection and value.get("__typename") == "Connection"):
+                self.cost += 1
+            return self.selections(value, selections, charge)
+        return value
+
+
+# --- server -------------------------------------------------------------------------------------
+
+class LeakyBucket:
+    """Shopify-style cost bucket: `maximum` points, refilled at `restore_rate` points/second."""
+
+    def __init__(self, maximum: float, restore_rate: float):
+        self.maximum = float(maximum)
+        self.restore_rate = float(restore_rate)
+        self._available = float(maximum)
+        self._at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._available = min(self.maximum, self._available + (now - self._at) * self.restore_rate)
+        self._at = now
+
+    def take(self, cost: float) -> bool:
+        with self._lock:
+            self._refill()
+            if self._available < cost:
+                return False
+            self._available -= cost
+            return True
+
+    def refund(self, points: float) -> None:
+        with self._lock:
+            self._refill()
+            self._available = min(self.maximum, self._available + points)
+
+    def status(self) -> Dict[str, float]:
+        with self._lock:
+            self._refill()
+            return {"maximumAvailable": self.maximum, "currentlyAvailable": round(self._available, 1), "restoreRate": self.restore_rate}
+
+
+class MockShop:
+    """Shared state behind the HTTP handler: catalog, schema, bucket, bulk operations and counters."""
+
+    def __init__(self, catalog: SyntheticCatalog, schema: Dict[str, Any], bucket: LeakyBucket, opts: argparse.Namespace):
+        self.catalog = catalog
+        self.schema = schema
+        self.types = {t["name"]: t for t in schema.get("types") or []}
+        self.bucket = bucket
+        self.opts = opts
+        self.rng = random.Random(opts.seed)
+        self.bulk_dir = tempfile.mkdtemp(prefix="shopify-mock-bulk-")
+        self.bulk_ops: Dict[str, Dict[str, Any]] = {}
+        self.base_url = ""
+        self.stats: Dict[str, Any] = {"requests": 0, "throttled": 0, "failed": 0, "bytesIn": 0, "bytesOut": 0, "operations": {}}
+        self.lock = threading.Lock()
+
+    def count(self, key: str, amount: int = 1) -> None:
+        with self.lock:
+            self.stats[key] += amount
+
+    # Root fields -----------------------------------------------------------------------------
+
+    def search(self, query: Optional[str]) -> List[str]:
+        ids = self.catalog.ids()
+        if not query:
+            return ids
+        wanted = set(re.findall(r"\bid:(\d+)", query))
+        if wanted:
+            ids = [pid for pid in ids if pid.rsplit("/", 1)[-1] in wanted]
+        since = re.search(r"updated_at:>'?([0-9T:\-Z.]+)'?", query)
+        if since:
+            ids = [pid for pid in ids if ((self.catalog.product(pid) or {}).get("updatedAt") or "") > since.group(1)]
+        return ids
+
+    def node(self, gid: Any) -> Optional[Dict[str, Any]]:
+        if gid in self.bulk_ops:
+            return dict(self.bulk_ops[gid], __implements=("Node",))
+        return self.catalog.product(gid)
+
+    def query_root(self) -> Dict[str, Any]:
+        return {
+            "__typename": "QueryRoot",
+            "product": lambda a: self.catalog.product(a.get("id")),
+            "products": lambda a: self._products_connection(a.get("query")),
+            "nodes": lambda a: [self.node(i) for i in a.get("ids") or []],
+            "node": lambda a: self.node(a.get("id")),
+            "__schema": self.schema,
+            "__type": lambda a: self.types.get(a.get("name")),
+        }
+
+    def _products_connection(self, query: Optional[str]) -> Connection:
+        ids = self.search(query)
+        return Connection(len(ids), lambda j: self.catalog.product(ids[j]))
+
+    def mutation_root(self) -> Dict[str, Any]:
+        return {"__typename": "Mutation", "bulkOperationRunQuery": lambda a: self.start_bulk(a.get("query") or "")}
+
+    # Bulk operations -------------------------------------------------------------------------
+
+    def start_bulk(self, query: str) -> Dict[str, Any]:
+        try:
+            doc = parse_graphql(query)
+        except ValueError as e:
+            return {"bulkOperation": None, "userErrors": [{"field": ["query"], "message": f"Invalid bulk query: {e}"}]}
+        missing = _undefined_fragments(doc)
+        if missing:
+            return {"bulkOperation": None, "userErrors": [{"field": ["query"], "message": f"Invalid bulk query: Fragment {missing[0]} was used, but not defined"}]}
+        with self.lock:
+            n = len(self.bulk_ops) + 1
+        op_id = _gid("BulkOperation", n)
+        op = {
+            "__typename": "BulkOperation",
+            "id": op_id,
+            "status": "RUNNING",
+            "errorCode": None,
+            "objectCount": "0",
+            "fileSize": None,
+            "url": None,
+            "partialDataUrl": None,
+            "query": query,
+            "createdAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "completedAt": None,
+        }
+        self.bulk_ops[op_id] = op
+        threading.Thread(target=self._run_bulk, args=(op, doc, n), daemon=True).start()
+        return {"__typename": "BulkOperationRunQueryPayload", "bulkOperation": op, "userErrors": []}
+
+    def _run_bulk(self, op: Dict[str, Any], doc: Dict[str, Any], n: int) -> None:
+        path = os.path.join(self.bulk_dir, f"{n}.jsonl")
+        objects = 0
+        try:
+            executor = Executor(doc, {})
+            root = self.query_root()
+            with open(path, "w", encoding="utf-8") as out:
+
+                def emit(node: Dict[str, Any], parent: Optional[str]) -> None:
+                    nonlocal objects
+                    row: Dict[str, Any] = {}
+                    children: List[List[Dict[str, Any]]] = []
+                    for key, value in node.items():
+                        if isinstance(value, dict) and isinstance(value.get("edges"), list):
+                            children.append(value["edges"])
+                        else:
+                            row[key] = value
+                    if parent is not None:
+                        row["__parentId"] = parent
+                    out.write(json.dumps(row, ensure_ascii=False, separators=(",", ":")) + "\n")
+                    objects += 1
+                    for edges in children:
+                        for edge in edges:
+                            if isinstance(edge.get("node"), dict):
+                                emit(edge["node"], row.get("id"))
+
+                # Stream the top-level connection one node at a time; nested connections are unbounded.
+                for field in doc["operations"][0]["selections"]:
+                    args = {k: _resolve_value(v, {}) for k, v in field["args"].items()}
+                    conn = root[field["name"]](args) if callable(root.get(field["name"])) else None
+                    if not isinstance(conn, Connection):
+                        continue
+                    edges = next((s for s in field["selections"] if s.get("name") == "edges"), None)
+                    node_sel = next((s for s in (edges or {}).get("selections") or [] if s.get("name") == "node"), None)
+                    if node_sel is None:
+                        continue
+                    for p in range(conn.total):
+                        node = executor.complete(conn.at(p, False), node_sel["selections"], charge=False)
+                        if isinstance(node, dict):
+                            emit(node, None)
+            op.update(status="COMPLETED", objectCount=str(objects), fileSize=str(os.path.getsize(path)),
+                      url=f"{self.base_url}/bulk/{n}.jsonl", completedAt=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
+        except Exception as e:  # surfaced through the operation status, like Shopify's FAILED operations
+            op.update(status="FAILED", errorCode="INTERNAL_SERVER_ERROR", objectCount=str(objects))
+            print(f"bulk operation {op['id']} failed: {e}", file=sys.stderr)
+
+    # GraphQL request -------------------------------------------------------------------------
+
+    def execute(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        query = body.get("query") or ""
+        variables = body.get("variables") or {}
+        try:
+            doc = parse_graphql(query)
+        except ValueError as e:
+            return {"errors": [{"message": f"Parse error: {e}", "extensions": {"code": "PARSE_ERROR"}}]}
+        if not doc["operations"]:
+            return {"errors": [{"message": "No operation", "extensions": {"code": "PARSE_ERROR"}}]}
+        missing = _undefined_fragments(doc)
+        if missing:
+            return {"errors": [
+                {"message": f"Fragment {name} was used, but not defined", "extensions": {"code": "useAndDefineFragment", "fragmentName": name}}
+                for name in missing
+            ]}
+        op = doc["operations"][0]
+        with self.lock:
+            key = op.get("name") or op["type"]
+            self.stats["operations"][key] = self.stats["operations"].get(key, 0) + 1
+
+        merged_vars = {k: v for k, v in op["variables"].items() if v is not None}
+        merged_vars.update(variables)
+        requested = 10.0 if op["type"] == "mutation" else estimate_query_cost(query, merged_vars)
+        if self.opts.max_query_cost and requested > self.opts.max_query_cost:
+            return {
+                "errors": [{
+                    "message": f"Query cost is {requested:.0f}, which exceeds the single query max cost limit ({self.opts.max_query_cost}).",
+                    "extensions": {"code": "MAX_COST_EXCEEDED", "cost": requested, "maxCost": self.opts.max_query_cost},
+                }],
+                "extensions": {"cost": {"requestedQueryCost": requested, "actualQueryCost": None, "throttleStatus": self.bucket.status()}},
+            }
+        if not self.bucket.take(requested):
+            self.count("throttled")
+            return {
+                "errors": [{"message": "Throttled", "extensions": {"code": "THROTTLED", "documentation": "https://shopify.dev/api/usage/rate-limits"}}],
+                "extensions": {"cost": {"requestedQueryCost": requested, "actualQueryCost": None, "throttleStatus": self.bucket.status()}},
+            }
+
+        executor = Executor(doc, merged_vars)
+        root = self.mutation_root() if op["type"] == "mutation" else self.query_root()
+        data = executor.selections(root, op["selections"])
+        actual = min(requested, float(executor.cost)) if op["type"] != "mutation" else requested
+        self.bucket.refund(requested - actual)
+        return {
+            "data": data,
+            "extensions": {"cost": {"requestedQueryCost": requested, "actualQueryCost": actual, "throttleStatus": self.bucket.status()}},
+        }
+
+
+def make_handler(shop: MockShop, token: str) -> type:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args: Any) -> None:
+            return
+
+        def _send(self, status: int, body: bytes, content_type: str = "application/json") -> None:
+            use_gzip = "gzip" in (self.headers.get("Accept-Encoding") or "") and len(body) > 512
+            if use_gzip:
+                body = gzip.compress(body, compresslevel=5)
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            if use_gzip:
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            shop.count("bytesOut", len(body))
+
+        def do_GET(self) -> None:
+            if self.path.startswith("/__stats"):
+                with shop.lock:
+                    snapshot = json.loads(json.dumps(shop.stats))
+                    if "reset" in self.path:
+                        shop.stats.update(requests=0, throttled=0, failed=0, bytesIn=0, bytesOut=0, operations={})
+                self._send(200, json.dumps(snapshot).encode("utf-8"))
+                return
+            m = re.match(r"^/bulk/(\d+)\.jsonl$", self.path)
+            if m and os.path.exists(os.path.join(shop.bulk_dir, f"{m.group(1)}.jsonl")):
+                with open(os.path.join(shop.bulk_dir, f"{m.group(1)}.jsonl"), "rb") as f:
+                    self._send(200, f.read(), "application/jsonl")
+                return
+            self._send(404, b'{"errors":"Not Found"}')
+
+        def do_POST(self) -> None:
+            raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            shop.count("requests")
+            shop.count("bytesIn", len(raw))
+            if not self.path.endswith("/graphql.json"):
+                self._send(404, b'{"errors":"Not Found"}')
+                return
+            sent = self.headers.get("X-Shopify-Access-Token") or ""
+            if not sent or (token and sent != token):
+                self._send(401, b'{"errors":"[API] Invalid API key or access token (unrecognized login or wrong password)"}')
+                return
+            delay = shop.opts.latency_ms + (shop.rng.random() * shop.opts.jitter_ms if shop.opts.jitter_ms else 0)
+            if delay > 0:
+                time.sleep(delay / 1000.0)
+            if shop.opts.fail_rate and shop.rng.random() < shop.opts.fail_rate:
+                shop.count("failed")
+                self._send(502, b'{"errors":"Bad Gateway"}')
+                return
+            try:
+                body = json.loads(raw)
+            except json.JSONDecodeError:
+                self._send(400, b'{"errors":"Invalid JSON"}')
+                return
+            resp = shop.execute(body)
+            self._send(200, json.dumps(resp, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+    return Handler
+
+
+def start_mock_server(shop: MockShop, host: str = "127.0.0.1", port: int = 0, token: str = "") -> Tuple[ThreadingHTTPServer, str]:
+    server = ThreadingHTTPServer((host, port), make_handler(shop, token))
+    server.daemon_threads = True
+    shop.base_url = f"http://{host}:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"{shop.base_url}/admin/api/{shop.opts.api_version}/graphql.json"
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Local stand-in for the Shopify Admin GraphQL API (synthetic or recorded catalog).")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765, help="Port to listen on (0 = any free port; the endpoint is printed).")
+    ap.add_argument("--api-version", default="2025-10", help="API version in the printed endpoint path")
+    ap.add_argument("--token", default="", help="Only accept this X-Shopify-Access-Token (default: any non-empty token)")
+    ap.add_argument("--products", type=int, default=1000, help="Synthetic catalog size (default: 1000)")
+    ap.add_argument("--variants", type=int, default=3, help="Variants per synthetic product (default: 3)")
+    ap.add_argument("--metafields", type=int, default=5, help="Metafields per synthetic product (default: 5)")
+    ap.add_argument("--images", type=int, default=2, help="Images (and media) per synthetic product (default: 2)")
+    ap.add_argument("--collections", type=int, default=2, help="Collections per synthetic product (default: 2)")
+    ap.add_argument("--description-bytes", type=int, default=300, help="Description length per product (default: 300)")
+    ap.add_argument("--touch-every", type=int, default=0, help="Every Nth product reports updatedAt = server start (for --store runs)")
+    ap.add_argument("--recorded", default="", help="Serve products recorded by fetch_shopify_products.py (JSON or JSONL) instead")
+    ap.add_argument("--schema", default="", help="Serve a recorded introspection result instead of the built-in schema")
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="Fixed delay added to every GraphQL request")
+    ap.add_argument("--jitter-ms", type=float, default=0.0, help="Extra uniform random delay, 0..N ms")
+    ap.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 502")
+    ap.add_argument("--bucket-size", type=float, default=2000.0, help="Leaky bucket maximumAvailable (default: 2000)")
+    ap.add_argument("--restore-rate", type=float, default=100.0, help="Leaky bucket restoreRate, points/s (default: 100)")
+    ap.add_argument("--max-query-cost", type=float, default=0.0, help="Reject queries above this requested cost (Shopify: 1000; default: 0 = off)")
+    ap.add_argument("--seed", type=int, default=1, help="Seed for jitter and failure injection")
+    args = ap.parse_args()
+
+    catalog: SyntheticCatalog
+    if args.recorded:
+        catalog = RecordedCatalog(args.recorded)
+    else:
+        catalog = SyntheticCatalog(
+            args.products,
+            variants=args.variants,
+            metafields=args.metafields,
+            images=args.images,
+            collections=args.collections,
+            touch_every=args.touch_every,
+            description_bytes=args.description_bytes,
+        )
+    schema = load_schema(args.schema) if args.schema else build_schema()
+    shop = MockShop(catalog, schema, LeakyBucket(args.bucket_size, args.restore_rate), args)
+    server, endpoint = start_mock_server(shop, args.host, args.port, args.token)
+    print(f"Mock Admin GraphQL endpoint: {endpoint} ({catalog.count} products)", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        raise SystemExit(main())
+    except BrokenPipeError:
+        raise SystemExit(0)